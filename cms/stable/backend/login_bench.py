@@ -0,0 +1,62 @@
+# login_bench.py
+# Logins per second at different scrypt cost settings. Each setting is timed
+# on one thread (logins/sec per core) and through the hashing pool with
+# enough concurrent callers to keep every worker busy.
+#
+#   python login_bench.py --costs 13,14,15,16 --seconds 3
+import sys
+import time
+import argparse
+import threading
+import passwords
+
+def _time_loop(func, seconds):
+    count = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        func()
+        count += 1
+    return count
+
+def bench_single(stored, seconds):
+    start = time.perf_counter()
+    count = _time_loop(lambda: passwords.verify_password('correct horse', stored), seconds)
+    return count / (time.perf_counter() - start)
+
+def bench_pool(stored, seconds, callers):
+    counts = [0] * callers
+
+    def caller(index):
+        counts[index] = _time_loop(
+            lambda: passwords.run_hashing(passwords.verify_password, 'correct horse', stored), seconds
+        )
+
+    threads = [threading.Thread(target=caller, args=(i,)) for i in range(callers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sum(counts) / (time.perf_counter() - start)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark login throughput by scrypt cost")
+    parser.add_argument('--costs', default='13,14,15,16', help="Comma separated log2(n) values")
+    parser.add_argument('--r', type=int, default=passwords.SCRYPT_R)
+    parser.add_argument('--p', type=int, default=passwords.SCRYPT_P)
+    parser.add_argument('--seconds', type=float, default=3.0)
+    args = parser.parse_args(argv)
+
+    workers = passwords.PASSWORD_HASH_WORKERS
+    print(f"scrypt r={args.r} p={args.p}, pool of {workers} workers")
+    print(f"{'n':>8} {'ms/login':>10} {'logins/s/core':>14} {'logins/s pool':>14}")
+    for exponent in (int(part) for part in args.costs.split(',') if part):
+        n = 2 ** exponent
+        stored = passwords.hash_password('correct horse', n=n, r=args.r, p=args.p)
+        single = bench_single(stored, args.seconds)
+        pooled = bench_pool(stored, args.seconds, callers=workers * 2)
+        print(f"{'2^%d' % exponent:>8} {1000 / single:>10.1f} {single:>14.1f} {pooled:>14.1f}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,8 +2,16 @@ from flask import Flask, request, jsonify
 from flask_cors import CORS
 import os
 import jwt
+import time
+import queue
 import datetime
 import sqlite3
+import threading
+from contextlib import contextmanager
+from signing_keys import JWKS_MAX_AGE, sign_token, verify_token_signature, jwks
+from passwords import (
+    HashingBusy, hash_password, verify_password, needs_rehash, dummy_verify, run_hashing
+)
 
 app = Flask(__name__)
 CORS(app)
@@ -27,7 +35,7 @@ def init_db():
     cursor.execute('''
     INSERT OR IGNORE INTO credentials
     (email, password, is_admin) VALUES (?, ?, ?)
-    ''', ('kali@kali.com', 'password123', 1))
+    ''', ('kali@kali.com', hash_password('password123'), 1))
 
     conn.commit()
     conn.close()
@@ -35,8 +43,91 @@ def init_db():
 # Initialize Database
 init_db()
 
-# Secret key for JWT
-app.config['SECRET_KEY'] = 'your_super_secret_key'
+# Pooled auth.db connections, reused across requests instead of opening a
+# new connection per call
+AUTH_DB_POOL_SIZE = int(os.environ.get('AUTH_DB_POOL_SIZE', 8))
+_auth_db_pool = queue.LifoQueue(maxsize=AUTH_DB_POOL_SIZE)
+
+@contextmanager
+def auth_db():
+    try:
+        conn = _auth_db_pool.get_nowait()
+    except queue.Empty:
+        conn = sqlite3.connect('auth.db', check_same_thread=False)
+    try:
+        yield conn
+    finally:
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            _auth_db_pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+# Short-lived caches for validate_token. Verified tokens map to their email
+# (a hit means this exact signed token already passed jwt.decode), and admin
+# existence is cached per email. Entries expire after TOKEN_CACHE_TTL seconds,
+# never outlive the token itself, and are dropped when credentials change.
+TOKEN_CACHE_TTL = int(os.environ.get('TOKEN_CACHE_TTL', 30))
+TOKEN_CACHE_MAX = int(os.environ.get('TOKEN_CACHE_MAX', 10000))
+_token_cache = {}
+_admin_cache = {}
+_cache_lock = threading.Lock()
+
+def _cache_put(cache, key, value, expires_at):
+    with _cache_lock:
+        if len(cache) >= TOKEN_CACHE_MAX:
+            now = time.time()
+            for stale in [k for k, (_, expiry) in cache.items() if expiry <= now]:
+                del cache[stale]
+            if len(cache) >= TOKEN_CACHE_MAX:
+                cache.clear()
+        cache[key] = (value, expires_at)
+
+def _cache_get(cache, key):
+    entry = cache.get(key)
+    if entry is None or entry[1] <= time.time():
+        return None
+    return entry[0]
+
+def verify_token(token):
+    # Returns the token's email; raises jwt.InvalidTokenError subclasses
+    email = _cache_get(_token_cache, token)
+    if email is not None:
+        return email
+
+    decoded = verify_token_signature(token)
+    email = decoded.get('email')
+    now = time.time()
+    _cache_put(_token_cache, token, email, min(now + TOKEN_CACHE_TTL, decoded.get('exp', now)))
+    return email
+
+def admin_exists(email):
+    cached = _cache_get(_admin_cache, email)
+    if cached is not None:
+        return cached
+
+    with auth_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+        SELECT 1 FROM credentials
+        WHERE email = ? AND is_admin = 1
+        ''', (email,))
+        exists = cursor.fetchone() is not None
+
+    _cache_put(_admin_cache, email, exists, time.time() + TOKEN_CACHE_TTL)
+    return exists
+
+def invalidate_credentials(email=None):
+    # Call whenever credentials change so cached validations are not reused
+    with _cache_lock:
+        if email is None:
+            _admin_cache.clear()
+            _token_cache.clear()
+        else:
+            _admin_cache.pop(email, None)
+            for token in [t for t, (cached_email, _) in _token_cache.items() if cached_email == email]:
+                del _token_cache[token]
 
 @app.route('/api/login', methods=['POST'])
 def login():
@@ -44,25 +135,44 @@ def login():
     email = data.get('email', '').strip().lower()
     password = data.get('password', '').strip()
 
-    # Database Connection
-    conn = sqlite3.connect('auth.db')
-    cursor = conn.cursor()
+    # Look up the stored hash, then verify it in the hashing pool
+    with auth_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+        SELECT password FROM credentials
+        WHERE email = ? AND is_admin = 1
+        ''', (email,))
 
-    # Check Credentials
-    cursor.execute('''
-    SELECT * FROM credentials
-    WHERE email = ? AND password = ? AND is_admin = 1
-    ''', (email, password))
+        row = cursor.fetchone()
 
-    user = cursor.fetchone()
-    conn.close()
+    try:
+        if row:
+            user = run_hashing(verify_password, password, row[0])
+        else:
+            user = run_hashing(dummy_verify, password)
+
+        # Upgrade plaintext or outdated hashes while the password is known
+        new_hash = run_hashing(hash_password, password) if user and needs_rehash(row[0]) else None
+    except HashingBusy:
+        return jsonify({
+            'success': False,
+            'message': 'Too many login attempts, try again shortly'
+        }), 503, {'Retry-After': '1'}
+
+    if new_hash:
+        with auth_db() as conn:
+            conn.execute('''
+            UPDATE credentials SET password = ?
+            WHERE email = ? AND password = ?
+            ''', (new_hash, email, row[0]))
+            conn.commit()
 
     if user:
         # Create JWT token
-        token = jwt.encode({
+        token = sign_token({
             'email': email,
             'exp': datetime.datetime.utcnow() + datetime.timedelta(hours=24)
-        }, app.config['SECRET_KEY'], algorithm='HS256')
+        })
 
         return jsonify({
             'success': True,
@@ -75,27 +185,23 @@ def login():
             'message': 'Invalid Credentials'
         }), 401
 
+# Public keys for verifying tokens locally (signing_keys.py)
+@app.route('/.well-known/jwks.json', methods=['GET'])
+def jwks_document():
+    response = jsonify(jwks())
+    response.headers['Cache-Control'] = f'public, max-age={JWKS_MAX_AGE}'
+    return response
+
 @app.route('/api/validate-token', methods=['POST'])
 def validate_token():
     token = request.json.get('token')
 
     try:
-        # Decode the token
-        decoded = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
-
-        # Optional: Additional DB validation
-        conn = sqlite3.connect('auth.db')
-        cursor = conn.cursor()
-
-        cursor.execute('''
-        SELECT * FROM credentials
-        WHERE email = ? AND is_admin = 1
-        ''', (decoded.get('email'),))
-
-        user = cursor.fetchone()
-        conn.close()
+        # Decode the token (cached after the first successful check)
+        email = verify_token(token)
 
-        if not user:
+        # Confirm the admin still exists
+        if not admin_exists(email):
             return jsonify({
                 'valid': False,
                 'message': 'User not found'
@@ -103,7 +209,7 @@ def validate_token():
 
         return jsonify({
             'valid': True,
-            'email': decoded.get('email')
+            'email': email
         }), 200
 
     except jwt.ExpiredSignatureError:
@@ -124,25 +230,30 @@ def add_admin():
     email = data.get('email')
     password = data.get('password')
 
-    conn = sqlite3.connect('auth.db')
-    cursor = conn.cursor()
-
     try:
-        cursor.execute('''
-        INSERT INTO credentials
-        (email, password, is_admin) VALUES (?, ?, ?)
-        ''', (email, password, 1))
+        password_hash = run_hashing(hash_password, password)
+    except HashingBusy:
+        return jsonify({
+            'success': False,
+            'message': 'Server busy, try again shortly'
+        }), 503, {'Retry-After': '1'}
 
-        conn.commit()
-        conn.close()
+    try:
+        with auth_db() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+            INSERT INTO credentials
+            (email, password, is_admin) VALUES (?, ?, ?)
+            ''', (email, password_hash, 1))
+            conn.commit()
 
+        invalidate_credentials(email)
         return jsonify({
             'success': True,
             'message': 'Admin added successfully'
         }), 201
 
     except sqlite3.IntegrityError:
-        conn.close()
         return jsonify({
             'success': False,
             'message': 'Email already exists'
@@ -0,0 +1,88 @@
+# passwords.py
+# scrypt password hashing (hashlib, no extra dependency). Stored hashes look
+# like scrypt$<n>$<r>$<p>$<salt>$<hash> so the cost parameters travel with
+# each row and can be raised later: needs_rehash() tells login to re-hash
+# with the current settings once the password has been verified.
+#
+# Hashing runs in a bounded thread pool (OpenSSL's scrypt releases the GIL),
+# so a burst of logins occupies at most PASSWORD_HASH_WORKERS cores and
+# request threads handling validate-token are never stuck behind them.
+import os
+import hmac
+import base64
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+SCRYPT_N = int(os.environ.get('SCRYPT_N', 2 ** 14))
+SCRYPT_R = int(os.environ.get('SCRYPT_R', 8))
+SCRYPT_P = int(os.environ.get('SCRYPT_P', 1))
+SALT_BYTES = 16
+KEY_BYTES = 32
+
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', max(1, (os.cpu_count() or 2) // 2)))
+# Logins allowed to wait for a hashing worker before new ones are turned away
+PASSWORD_HASH_QUEUE = int(os.environ.get('PASSWORD_HASH_QUEUE', PASSWORD_HASH_WORKERS * 8))
+
+PREFIX = 'scrypt'
+
+class HashingBusy(Exception):
+    pass
+
+def _b64(data):
+    return base64.b64encode(data).decode('ascii')
+
+def _derive(password, salt, n, r, p):
+    # maxmem has to cover 128 * n * r bytes plus some headroom
+    return hashlib.scrypt(
+        password.encode('utf-8'), salt=salt, n=n, r=r, p=p,
+        maxmem=256 * n * r + 1024 * 1024, dklen=KEY_BYTES
+    )
+
+def _parse(stored):
+    parts = stored.split('$')
+    if len(parts) != 6 or parts[0] != PREFIX:
+        return None
+    try:
+        n, r, p = int(parts[1]), int(parts[2]), int(parts[3])
+        return n, r, p, base64.b64decode(parts[4]), base64.b64decode(parts[5])
+    except ValueError:
+        return None
+
+def hash_password(password, n=None, r=None, p=None):
+    n, r, p = n or SCRYPT_N, r or SCRYPT_R, p or SCRYPT_P
+    salt = os.urandom(SALT_BYTES)
+    return f'{PREFIX}${n}${r}${p}${_b64(salt)}${_b64(_derive(password, salt, n, r, p))}'
+
+def verify_password(password, stored):
+    parsed = _parse(stored)
+    if parsed is None:
+        # Legacy plaintext row; login re-hashes it straight away
+        return hmac.compare_digest(password.encode('utf-8'), stored.encode('utf-8'))
+    n, r, p, salt, expected = parsed
+    return hmac.compare_digest(_derive(password, salt, n, r, p), expected)
+
+def needs_rehash(stored):
+    parsed = _parse(stored)
+    return parsed is None or parsed[:3] != (SCRYPT_N, SCRYPT_R, SCRYPT_P)
+
+# Verified against when the email is unknown so response time does not
+# reveal which accounts exist
+_DUMMY_HASH = hash_password('not-a-real-password')
+
+def dummy_verify(password):
+    verify_password(password, _DUMMY_HASH)
+    return False
+
+_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix='password-hash')
+_slots = threading.BoundedSemaphore(PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE)
+
+def run_hashing(func, *args):
+    # Runs func in the hashing pool and waits for it; raises HashingBusy when
+    # the pool and its queue are full instead of piling up request threads
+    if not _slots.acquire(blocking=False):
+        raise HashingBusy()
+    try:
+        return _executor.submit(func, *args).result()
+    finally:
+        _slots.release()
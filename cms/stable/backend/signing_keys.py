@@ -0,0 +1,89 @@
+# signing_keys.py
+# Ed25519 key used to sign access tokens (EdDSA JWTs). Services that accept
+# those tokens verify them locally against the public half, published as a
+# JWKS document at /.well-known/jwks.json, so they never call back into this
+# service per request.
+#
+# The private key is read from JWT_PRIVATE_KEY_PATH (PEM, generated on first
+# start). To rotate, move the old PEM to a path listed in
+# JWT_RETIRED_KEY_PATHS and restart: tokens signed by it keep verifying
+# until they expire, while new ones use the fresh key.
+import os
+import json
+import base64
+import hashlib
+import tempfile
+import jwt
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+from jwt.algorithms import OKPAlgorithm
+
+JWT_ALGORITHM = 'EdDSA'
+JWT_PRIVATE_KEY_PATH = os.environ.get('JWT_PRIVATE_KEY_PATH', 'jwt_signing_key.pem')
+JWT_RETIRED_KEY_PATHS = [path for path in os.environ.get('JWT_RETIRED_KEY_PATHS', '').split(',') if path]
+JWKS_MAX_AGE = int(os.environ.get('JWKS_MAX_AGE', 300))
+
+def _create_private_key(path):
+    # Written to a temporary file and then linked into place, so the key file
+    # is complete whenever it exists. When several workers start at once only
+    # one link succeeds; the others get None and load the winner's key.
+    key = Ed25519PrivateKey.generate()
+    pem = key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption()
+    )
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(pem)
+        os.link(temp_path, path)
+    except FileExistsError:
+        return None
+    finally:
+        os.remove(temp_path)
+    return key
+
+def _load_private_key(path, create=False):
+    if not os.path.exists(path):
+        if not create:
+            raise FileNotFoundError(path)
+        key = _create_private_key(path)
+        if key is not None:
+            return key
+
+    with open(path, 'rb') as f:
+        return serialization.load_pem_private_key(f.read(), password=None)
+
+def _public_jwk(private_key):
+    jwk = OKPAlgorithm.to_jwk(private_key.public_key(), as_dict=True)
+    # RFC 7638 thumbprint of the required members doubles as the key id
+    thumbprint_input = json.dumps({k: jwk[k] for k in ('crv', 'kty', 'x')}, separators=(',', ':'), sort_keys=True)
+    kid = base64.urlsafe_b64encode(hashlib.sha256(thumbprint_input.encode()).digest()).rstrip(b'=').decode()
+    jwk.update({'kid': kid, 'use': 'sig', 'alg': JWT_ALGORITHM})
+    return jwk
+
+signing_key = _load_private_key(JWT_PRIVATE_KEY_PATH, create=True)
+signing_jwk = _public_jwk(signing_key)
+verification_keys = {signing_jwk['kid']: signing_key.public_key()}
+
+_published = [signing_jwk]
+for _path in JWT_RETIRED_KEY_PATHS:
+    _retired = _load_private_key(_path)
+    _jwk = _public_jwk(_retired)
+    verification_keys[_jwk['kid']] = _retired.public_key()
+    _published.append(_jwk)
+
+def sign_token(claims):
+    return jwt.encode(claims, signing_key, algorithm=JWT_ALGORITHM, headers={'kid': signing_jwk['kid']})
+
+def jwks():
+    return {'keys': list(_published)}
+
+def verify_token_signature(token):
+    # Raises jwt.InvalidTokenError subclasses for unknown keys or bad tokens
+    kid = jwt.get_unverified_header(token).get('kid')
+    key = verification_keys.get(kid)
+    if key is None:
+        raise jwt.InvalidTokenError(f"Unknown signing key {kid!r}")
+    return jwt.decode(token, key, algorithms=[JWT_ALGORITHM])
@@ -0,0 +1,41 @@
+# tests/conftest.py
+# main.py opens auth.db relative to the working directory and signing_keys.py
+# creates its key at import, so both are pointed at a scratch directory
+# before the service is imported. scrypt runs at a low cost to keep logins fast.
+import os
+import sys
+import shutil
+import tempfile
+
+import pytest
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVICE_DIR)
+
+SCRATCH = tempfile.mkdtemp(prefix='cms-tests-')
+os.environ.update({
+    'JWT_PRIVATE_KEY_PATH': os.path.join(SCRATCH, 'signing_key.pem'),
+    'SCRYPT_N': '1024',
+})
+os.chdir(SCRATCH)
+
+ADMIN_EMAIL = 'kali@kali.com'
+ADMIN_PASSWORD = 'password123'
+
+@pytest.fixture(scope='session')
+def service():
+    import main
+    main.app.testing = True
+    yield main
+    shutil.rmtree(SCRATCH, ignore_errors=True)
+
+@pytest.fixture
+def client(service):
+    service.invalidate_credentials()
+    return service.app.test_client()
+
+@pytest.fixture
+def login(client):
+    def login(email=ADMIN_EMAIL, password=ADMIN_PASSWORD):
+        return client.post('/api/login', json={'email': email, 'password': password})
+    return login
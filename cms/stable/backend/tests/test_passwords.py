@@ -0,0 +1,74 @@
+# tests/test_passwords.py
+import sqlite3
+import threading
+import pytest
+import passwords
+from conftest import ADMIN_EMAIL, ADMIN_PASSWORD
+
+def _stored(email=ADMIN_EMAIL):
+    with sqlite3.connect('auth.db') as conn:
+        return conn.execute("SELECT password FROM credentials WHERE email = ?", (email,)).fetchone()[0]
+
+def _set_stored(value, email=ADMIN_EMAIL):
+    with sqlite3.connect('auth.db') as conn:
+        conn.execute("UPDATE credentials SET password = ? WHERE email = ?", (value, email))
+
+def test_hashes_carry_their_parameters():
+    stored = passwords.hash_password('secret', n=1024, r=8, p=1)
+    assert stored.startswith('scrypt$1024$8$1$')
+    assert passwords.verify_password('secret', stored)
+    assert not passwords.verify_password('Secret', stored)
+    assert stored != passwords.hash_password('secret', n=1024, r=8, p=1)
+
+def test_needs_rehash_follows_the_current_settings(monkeypatch):
+    stored = passwords.hash_password('secret')
+    assert not passwords.needs_rehash(stored)
+    assert passwords.needs_rehash('plaintext')
+    monkeypatch.setattr(passwords, 'SCRYPT_N', passwords.SCRYPT_N * 2)
+    assert passwords.needs_rehash(stored)
+    # Old rows keep verifying with the parameters stored beside them
+    assert passwords.verify_password('secret', stored)
+
+def test_login_upgrades_a_plaintext_password(login):
+    _set_stored(ADMIN_PASSWORD)
+    assert login().status_code == 200
+    stored = _stored()
+    assert stored.startswith(f'scrypt${passwords.SCRYPT_N}$')
+    assert passwords.verify_password(ADMIN_PASSWORD, stored)
+    assert login().status_code == 200
+
+def test_login_rehashes_when_the_cost_is_raised(login, monkeypatch):
+    _set_stored(passwords.hash_password(ADMIN_PASSWORD))
+    before = _stored()
+    assert login().status_code == 200
+    assert _stored() == before
+
+    monkeypatch.setattr(passwords, 'SCRYPT_N', passwords.SCRYPT_N * 2)
+    assert login().status_code == 200
+    after = _stored()
+    assert after.startswith(f'scrypt${passwords.SCRYPT_N}$')
+    assert not passwords.needs_rehash(after)
+
+def test_a_wrong_password_changes_nothing(login):
+    _set_stored(ADMIN_PASSWORD)
+    response = login(password='wrong')
+    assert response.status_code == 401
+    assert _stored() == ADMIN_PASSWORD
+    assert login(email='nobody@example.com').status_code == 401
+
+def test_full_hashing_pool_turns_logins_away(service, login, monkeypatch):
+    def busy(*args):
+        raise passwords.HashingBusy()
+
+    monkeypatch.setattr(service, 'run_hashing', busy)
+    response = login()
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+
+def test_run_hashing_refuses_when_every_slot_is_taken(monkeypatch):
+    monkeypatch.setattr(passwords, '_slots', threading.BoundedSemaphore(1))
+    passwords._slots.acquire()
+    with pytest.raises(passwords.HashingBusy):
+        passwords.run_hashing(passwords.hash_password, 'secret')
+    passwords._slots.release()
+    assert passwords.run_hashing(len, 'four') == 4
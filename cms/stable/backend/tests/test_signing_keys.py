@@ -0,0 +1,70 @@
+# tests/test_signing_keys.py
+import os
+import stat
+import threading
+import jwt
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+import signing_keys
+
+def _public_bytes(key):
+    return key.public_key().public_bytes(serialization.Encoding.Raw, serialization.PublicFormat.Raw)
+
+def test_first_start_creates_a_private_key_file(tmp_path):
+    path = str(tmp_path / 'key.pem')
+    key = signing_keys._load_private_key(path, create=True)
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+    assert _public_bytes(signing_keys._load_private_key(path)) == _public_bytes(key)
+    assert os.listdir(tmp_path) == ['key.pem']
+
+def test_missing_retired_keys_are_an_error(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        signing_keys._load_private_key(str(tmp_path / 'retired.pem'))
+
+def test_concurrent_first_starts_agree_on_one_key(tmp_path):
+    path = str(tmp_path / 'key.pem')
+    barrier = threading.Barrier(8)
+    keys = []
+
+    def start():
+        barrier.wait()
+        keys.append(_public_bytes(signing_keys._load_private_key(path, create=True)))
+
+    threads = [threading.Thread(target=start) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(keys) == 8
+    assert set(keys) == {_public_bytes(signing_keys._load_private_key(path))}
+    assert os.listdir(tmp_path) == ['key.pem']
+
+def test_losing_the_race_loads_the_winners_key(tmp_path, monkeypatch):
+    path = str(tmp_path / 'key.pem')
+    winner = signing_keys._load_private_key(path, create=True)
+    # Both workers saw no key file; this one links second
+    monkeypatch.setattr(os.path, 'exists', lambda p: False if p == path else os.path.lexists(p))
+    loser = signing_keys._load_private_key(path, create=True)
+    assert _public_bytes(loser) == _public_bytes(winner)
+    assert os.listdir(tmp_path) == ['key.pem']
+
+def test_tokens_verify_against_the_published_key_set(client):
+    token = signing_keys.sign_token({'email': 'kali@kali.com'})
+    assert jwt.get_unverified_header(token)['kid'] == signing_keys.signing_jwk['kid']
+
+    response = client.get('/.well-known/jwks.json')
+    assert response.headers['Cache-Control'] == f'public, max-age={signing_keys.JWKS_MAX_AGE}'
+    jwk = jwt.PyJWKSet.from_dict(response.json)[signing_keys.signing_jwk['kid']]
+    assert jwt.decode(token, jwk.key, algorithms=['EdDSA'])['email'] == 'kali@kali.com'
+    assert 'd' not in response.json['keys'][0]
+
+def test_tokens_from_unknown_keys_are_rejected():
+    other = Ed25519PrivateKey.generate()
+    forged = jwt.encode({'email': 'kali@kali.com'}, other, algorithm='EdDSA',
+                        headers={'kid': signing_keys.signing_jwk['kid']})
+    with pytest.raises(jwt.InvalidSignatureError):
+        signing_keys.verify_token_signature(forged)
+    unknown = jwt.encode({'email': 'kali@kali.com'}, other, algorithm='EdDSA', headers={'kid': 'other'})
+    with pytest.raises(jwt.InvalidTokenError):
+        signing_keys.verify_token_signature(unknown)
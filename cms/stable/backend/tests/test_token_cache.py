@@ -0,0 +1,92 @@
+# tests/test_token_cache.py
+import time
+import pytest
+import signing_keys
+
+@pytest.fixture
+def decodes(service, monkeypatch):
+    calls = []
+
+    def verify_token_signature(token):
+        calls.append(token)
+        return signing_keys.verify_token_signature(token)
+
+    monkeypatch.setattr(service, 'verify_token_signature', verify_token_signature)
+    return calls
+
+@pytest.fixture
+def lookups(service, monkeypatch):
+    calls = []
+    auth_db = service.auth_db
+
+    def counting_auth_db():
+        calls.append(1)
+        return auth_db()
+
+    monkeypatch.setattr(service, 'auth_db', counting_auth_db)
+    return calls
+
+def _validate(client, token):
+    return client.post('/api/validate-token', json={'token': token})
+
+def test_repeated_validation_skips_decode_and_lookup(client, login, decodes, lookups):
+    token = login().json['token']
+    lookups.clear()
+    for _ in range(3):
+        response = _validate(client, token)
+        assert response.status_code == 200
+        assert response.json == {'valid': True, 'email': 'kali@kali.com'}
+    assert decodes == [token]
+    assert len(lookups) == 1
+
+def test_cached_entries_never_outlive_the_token(service, client, decodes):
+    expires = int(time.time()) + 5
+    token = signing_keys.sign_token({'email': 'kali@kali.com', 'exp': expires})
+    assert _validate(client, token).status_code == 200
+    assert service._token_cache[token][1] <= expires
+
+def test_expired_entries_are_decoded_again(service, client, decodes, monkeypatch):
+    token = signing_keys.sign_token({'email': 'kali@kali.com', 'exp': int(time.time()) + 60})
+    _validate(client, token)
+    now = time.time()
+    monkeypatch.setattr(time, 'time', lambda: now + service.TOKEN_CACHE_TTL + 1)
+    assert _validate(client, token).status_code == 200
+    assert decodes == [token, token]
+
+def test_invalid_and_expired_tokens_are_not_cached(service, client, decodes):
+    expired = signing_keys.sign_token({'email': 'kali@kali.com', 'exp': int(time.time()) - 10})
+    response = _validate(client, expired)
+    assert response.status_code == 401
+    assert response.json['message'] == 'Token has expired'
+    assert _validate(client, 'not.a.token').json['message'] == 'Invalid token'
+    assert expired not in service._token_cache
+    assert _validate(client, expired).status_code == 401
+    assert decodes.count(expired) == 2
+
+def test_adding_an_admin_drops_the_cached_lookup(client):
+    email = f'new-{time.monotonic_ns()}@example.com'
+    token = signing_keys.sign_token({'email': email, 'exp': int(time.time()) + 60})
+    assert _validate(client, token).json['message'] == 'User not found'
+
+    response = client.post('/api/add-admin', json={'email': email, 'password': 'secret'})
+    assert response.status_code == 201
+    assert _validate(client, token).status_code == 200
+
+def test_cache_is_bounded(service, monkeypatch):
+    monkeypatch.setattr(service, 'TOKEN_CACHE_MAX', 2)
+    cache = {}
+    now = time.time()
+    service._cache_put(cache, 'stale', 'a', now - 1)
+    service._cache_put(cache, 'fresh', 'b', now + 60)
+    service._cache_put(cache, 'newest', 'c', now + 60)
+    assert set(cache) == {'fresh', 'newest'}
+    service._cache_put(cache, 'overflow', 'd', now + 60)
+    assert set(cache) == {'overflow'}
+
+def test_connections_are_reused(service):
+    with service.auth_db() as first:
+        pass
+    with service.auth_db() as second:
+        with service.auth_db() as nested:
+            assert nested is not second
+    assert second is first
@@ -0,0 +1,133 @@
+# auth.py
+# Admin tokens are EdDSA/RS256 JWTs issued by the CMS auth service and
+# verified locally against its published JWKS. The key set is fetched once,
+# refreshed in the background every JWKS_REFRESH_SECONDS, and re-fetched
+# early (at most once per JWKS_MIN_REFRESH_SECONDS) when a token names an
+# unknown key id, so verification never calls the CMS per request. If a
+# refresh fails the last good key set stays in use.
+import os
+import json
+import time
+import logging
+import threading
+import urllib.request
+from functools import wraps
+from flask import abort, request, g
+import jwt
+from config import JWKS_URL, JWKS_FILE, JWKS_REFRESH_SECONDS, JWKS_MIN_REFRESH_SECONDS
+
+logger = logging.getLogger(__name__)
+
+JWT_ALGORITHMS = ['EdDSA', 'RS256']
+
+class KeySet:
+    def __init__(self, url=None, path=None, refresh_seconds=300, min_refresh_seconds=30):
+        self.url = url
+        self.path = path
+        self.refresh_seconds = refresh_seconds
+        self.min_refresh_seconds = min_refresh_seconds
+        self._keys = {}
+        self._fetched_at = 0.0
+        self._attempted_at = 0.0
+        self._lock = threading.Lock()
+        self._pid = None
+        self._stop = threading.Event()
+
+    def _load(self):
+        if self.path:
+            with open(self.path) as f:
+                return json.load(f)
+        with urllib.request.urlopen(self.url, timeout=5) as response:
+            return json.load(response)
+
+    def refresh(self):
+        self._attempted_at = time.monotonic()
+        try:
+            document = self._load()
+            keys = {}
+            for jwk in jwt.PyJWKSet.from_dict(document).keys:
+                if jwk.key_id:
+                    keys[jwk.key_id] = jwk
+        except Exception as e:
+            logger.error("Error refreshing JWKS from %s: %s", self.path or self.url, e)
+            return False
+
+        self._keys = keys
+        self._fetched_at = time.monotonic()
+        logger.info("Loaded %s signing keys from %s", len(keys), self.path or self.url)
+        return True
+
+    def _run(self):
+        while not self._stop.wait(self.refresh_seconds):
+            self.refresh()
+
+    def start(self):
+        # Fetch synchronously, then keep refreshing in a daemon thread. Safe to
+        # call again after fork: the thread is recreated in the new process.
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stop = threading.Event()
+            if not self._keys:
+                self.refresh()
+            threading.Thread(target=self._run, name='jwks-refresh', daemon=True).start()
+
+    def get(self, kid):
+        if self._pid != os.getpid():
+            self.start()
+        key = self._keys.get(kid)
+        if key is None and time.monotonic() - self._attempted_at >= self.min_refresh_seconds:
+            # Possibly a freshly rotated key; refresh once, rate limited
+            with self._lock:
+                if time.monotonic() - self._attempted_at >= self.min_refresh_seconds:
+                    self.refresh()
+            key = self._keys.get(kid)
+        return key
+
+key_set = KeySet(JWKS_URL, JWKS_FILE, JWKS_REFRESH_SECONDS, JWKS_MIN_REFRESH_SECONDS)
+
+def get_bearer_token():
+    header = request.headers.get('Authorization', '')
+    scheme, _, token = header.partition(' ')
+    if scheme.lower() != 'bearer' or not token:
+        return None
+    return token.strip()
+
+def decode_admin_token(token):
+    # Raises jwt.InvalidTokenError (or a subclass) if the token is not valid
+    kid = jwt.get_unverified_header(token).get('kid')
+    jwk = key_set.get(kid)
+    if jwk is None:
+        raise jwt.InvalidTokenError(f"Unknown signing key {kid!r}")
+    algorithms = [jwk.algorithm_name] if jwk.algorithm_name in JWT_ALGORITHMS else JWT_ALGORITHMS
+    return jwt.decode(token, jwk.key, algorithms=algorithms)
+
+def is_admin_request():
+    token = get_bearer_token()
+    if not token:
+        return False
+    try:
+        decode_admin_token(token)
+        return True
+    except jwt.InvalidTokenError:
+        return False
+
+def require_admin(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        token = get_bearer_token()
+        if not token:
+            logger.warning("Missing bearer token for %s", request.path)
+            abort(401, description="Authentication required")
+
+        try:
+            claims = decode_admin_token(token)
+        except jwt.ExpiredSignatureError:
+            abort(401, description="Token has expired")
+        except jwt.InvalidTokenError:
+            abort(401, description="Invalid token")
+
+        g.admin_email = claims.get('email')
+        return view(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,7 @@
+# bench: benchmarks for the books API. Run modules from the service
+# directory:
+#   python -m bench.corpus            synthetic PDFs and catalogs
+#   python -m bench.run               HTTP load against a local server
+#   python -m bench.logging_overhead  per-request logging cost
+#   python -m bench.startup           import and startup time
+#   python -m bench.compare A B       diff two JSON reports
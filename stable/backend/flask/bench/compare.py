@@ -0,0 +1,67 @@
+# bench/compare.py
+# Compares two bench JSON reports and flags regressions.
+#
+#   python -m bench.compare before.json after.json --threshold 10
+import sys
+import json
+import argparse
+
+# Metric -> True when higher is better
+METRICS = {
+    'throughput_rps': True,
+    'p50_ms': False,
+    'p95_ms': False,
+    'p99_ms': False,
+    'us_per_request': False,
+}
+
+def _rows(results, prefix=''):
+    for name, values in results.items():
+        if not isinstance(values, dict):
+            continue
+        if any(metric in values for metric in METRICS):
+            yield prefix + name, values
+        else:
+            yield from _rows(values, prefix + name + '.')
+
+def compare(before, after, threshold):
+    baseline = dict(_rows(before['results']))
+    regressions = []
+    lines = [f"{'scenario':<40} {'metric':<16} {'before':>12} {'after':>12} {'change':>9}"]
+    for name, values in _rows(after['results']):
+        old = baseline.get(name)
+        if old is None:
+            continue
+        for metric, higher_is_better in METRICS.items():
+            if old.get(metric) in (None, 0) or values.get(metric) is None:
+                continue
+            change = (values[metric] - old[metric]) / old[metric] * 100
+            worse = -change if higher_is_better else change
+            flag = ' !' if worse > threshold else ''
+            if flag:
+                regressions.append((name, metric, change))
+            lines.append(f"{name:<40} {metric:<16} {old[metric]:>12} {values[metric]:>12} {change:>+8.1f}%{flag}")
+    return lines, regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare two benchmark reports")
+    parser.add_argument('before')
+    parser.add_argument('after')
+    parser.add_argument('--threshold', type=float, default=10.0, help="Percent change counted as a regression")
+    args = parser.parse_args(argv)
+
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+
+    lines, regressions = compare(before, after, args.threshold)
+    print(f"{before.get('revision')} -> {after.get('revision')}")
+    print('\n'.join(lines))
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) over {args.threshold}%")
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
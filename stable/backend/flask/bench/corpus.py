@@ -0,0 +1,209 @@
+# bench/corpus.py
+# Synthetic benchmark data: PDFs written directly in PDF syntax (no extra
+# dependencies) and SQLite catalogs in the books.db schema.
+#
+#   python -m bench.corpus --out /tmp/bench-data --books 100000
+import os
+import sys
+import zlib
+import random
+import sqlite3
+import argparse
+
+TEXT_PAGE_COUNTS = (1, 10, 100, 2000)
+IMAGE_PAGE_COUNTS = (1, 10, 100, 2000)
+
+# Image-heavy PDFs reuse a small pool of distinct images so a 2000 page file
+# stays a few MB on disk while every page still has to be decoded to render
+IMAGE_POOL_SIZE = 8
+IMAGE_SIZE = 320
+
+WORDS = (
+    'lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor '
+    'incididunt ut labore et dolore magna aliqua enim ad minim veniam quis nostrud '
+    'exercitation ullamco laboris nisi aliquip ex ea commodo consequat'
+).split()
+
+CATEGORIES = (
+    'Biography', 'Programming', 'History', 'Science', 'Fiction', 'Philosophy',
+    'Poetry', 'Travel', 'Religion', 'Economics', 'Art', 'Mathematics'
+)
+
+class PDFWriter:
+    def __init__(self):
+        self.objects = []
+
+    def add(self, body):
+        self.objects.append(body)
+        return len(self.objects)
+
+    def reserve(self):
+        return self.add(None)
+
+    def set(self, number, body):
+        self.objects[number - 1] = body
+
+    def stream(self, data, extra=b''):
+        return b'<< /Length %d%s >>\nstream\n%s\nendstream' % (len(data), extra, data)
+
+    def write(self, path, root):
+        out = bytearray(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+        offsets = []
+        for number, body in enumerate(self.objects, start=1):
+            offsets.append(len(out))
+            out += b'%d 0 obj\n' % number + body + b'\nendobj\n'
+        xref = len(out)
+        out += b'xref\n0 %d\n0000000000 65535 f \n' % (len(self.objects) + 1)
+        for offset in offsets:
+            out += b'%010d 00000 n \n' % offset
+        out += b'trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (
+            len(self.objects) + 1, root, xref
+        )
+        with open(path, 'wb') as f:
+            f.write(out)
+
+def _escape_text(text):
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+def _text_content(rng, page_number, lines=60):
+    parts = [b'BT /F1 10 Tf 12 TL 50 760 Td']
+    parts.append(b'(%s) Tj T*' % _escape_text(f'Page {page_number + 1}').encode())
+    for _ in range(lines):
+        line = ' '.join(rng.choice(WORDS) for _ in range(14))
+        parts.append(b'(%s) Tj T*' % _escape_text(line).encode())
+    parts.append(b'ET')
+    return b'\n'.join(parts)
+
+def _noise_image(rng, size):
+    # Smooth gradient plus noise: compresses like a scanned photo, not like a
+    # flat fill, so decode cost is realistic
+    rows = bytearray()
+    for y in range(size):
+        row = bytearray(size * 3)
+        for x in range(size):
+            base = (x * 255 // size, y * 255 // size, (x + y) * 127 // size)
+            for channel in range(3):
+                row[x * 3 + channel] = (base[channel] + rng.randrange(48)) & 0xFF
+        rows += row
+    return zlib.compress(bytes(rows), 6)
+
+def write_pdf(path, pages, kind='text', seed=0):
+    rng = random.Random(seed)
+    writer = PDFWriter()
+    catalog = writer.reserve()
+    page_tree = writer.reserve()
+    font = writer.add(b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>')
+
+    images = []
+    if kind == 'image':
+        for _ in range(IMAGE_POOL_SIZE):
+            data = _noise_image(rng, IMAGE_SIZE)
+            images.append(writer.add(writer.stream(data, b' /Type /XObject /Subtype /Image /Width %d /Height %d '
+                                                         b'/ColorSpace /DeviceRGB /BitsPerComponent 8 /Filter /FlateDecode'
+                                                         % (IMAGE_SIZE, IMAGE_SIZE))))
+
+    kids = []
+    for page_number in range(pages):
+        if kind == 'image':
+            image = images[page_number % len(images)]
+            content = b'q 512 0 0 512 50 200 cm /Im1 Do Q\n' + _text_content(rng, page_number, lines=8)
+            resources = b'<< /Font << /F1 %d 0 R >> /XObject << /Im1 %d 0 R >> >>' % (font, image)
+        else:
+            content = _text_content(rng, page_number)
+            resources = b'<< /Font << /F1 %d 0 R >> >>' % font
+        contents = writer.add(writer.stream(zlib.compress(content), b' /Filter /FlateDecode'))
+        kids.append(writer.add(
+            b'<< /Type /Page /Parent %d 0 R /MediaBox [0 0 612 792] /Resources %s /Contents %d 0 R >>'
+            % (page_tree, resources, contents)
+        ))
+
+    writer.set(page_tree, b'<< /Type /Pages /Kids [%s] /Count %d >>' % (
+        b' '.join(b'%d 0 R' % kid for kid in kids), len(kids)
+    ))
+    writer.set(catalog, b'<< /Type /Catalog /Pages %d 0 R >>' % page_tree)
+    writer.write(path, catalog)
+
+def generate_pdfs(pdf_dir, text_pages=TEXT_PAGE_COUNTS, image_pages=IMAGE_PAGE_COUNTS):
+    # Returns absolute pdf paths, as stored in books.pdf_path (the server's
+    # working directory does not have to be the data directory)
+    os.makedirs(pdf_dir, exist_ok=True)
+    paths = []
+    for kind, counts in (('text', text_pages), ('image', image_pages)):
+        for pages in counts:
+            name = f'{kind}-{pages}.pdf'
+            path = os.path.join(pdf_dir, name)
+            if not os.path.exists(path):
+                write_pdf(path, pages, kind, seed=pages)
+            paths.append(os.path.abspath(path))
+    return paths
+
+def generate_catalog(db_path, books, pdf_paths, seed=0, chunk=10000):
+    rng = random.Random(seed)
+    if os.path.exists(db_path):
+        os.remove(db_path)
+
+    conn = sqlite3.connect(db_path)
+    conn.executescript('''
+    CREATE TABLE books (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        title TEXT NOT NULL,
+        author TEXT NOT NULL,
+        category TEXT NOT NULL,
+        description TEXT,
+        cover_image TEXT,
+        publication_year INTEGER,
+        isbn TEXT,
+        pdf_path TEXT
+    );
+    CREATE TABLE reviews (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        book_id INTEGER,
+        text TEXT NOT NULL,
+        author TEXT NOT NULL,
+        FOREIGN KEY(book_id) REFERENCES books(id)
+    );
+    ''')
+
+    authors = [f'{rng.choice(WORDS).title()} {rng.choice(WORDS).title()}' for _ in range(max(10, books // 20))]
+    book_id = 0
+    while book_id < books:
+        book_rows, review_rows = [], []
+        for _ in range(min(chunk, books - book_id)):
+            book_id += 1
+            title = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(2, 6))).title()
+            book_rows.append((
+                book_id, title, rng.choice(authors), rng.choice(CATEGORIES),
+                ' '.join(rng.choice(WORDS) for _ in range(30)),
+                f'https://example.com/covers/{book_id}.jpg',
+                rng.randint(1900, 2024), f'978-{rng.randint(0, 9999999999):010d}',
+                pdf_paths[book_id % len(pdf_paths)],
+            ))
+            for _ in range(rng.choice((0, 0, 1, 1, 2, 3))):
+                review_rows.append((book_id, f'Review of {title}', rng.choice(authors)))
+        conn.executemany('INSERT INTO books VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', book_rows)
+        conn.executemany('INSERT INTO reviews (book_id, text, author) VALUES (?, ?, ?)', review_rows)
+        conn.commit()
+    conn.close()
+
+def generate(data_dir, books, text_pages=TEXT_PAGE_COUNTS, image_pages=IMAGE_PAGE_COUNTS):
+    pdf_paths = generate_pdfs(os.path.join(data_dir, 'pdfs'), text_pages, image_pages)
+    db_path = os.path.join(data_dir, 'books.db')
+    generate_catalog(db_path, books, pdf_paths)
+    return db_path, pdf_paths
+
+def _page_counts(value):
+    return tuple(int(part) for part in value.split(',') if part)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic PDF corpus and catalog")
+    parser.add_argument('--out', required=True, help="Data directory (pdfs/ and books.db are created here)")
+    parser.add_argument('--books', type=int, default=1000, help="Catalog size, e.g. 1000 to 1000000")
+    parser.add_argument('--text-pages', type=_page_counts, default=TEXT_PAGE_COUNTS)
+    parser.add_argument('--image-pages', type=_page_counts, default=IMAGE_PAGE_COUNTS)
+    args = parser.parse_args(argv)
+
+    db_path, pdf_paths = generate(args.out, args.books, args.text_pages, args.image_pages)
+    print(f"Wrote {len(pdf_paths)} PDFs and {args.books} books to {db_path}")
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,86 @@
+# bench/load.py
+# Closed-loop load generator: N client threads, each with its own keep-alive
+# connection, issue requests from a scenario for a fixed duration.
+import time
+import random
+import threading
+import http.client
+from urllib.parse import urlsplit
+from bench.report import summarize_latencies
+
+class Scenario:
+    # `paths` returns the next request path for a client; each client gets
+    # its own seeded random.Random so runs are reproducible
+    def __init__(self, name, paths):
+        self.name = name
+        self.paths = paths
+
+def book_scenarios(book_ids, search_terms, page_counts):
+    # page_counts maps book id -> page count for preview page selection
+    def preview(rng):
+        book_id = rng.choice(book_ids)
+        return f'/api/v1/books/{book_id}/preview?page={rng.randrange(max(1, page_counts.get(book_id, 1)))}'
+
+    return {
+        'get_books': Scenario('get_books', lambda rng: '/api/v1/books/'),
+        'search_books': Scenario('search_books', lambda rng: f'/api/v1/books/search?q={rng.choice(search_terms)}'),
+        'get_pdf_preview': Scenario('get_pdf_preview', preview),
+        'page_count': Scenario('page_count', lambda rng: f'/api/v1/books/{rng.choice(book_ids)}/page-count'),
+        'download': Scenario('download', lambda rng: f'/api/v1/books/{rng.choice(book_ids)}/download'),
+    }
+
+def mixed_scenario(name, scenarios, weights):
+    # Picks one of `scenarios` per request with the given relative weights
+    chosen = list(scenarios)
+    def paths(rng):
+        return rng.choices(chosen, weights)[0].paths(rng)
+    return Scenario(name, paths)
+
+def _client(base_url, scenario, deadline, seed, latencies, errors, lock, headers):
+    parts = urlsplit(base_url)
+    rng = random.Random(seed)
+    conn = http.client.HTTPConnection(parts.hostname, parts.port, timeout=120)
+    local_latencies, local_errors = [], 0
+    while time.monotonic() < deadline:
+        path = scenario.paths(rng)
+        start = time.perf_counter()
+        try:
+            conn.request('GET', path, headers=headers)
+            response = conn.getresponse()
+            response.read()
+            if response.status >= 400:
+                local_errors += 1
+            else:
+                local_latencies.append(time.perf_counter() - start)
+        except (OSError, http.client.HTTPException):
+            local_errors += 1
+            conn.close()
+            conn = http.client.HTTPConnection(parts.hostname, parts.port, timeout=120)
+    conn.close()
+    with lock:
+        latencies.extend(local_latencies)
+        errors.append(local_errors)
+
+def run_scenario(base_url, scenario, concurrency, duration, seed=0, headers=None):
+    latencies, errors = [], []
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+    threads = [
+        threading.Thread(
+            target=_client,
+            args=(base_url, scenario, deadline, seed + index, latencies, errors, lock, headers or {}),
+            daemon=True
+        )
+        for index in range(concurrency)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    result = summarize_latencies(latencies, elapsed, sum(errors))
+    result['concurrency'] = concurrency
+    result['duration_s'] = duration
+    return result
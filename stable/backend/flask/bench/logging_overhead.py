@@ -0,0 +1,84 @@
+# bench/logging_overhead.py
+# Measures the logging cost of one preview request (the lines emitted by
+# main.get_pdf_preview, DatabaseManager and PDFPreview) under the old
+# synchronous basicConfig setup and the queued configurations.
+import os
+import sys
+import time
+import logging
+import argparse
+import tempfile
+from log_config import configure_logging, stop_logging, SAMPLED
+from bench.report import build_report, write_report
+
+def emit_preview_request(book_id=1, pdf_path='./pdfs/sample.pdf'):
+    main_log = logging.getLogger('main')
+    db_log = logging.getLogger('main_2')
+    preview_log = logging.getLogger('preview')
+
+    main_log.info("Attempting to get preview for book %s", book_id, extra=SAMPLED)
+    db_log.info("Attempting to retrieve book with ID: %s", book_id, extra=SAMPLED)
+    db_log.debug("Database connection established")
+    db_log.info("Retrieving reviews for book %s", book_id, extra=SAMPLED)
+    db_log.debug("Database connection established")
+    db_log.info("Retrieved %s reviews for book %s", 1, book_id, extra=SAMPLED)
+    db_log.info("Book retrieved: %s (ID: %s)", 'Sample', book_id, extra=SAMPLED)
+    main_log.info("Generating preview for %s, page %s, scale %s", pdf_path, 0, 1.0, extra=SAMPLED)
+    preview_log.info("Generating preview for %s, page %s, scale %s", pdf_path, 0, 1.0, extra=SAMPLED)
+    preview_log.info("Preview generated successfully for %s", pdf_path, extra=SAMPLED)
+    preview_log.info("Getting total pages for %s", pdf_path, extra=SAMPLED)
+    preview_log.info("Total pages: %s", 1, extra=SAMPLED)
+    main_log.info("Preview generated successfully for book %s", book_id, extra=SAMPLED)
+
+def _configure_sync(log_file):
+    # Equivalent of the former per-module logging.basicConfig(level=DEBUG)
+    handler = logging.FileHandler(log_file, mode='a')
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(logging.DEBUG)
+    def stop():
+        root.removeHandler(handler)
+        handler.close()
+    return stop
+
+def run(requests, log_dir):
+    variants = {
+        'sync_file_debug': lambda path: _configure_sync(path),
+        'queued': lambda path: configure_logging(log_file=path, console=False) or stop_logging,
+        'queued_json': lambda path: configure_logging(log_file=path, json_output=True, console=False) or stop_logging,
+        'queued_sampled_10pct': lambda path: configure_logging(log_file=path, sample_rate=0.1, console=False) or stop_logging,
+    }
+
+    results = {}
+    for name, configure in variants.items():
+        stop = configure(os.path.join(log_dir, f'{name}.log'))
+        start = time.perf_counter()
+        for _ in range(requests):
+            emit_preview_request()
+        elapsed = time.perf_counter() - start
+        # Time to drain the queue is reported separately: it is spent on the
+        # listener thread, not on the request thread
+        drain_start = time.perf_counter()
+        stop()
+        drain = time.perf_counter() - drain_start
+        results[name] = {
+            'requests': requests,
+            'us_per_request': round(elapsed / requests * 1e6, 3),
+            'drain_seconds': round(drain, 4),
+        }
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure per-request logging overhead")
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--output', help="Write JSON results to this file")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as log_dir:
+        results = run(args.requests, log_dir)
+
+    write_report(build_report('logging_overhead', results, requests=args.requests), args.output)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,57 @@
+# bench/report.py
+# Shared result handling: latency summaries and JSON reports that can be
+# compared across commits with bench.compare
+import os
+import json
+import math
+import time
+import platform
+import subprocess
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    # Nearest-rank percentile
+    index = min(len(sorted_values) - 1, max(0, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+def summarize_latencies(latencies, elapsed, errors=0):
+    ordered = sorted(latencies)
+    to_ms = lambda value: None if value is None else round(value * 1000, 3)
+    return {
+        'requests': len(ordered) + errors,
+        'errors': errors,
+        'throughput_rps': round(len(ordered) / elapsed, 2) if elapsed > 0 else None,
+        'mean_ms': to_ms(sum(ordered) / len(ordered)) if ordered else None,
+        'p50_ms': to_ms(percentile(ordered, 0.50)),
+        'p95_ms': to_ms(percentile(ordered, 0.95)),
+        'p99_ms': to_ms(percentile(ordered, 0.99)),
+        'max_ms': to_ms(ordered[-1]) if ordered else None,
+    }
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)), stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def build_report(benchmark, results, **parameters):
+    return {
+        'benchmark': benchmark,
+        'revision': git_revision(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'cpus': os.cpu_count(),
+        'parameters': parameters,
+        'results': results,
+    }
+
+def write_report(report, output=None):
+    text = json.dumps(report, indent=2)
+    if output:
+        with open(output, 'w') as f:
+            f.write(text + '\n')
+    print(text)
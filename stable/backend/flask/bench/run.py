@@ -0,0 +1,132 @@
+# bench/run.py
+# End-to-end benchmark: generates (or reuses) a synthetic corpus, starts the
+# production server against it and drives each route with concurrent clients.
+#
+#   python -m bench.run --data /tmp/bench-data --books 10000 --output before.json
+#   ... change code ...
+#   python -m bench.run --data /tmp/bench-data --books 10000 --output after.json
+#   python -m bench.compare before.json after.json
+import os
+import sys
+import time
+import sqlite3
+import argparse
+import tempfile
+import subprocess
+import urllib.request
+from bench import corpus, logging_overhead, startup
+from bench.load import book_scenarios, run_scenario
+from bench.report import build_report, write_report
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCENARIOS = ('get_books', 'search_books', 'get_pdf_preview', 'page_count', 'download')
+SEARCH_TERMS = ('lorem', 'dolor', 'magna', 'science', 'history', 'zzz-no-match')
+
+def start_server(data_dir, port, workers, threads, extra_env=None, server='serve'):
+    env = dict(os.environ)
+    env.update({
+        'BOOKS_DB_PATH': os.path.join(data_dir, 'books.db'),
+        'BOOKS_LOG_FILE': os.path.join(data_dir, 'app_logs', 'app.log'),
+        'BOOKS_BIND': f'127.0.0.1:{port}',
+        'BOOKS_WORKERS': str(workers),
+        'BOOKS_THREADS': str(threads),
+        # The load generator is a single client; limits would cap throughput
+        'BOOKS_RATE_LIMIT': '0',
+        'PYTHONPATH': SERVICE_DIR + os.pathsep + env.get('PYTHONPATH', ''),
+    })
+    env.update(extra_env or {})
+    script = os.path.join(SERVICE_DIR, 'serve.py' if server == 'serve' else 'main.py')
+    process = subprocess.Popen(
+        [sys.executable, script], cwd=data_dir, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    wait_until_ready(f'http://127.0.0.1:{port}', process)
+    return process
+
+def wait_until_ready(base_url, process, timeout=120):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with status {process.returncode}")
+        try:
+            urllib.request.urlopen(base_url + '/metrics', timeout=2).read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("Server did not become ready")
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+def sample_books(db_path, count, seed=0):
+    # Returns {book id: page count} for a spread of books across the catalog
+    conn = sqlite3.connect(db_path)
+    total = conn.execute('SELECT MAX(id) FROM books').fetchone()[0] or 0
+    step = max(1, total // max(1, count))
+    rows = conn.execute('SELECT id, pdf_path FROM books WHERE (id - 1) % ? = 0 LIMIT ?', (step, count)).fetchall()
+    conn.close()
+    # Corpus file names encode their page count: pdfs/<kind>-<pages>.pdf
+    return {book_id: int(os.path.basename(path).rsplit('-', 1)[1].split('.')[0]) for book_id, path in rows}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the books API benchmark suite")
+    parser.add_argument('--data', help="Data directory (default: temporary)")
+    parser.add_argument('--books', type=int, default=1000)
+    parser.add_argument('--regenerate', action='store_true', help="Rebuild the catalog even if it exists")
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=10.0, help="Seconds per scenario")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--port', type=int, default=3901)
+    parser.add_argument('--server', choices=('serve', 'dev'), default='serve')
+    parser.add_argument('--skip-logging', action='store_true', help="Skip the logging overhead benchmark")
+    parser.add_argument('--skip-startup', action='store_true', help="Skip the startup time benchmark")
+    parser.add_argument('--output', help="Write JSON results to this file")
+    args = parser.parse_args(argv)
+
+    scenarios = [name for name in args.scenarios.split(',') if name]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+    with tempfile.TemporaryDirectory() as scratch:
+        data_dir = os.path.abspath(args.data or scratch)
+        db_path = os.path.join(data_dir, 'books.db')
+        if args.regenerate or not os.path.exists(db_path):
+            corpus.generate(data_dir, args.books)
+
+        page_counts = sample_books(db_path, 200)
+        available = book_scenarios(list(page_counts), SEARCH_TERMS, page_counts)
+
+        results = {}
+        process = start_server(data_dir, args.port, args.workers, args.threads, server=args.server)
+        try:
+            base_url = f'http://127.0.0.1:{args.port}'
+            for name in scenarios:
+                results[name] = run_scenario(base_url, available[name], args.concurrency, args.duration)
+                print(f"{name}: {results[name]['throughput_rps']} req/s, p99 {results[name]['p99_ms']} ms",
+                      file=sys.stderr)
+        finally:
+            stop_server(process)
+
+        if not args.skip_startup:
+            results['startup'] = startup.run(data_dir, args.port + 1, args.workers, args.threads)
+
+        if not args.skip_logging:
+            with tempfile.TemporaryDirectory() as log_dir:
+                results['logging_overhead'] = logging_overhead.run(5000, log_dir)
+
+    report = build_report(
+        'http', results, books=args.books, concurrency=args.concurrency, duration=args.duration,
+        workers=args.workers, threads=args.threads, server=args.server
+    )
+    write_report(report, args.output)
+
+if __name__ == '__main__':
+    sys.exit(main())
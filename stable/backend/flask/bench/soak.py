@@ -0,0 +1,158 @@
+# bench/soak.py
+# Long-running soak test: replays a mix of preview, search and download
+# traffic against a local server while sampling the server's RSS, open file
+# descriptors, SQLite handles and child processes. Exits non-zero when any of
+# them grows past its threshold between the start and the end of the run.
+#
+#   python -m bench.soak --data /tmp/bench-data --hours 6 --output soak.json
+import os
+import sys
+import time
+import argparse
+import tempfile
+import threading
+from statistics import median
+from bench import corpus
+from bench.load import book_scenarios, mixed_scenario, run_scenario
+from bench.report import build_report, write_report
+from bench.run import start_server, stop_server, sample_books, SEARCH_TERMS
+
+TRAFFIC_MIX = {'get_pdf_preview': 5, 'search_books': 3, 'download': 2}
+
+def _children(pid):
+    children = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                # The command name may contain spaces; ppid follows the last ')'
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        if ppid == pid:
+            children.append(int(entry))
+    return children
+
+def _rss_kb(pid):
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    return 0
+
+def _fds(pid):
+    targets = []
+    for fd in os.listdir(f'/proc/{pid}/fd'):
+        try:
+            targets.append(os.readlink(f'/proc/{pid}/fd/{fd}'))
+        except OSError:
+            continue
+    return targets
+
+def sample_process_tree(master_pid, db_path):
+    # Workers are the master's children; anything below a worker (pdftoppm
+    # spawned for a preview or a cover) counts as a render child process
+    sample = {'time': time.time(), 'rss_kb': 0, 'open_fds': 0, 'sqlite_handles': 0, 'render_children': 0}
+    workers = _children(master_pid)
+    for pid in [master_pid] + workers:
+        try:
+            sample['rss_kb'] += _rss_kb(pid)
+            fds = _fds(pid)
+        except OSError:
+            continue
+        sample['open_fds'] += len(fds)
+        sample['sqlite_handles'] += sum(1 for target in fds if target == db_path)
+        if pid != master_pid:
+            sample['render_children'] += len(_children(pid))
+    sample['workers'] = len(workers)
+    return sample
+
+def _sampler(master_pid, db_path, interval, samples, stop):
+    while not stop.wait(interval):
+        samples.append(sample_process_tree(master_pid, db_path))
+
+def check_growth(samples, window, limits):
+    # Compares the median of the first and last `window` samples per metric
+    if len(samples) < window * 2:
+        return {}, []
+    growth, failures = {}, []
+    for metric, (limit, relative) in limits.items():
+        start = median(sample[metric] for sample in samples[:window])
+        end = median(sample[metric] for sample in samples[-window:])
+        change = (end - start) / start * 100 if relative and start else end - start
+        growth[metric] = {'start': start, 'end': end, 'growth': round(change, 2),
+                          'limit': limit, 'unit': '%' if relative else 'count'}
+        if change > limit:
+            failures.append(metric)
+    return growth, failures
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Soak test the books API for memory and handle leaks")
+    parser.add_argument('--data', help="Data directory (default: temporary)")
+    parser.add_argument('--books', type=int, default=1000)
+    parser.add_argument('--hours', type=float, default=1.0)
+    parser.add_argument('--warmup', type=float, default=300, help="Seconds of traffic before sampling starts")
+    parser.add_argument('--interval', type=float, default=30, help="Seconds between samples")
+    parser.add_argument('--window', type=int, default=10, help="Samples averaged at the start and end")
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--port', type=int, default=3902)
+    parser.add_argument('--max-rss-growth', type=float, default=20.0, help="Percent")
+    parser.add_argument('--max-fd-growth', type=float, default=10)
+    parser.add_argument('--max-sqlite-growth', type=float, default=2)
+    parser.add_argument('--max-children-growth', type=float, default=2)
+    parser.add_argument('--output', help="Write JSON results to this file")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as scratch:
+        data_dir = os.path.abspath(args.data or scratch)
+        db_path = os.path.join(data_dir, 'books.db')
+        if not os.path.exists(db_path):
+            corpus.generate(data_dir, args.books)
+
+        page_counts = sample_books(db_path, 200)
+        available = book_scenarios(list(page_counts), SEARCH_TERMS, page_counts)
+        mix = mixed_scenario('soak', [available[name] for name in TRAFFIC_MIX], list(TRAFFIC_MIX.values()))
+
+        process = start_server(data_dir, args.port, args.workers, args.threads)
+        base_url = f'http://127.0.0.1:{args.port}'
+        samples, stop = [], threading.Event()
+        try:
+            run_scenario(base_url, mix, args.concurrency, args.warmup)
+            sampler = threading.Thread(
+                target=_sampler, args=(process.pid, db_path, args.interval, samples, stop), daemon=True
+            )
+            samples.append(sample_process_tree(process.pid, db_path))
+            sampler.start()
+            traffic = run_scenario(base_url, mix, args.concurrency, args.hours * 3600, seed=1)
+            stop.set()
+            sampler.join()
+            samples.append(sample_process_tree(process.pid, db_path))
+        finally:
+            stop.set()
+            stop_server(process)
+
+    growth, failures = check_growth(samples, args.window, {
+        'rss_kb': (args.max_rss_growth, True),
+        'open_fds': (args.max_fd_growth, False),
+        'sqlite_handles': (args.max_sqlite_growth, False),
+        'render_children': (args.max_children_growth, False),
+    })
+    report = build_report(
+        'soak', {'traffic': traffic, 'growth': growth, 'failures': failures, 'samples': samples},
+        hours=args.hours, books=args.books, concurrency=args.concurrency,
+        workers=args.workers, threads=args.threads, interval=args.interval
+    )
+    write_report(report, args.output)
+    if len(samples) < args.window * 2:
+        print("Not enough samples to judge growth; increase --hours or lower --interval", file=sys.stderr)
+        return 1
+    if failures:
+        print(f"Soak test failed: {', '.join(failures)} grew past their limits", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,116 @@
+# bench/startup.py
+# Startup cost: `import main` (total and the heaviest modules it pulls in,
+# from python -X importtime), initialize_app on first and repeated starts,
+# and seconds from spawning serve.py until it answers /metrics.
+#
+#   python -m bench.startup --data /tmp/bench-data --books 10000
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+from bench import corpus
+from bench.report import build_report, write_report
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_INIT_SCRIPT = '''
+import json, time
+import main
+timings = []
+for _ in range(2):
+    start = time.perf_counter()
+    main.initialize_app()
+    timings.append(time.perf_counter() - start)
+print(json.dumps(timings))
+'''
+
+def _env(data_dir):
+    env = dict(os.environ)
+    env.update({
+        'BOOKS_DB_PATH': os.path.join(data_dir, 'books.db'),
+        'BOOKS_LOG_FILE': os.path.join(data_dir, 'app_logs', 'app.log'),
+        'PYTHONPATH': SERVICE_DIR + os.pathsep + env.get('PYTHONPATH', ''),
+    })
+    return env
+
+def parse_importtime(stderr, module='main', top=10):
+    # Lines look like "import time:  self | cumulative |   <indent>name". The
+    # module's own imports are the entries one level deeper that precede it.
+    children, total = [], None
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip(' '))) // 2
+        name = name.strip()
+        if depth == 0:
+            if name == module:
+                total = int(cumulative) / 1000
+                break
+            children = []
+        elif depth == 1:
+            children.append((name, int(cumulative) / 1000))
+    children.sort(key=lambda item: item[1], reverse=True)
+    return total, [{'module': name, 'ms': round(ms, 2)} for name, ms in children[:top]]
+
+def measure_import(data_dir, runs=3):
+    # Best of several runs; the first one also warms the page cache
+    best, heaviest = None, []
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', 'import main'],
+            cwd=data_dir, env=_env(data_dir), capture_output=True, text=True, check=True
+        )
+        total, modules = parse_importtime(result.stderr)
+        if total is not None and (best is None or total < best):
+            best, heaviest = total, modules
+    return {'import_ms': round(best, 2) if best is not None else None, 'heaviest_imports': heaviest}
+
+def measure_init(data_dir):
+    result = subprocess.run(
+        [sys.executable, '-c', _INIT_SCRIPT],
+        cwd=data_dir, env=_env(data_dir), capture_output=True, text=True, check=True
+    )
+    first, repeat = json.loads(result.stdout.strip().splitlines()[-1])
+    return {'init_first_ms': round(first * 1000, 2), 'init_repeat_ms': round(repeat * 1000, 2)}
+
+def measure_ready(data_dir, port, workers, threads):
+    from bench.run import start_server, stop_server
+    start = time.monotonic()
+    process = start_server(data_dir, port, workers, threads)
+    ready = time.monotonic() - start
+    stop_server(process)
+    return {'ready_seconds': round(ready, 3)}
+
+def run(data_dir, port=3902, workers=2, threads=4):
+    os.makedirs(os.path.join(data_dir, 'app_logs'), exist_ok=True)
+    results = {}
+    results.update(measure_import(data_dir))
+    results.update(measure_init(data_dir))
+    results.update(measure_ready(data_dir, port, workers, threads))
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure import and startup time")
+    parser.add_argument('--data', help="Data directory (default: temporary)")
+    parser.add_argument('--books', type=int, default=1000)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--port', type=int, default=3902)
+    parser.add_argument('--output', help="Write JSON results to this file")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as scratch:
+        data_dir = os.path.abspath(args.data or scratch)
+        if not os.path.exists(os.path.join(data_dir, 'books.db')):
+            corpus.generate(data_dir, args.books, text_pages=(1,), image_pages=())
+        results = run(data_dir, args.port, args.workers, args.threads)
+
+    report = build_report('startup', results, books=args.books, workers=args.workers, threads=args.threads)
+    write_report(report, args.output)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,69 @@
+# changes.py
+# Server-Sent Events stream of catalog versions for
+# /api/v1/books/changes/stream. Writes made by this process wake waiting
+# streams through the cache invalidation hook; writes from other workers are
+# picked up by polling MAX(version) every CHANGES_POLL_SECONDS. Clients fetch
+# the actual records from /api/v1/books/changes?since=<version>.
+#
+# Each open stream holds a worker thread, so streams end after
+# CHANGES_STREAM_MAX_SECONDS and EventSource reconnects on its own, and a
+# worker serves at most CHANGES_MAX_STREAMS at once. Clients turned away
+# (503) fall back to polling /api/v1/books/changes.
+import json
+import time
+import threading
+from config import CHANGES_POLL_SECONDS, CHANGES_STREAM_MAX_SECONDS, CHANGES_MAX_STREAMS
+from main_2 import DatabaseManager
+
+KEEPALIVE_SECONDS = 15
+
+_changed = threading.Condition()
+
+def _notify(book_ids=None):
+    with _changed:
+        _changed.notify_all()
+
+DatabaseManager.register_cache_invalidation_hook(_notify)
+
+_open_streams = 0
+_streams_lock = threading.Lock()
+
+def acquire_stream():
+    # False when this worker already serves CHANGES_MAX_STREAMS streams;
+    # otherwise the caller must release_stream() once the stream is closed
+    global _open_streams
+    with _streams_lock:
+        if _open_streams >= CHANGES_MAX_STREAMS:
+            return False
+        _open_streams += 1
+        return True
+
+def release_stream():
+    global _open_streams
+    with _streams_lock:
+        _open_streams -= 1
+
+def open_streams():
+    return _open_streams
+
+def _event(version):
+    return f"event: version\nid: {version}\ndata: {json.dumps({'version': version})}\n\n"
+
+def stream_versions(version, since=None):
+    # Emits the current version (read by the caller) first, then every new one
+    started = last_sent = time.monotonic()
+    if since is None or version != since:
+        yield _event(version)
+    yield f"retry: {int(CHANGES_POLL_SECONDS * 1000)}\n\n"
+
+    while time.monotonic() - started < CHANGES_STREAM_MAX_SECONDS:
+        with _changed:
+            _changed.wait(CHANGES_POLL_SECONDS)
+        current = DatabaseManager.get_catalog_version()
+        now = time.monotonic()
+        if current != version:
+            version, last_sent = current, now
+            yield _event(version)
+        elif now - last_sent >= KEEPALIVE_SECONDS:
+            last_sent = now
+            yield ": keepalive\n\n"
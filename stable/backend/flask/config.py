@@ -0,0 +1,180 @@
+# config.py
+import os
+
+def _env_int(name, default):
+    return int(os.environ.get(name, default))
+
+def _env_float(name, default):
+    return float(os.environ.get(name, default))
+
+def _env_bool(name, default=False):
+    return os.environ.get(name, '1' if default else '0').lower() in ('1', 'true', 'yes')
+
+def _env_rate(name, default):
+    # "<tokens per second>/<burst>", e.g. "2/20"
+    rate, _, burst = os.environ.get(name, default).partition('/')
+    return float(rate), float(burst or rate)
+
+# Database
+DATABASE_PATH = os.environ.get('BOOKS_DB_PATH', 'books.db')
+DB_BUSY_TIMEOUT_MS = _env_int('BOOKS_DB_BUSY_TIMEOUT_MS', 5000)
+
+# Single-writer queue: how long the writer waits to gather operations into one
+# transaction, and the most operations it commits together
+WRITE_GROUP_COMMIT_MS = _env_float('BOOKS_WRITE_GROUP_COMMIT_MS', 5)
+WRITE_BATCH_MAX = _env_int('BOOKS_WRITE_BATCH_MAX', 256)
+
+# Reviews embedded in catalog listings (newest first). Off by default:
+# listings carry review_count and reviews_url, and clients page reviews
+# through /api/v1/books/<id>/reviews. Setting it costs one windowed query
+# over the reviews of every listed book
+REVIEW_PREVIEW_COUNT = _env_int('BOOKS_REVIEW_PREVIEW_COUNT', 0)
+REVIEWS_MAX_LIMIT = 100
+
+# Content-addressed PDF storage (pdf_store.py, storage.py). 'local' keeps the
+# files under PDF_STORE_DIR; 's3' keeps them in an S3-compatible bucket
+# (BOOKS_S3_ENDPOINT_URL for MinIO and other non-AWS stores) with a local
+# read-through cache of at most STORAGE_CACHE_MAX_BYTES
+STORAGE_BACKEND = os.environ.get('BOOKS_STORAGE_BACKEND', 'local')
+PDF_STORE_DIR = os.environ.get('BOOKS_PDF_STORE_DIR', 'pdf_store')
+S3_BUCKET = os.environ.get('BOOKS_S3_BUCKET')
+S3_PREFIX = os.environ.get('BOOKS_S3_PREFIX', 'pdfs')
+S3_ENDPOINT_URL = os.environ.get('BOOKS_S3_ENDPOINT_URL')
+S3_REGION = os.environ.get('BOOKS_S3_REGION')
+STORAGE_CACHE_DIR = os.environ.get('BOOKS_STORAGE_CACHE_DIR', 'pdf_cache')
+STORAGE_CACHE_MAX_BYTES = _env_int('BOOKS_STORAGE_CACHE_MAX_BYTES', 10 * 1024 ** 3)
+
+# PDF library watcher (library_watcher.py): PDFs under LIBRARY_DIR are
+# followed with inotify where available, else by polling every
+# WATCH_POLL_SECONDS. Events are gathered for WATCH_DEBOUNCE_SECONDS before
+# being processed, and a full rescan every WATCH_RESCAN_SECONDS catches any
+# event inotify dropped.
+LIBRARY_DIR = os.environ.get('BOOKS_LIBRARY_DIR', 'pdfs')
+WATCH_POLL_SECONDS = _env_float('BOOKS_WATCH_POLL_SECONDS', 5.0)
+WATCH_DEBOUNCE_SECONDS = _env_float('BOOKS_WATCH_DEBOUNCE_SECONDS', 1.0)
+WATCH_RESCAN_SECONDS = _env_float('BOOKS_WATCH_RESCAN_SECONDS', 3600.0)
+
+# Generated cover thumbnails (covers.py): one WebP per width under COVER_DIR,
+# plus a blurred placeholder of COVER_PLACEHOLDER_WIDTH px stored on the row
+COVER_DIR = os.environ.get('BOOKS_COVER_DIR', 'covers')
+COVER_WIDTHS = (160, 320, 640)
+COVER_PLACEHOLDER_WIDTH = 16
+COVER_QUALITY = _env_int('BOOKS_COVER_QUALITY', 80)
+
+# Auth: tokens are issued by the CMS auth service (cms/stable/backend) and
+# signed with its private key; this service only needs the public JWKS.
+# BOOKS_JWKS_FILE reads the key set from disk instead of over HTTP.
+JWKS_URL = os.environ.get('BOOKS_JWKS_URL', 'http://localhost:5000/.well-known/jwks.json')
+JWKS_FILE = os.environ.get('BOOKS_JWKS_FILE')
+JWKS_REFRESH_SECONDS = _env_float('BOOKS_JWKS_REFRESH_SECONDS', 300.0)
+JWKS_MIN_REFRESH_SECONDS = _env_float('BOOKS_JWKS_MIN_REFRESH_SECONDS', 30.0)
+
+# Catalog change feed (changes.py): SSE streams poll for writes made by other
+# workers every CHANGES_POLL_SECONDS and close after CHANGES_STREAM_MAX_SECONDS
+CHANGES_MAX_LIMIT = 1000
+CHANGES_POLL_SECONDS = _env_float('BOOKS_CHANGES_POLL_SECONDS', 1.0)
+CHANGES_STREAM_MAX_SECONDS = _env_float('BOOKS_CHANGES_STREAM_MAX_SECONDS', 300.0)
+
+# Autocomplete (suggest.py): changed books are overlaid on the in-memory
+# index until SUGGEST_OVERLAY_MAX of them accumulate, then it is rebuilt.
+# Other workers' writes are read from the change log every SUGGEST_SYNC_SECONDS.
+# A snapshot older than SUGGEST_REFRESH_SECONDS is rebuilt (refreshing author
+# and category counts) once the catalog has changed since it was loaded.
+SUGGEST_OVERLAY_MAX = _env_int('BOOKS_SUGGEST_OVERLAY_MAX', 2000)
+SUGGEST_SYNC_SECONDS = _env_float('BOOKS_SUGGEST_SYNC_SECONDS', 2.0)
+SUGGEST_REFRESH_SECONDS = _env_float('BOOKS_SUGGEST_REFRESH_SECONDS', 300.0)
+SUGGEST_MAX_LIMIT = 50
+
+# Rate limiting (rate_limit.py): a token bucket per client and route group.
+# Clients are keyed by admin token email when one is presented, otherwise by
+# remote address. With RATE_LIMIT_DB set, buckets live in that SQLite file
+# and are shared by all workers; otherwise each worker keeps its own.
+RATE_LIMITS = {
+    'preview': _env_rate('BOOKS_RATE_PREVIEW', '2/20'),
+    'download': _env_rate('BOOKS_RATE_DOWNLOAD', '0.5/5'),
+    'search': _env_rate('BOOKS_RATE_SEARCH', '5/30'),
+    'suggest': _env_rate('BOOKS_RATE_SUGGEST', '20/60'),
+}
+RATE_LIMIT_ENABLED = _env_bool('BOOKS_RATE_LIMIT', True)
+RATE_LIMIT_DB = os.environ.get('BOOKS_RATE_LIMIT_DB')
+# Number of reverse proxies in front of the service. Behind a proxy every
+# request arrives from the proxy's address, so anonymous clients would share
+# one bucket; with TRUSTED_PROXIES set to N, the client address is taken from
+# the Nth entry from the right of X-Forwarded-For (werkzeug's ProxyFix). Leave
+# it at 0 when clients connect directly, or they could pick their own key.
+TRUSTED_PROXIES = _env_int('BOOKS_TRUSTED_PROXIES', 0)
+RENDERS_PER_CLIENT = _env_int('BOOKS_RENDERS_PER_CLIENT', 2)
+PREVIEW_MAX_SCALE = _env_float('BOOKS_PREVIEW_MAX_SCALE', 3.0)
+
+# Render admission (render_budget.py). Previews render at PREVIEW_DPI x scale.
+# Each render reserves its estimated peak memory from a per-worker budget of
+# RENDER_MEMORY_BUDGET_MB (so a host needs about workers x budget), waiting
+# up to RENDER_QUEUE_TIMEOUT_SECONDS for room. One render may use at most
+# RENDER_MAX_JOB_MB; bigger requests are downscaled, or with
+# RENDER_OVERSIZE='tile' redirected to a tile manifest.
+PREVIEW_DPI = 200
+RENDER_MEMORY_BUDGET_MB = _env_int('BOOKS_RENDER_MEMORY_BUDGET_MB', 512)
+RENDER_MAX_JOB_MB = _env_int('BOOKS_RENDER_MAX_JOB_MB', 128)
+RENDER_BYTES_PER_PIXEL = 12
+RENDER_QUEUE_TIMEOUT_SECONDS = _env_float('BOOKS_RENDER_QUEUE_TIMEOUT_SECONDS', 10.0)
+RENDER_OVERSIZE = os.environ.get('BOOKS_RENDER_OVERSIZE', 'downscale')
+RENDER_TILE_SIZE = _env_int('BOOKS_RENDER_TILE_SIZE', 1024)
+
+# Render scheduling (render_budget.py): at most RENDER_SLOTS renders run at
+# once per worker, admitted in weighted fair order across priority classes
+# and (client, book) flows. Prefetch and batch renders are held back, and
+# preempted for waiting interactive ones, while interactive p95 latency over
+# the last RENDER_P95_WINDOW_SECONDS is above the target.
+RENDER_SLOTS = _env_int('BOOKS_RENDER_SLOTS', 2)
+RENDER_PRIORITY_WEIGHTS = {'interactive': 8, 'prefetch': 2, 'batch': 1}
+RENDER_INTERACTIVE_P95_TARGET_SECONDS = _env_float('BOOKS_RENDER_INTERACTIVE_P95_TARGET_SECONDS', 2.0)
+RENDER_P95_WINDOW_SECONDS = 60
+
+# Render deadlines and cancellation (render_jobs.py): a renderer process
+# running past RENDER_TIMEOUT_SECONDS is killed; queued and running renders
+# check for a disconnected or superseded client every RENDER_POLL_SECONDS
+RENDER_TIMEOUT_SECONDS = _env_float('BOOKS_RENDER_TIMEOUT_SECONDS', 30.0)
+RENDER_POLL_SECONDS = 0.1
+
+# Production serving (serve.py). Rendering is CPU bound, so the default is one
+# worker per core with a few threads each for I/O-bound routes
+SERVER_BIND = os.environ.get('BOOKS_BIND', '0.0.0.0:3000')
+SERVER_WORKERS = _env_int('BOOKS_WORKERS', os.cpu_count() or 1)
+SERVER_THREADS = _env_int('BOOKS_THREADS', 4)
+SERVER_TIMEOUT = _env_int('BOOKS_TIMEOUT', 60)
+SERVER_GRACEFUL_TIMEOUT = _env_int('BOOKS_GRACEFUL_TIMEOUT', 30)
+SERVER_KEEPALIVE = _env_int('BOOKS_KEEPALIVE', 5)
+SERVER_MAX_REQUESTS = _env_int('BOOKS_MAX_REQUESTS', 0)
+SERVER_MAX_REQUESTS_JITTER = _env_int('BOOKS_MAX_REQUESTS_JITTER', 0)
+# Every open change stream (changes.py) holds one of a worker's threads, so
+# at most CHANGES_MAX_STREAMS are served per worker; by default half of them
+CHANGES_MAX_STREAMS = _env_int('BOOKS_CHANGES_MAX_STREAMS', max(1, SERVER_THREADS // 2))
+
+# Logging (log_config.py). LOG_LEVELS sets per-module levels, e.g.
+# "main_2=WARNING,werkzeug=INFO". LOG_SAMPLE_RATE is the fraction of
+# high-volume per-request INFO lines that are kept.
+LOG_LEVEL = os.environ.get('BOOKS_LOG_LEVEL', 'INFO')
+LOG_LEVELS = os.environ.get('BOOKS_LOG_LEVELS', '')
+LOG_FILE = os.environ.get('BOOKS_LOG_FILE', 'app_logs/app.log')
+LOG_JSON = _env_bool('BOOKS_LOG_JSON')
+LOG_SAMPLE_RATE = _env_float('BOOKS_LOG_SAMPLE_RATE', 1.0)
+
+# Profiling (profiling.py). Nothing is installed unless PROFILING_ENABLED is
+# set; an admin then opts a single request in with the X-Profile header
+# ("cpu" for cProfile, "sample" for folded stacks)
+PROFILING_ENABLED = _env_bool('BOOKS_PROFILING')
+PROFILE_DIR = os.environ.get('BOOKS_PROFILE_DIR', 'app_logs/profiles')
+PROFILE_SAMPLE_INTERVAL_MS = _env_float('BOOKS_PROFILE_SAMPLE_INTERVAL_MS', 5)
+TRACEMALLOC_FRAMES = _env_int('BOOKS_TRACEMALLOC_FRAMES', 0)
+
+# SQLite statement tracing (query_trace.py). Statement totals per worker are
+# listed at /api/v1/admin/queries, and statements slower than QUERY_SLOW_MS
+# are logged with their query plan. With QUERY_BUDGET_STRICT a route that
+# issues more queries than its @query_budget fails instead of logging a
+# warning; set it for test runs. Tracing costs a little on every statement,
+# so it is off unless asked for, and query budgets are only checked with it on
+# (the test suite turns both on).
+QUERY_TRACE_ENABLED = _env_bool('BOOKS_QUERY_TRACE')
+QUERY_SLOW_MS = _env_float('BOOKS_QUERY_SLOW_MS', 100)
+QUERY_BUDGET_STRICT = _env_bool('BOOKS_QUERY_BUDGET_STRICT')
+QUERY_TRACE_MAX_STATEMENTS = _env_int('BOOKS_QUERY_TRACE_MAX_STATEMENTS', 1000)
@@ -0,0 +1,121 @@
+# covers.py
+# Cover thumbnails rendered from page 0 of each book's PDF. Every book gets a
+# WebP per COVER_WIDTHS entry plus a tiny blurred placeholder (a data: URI
+# stored on the book row) that the card grid can paint before any image
+# request completes.
+#
+# Backfill existing books:  python covers.py [--all]
+import io
+import os
+import sys
+import base64
+import hashlib
+import logging
+import argparse
+import traceback
+from config import COVER_DIR, COVER_WIDTHS, COVER_PLACEHOLDER_WIDTH, COVER_QUALITY, RENDER_TIMEOUT_SECONDS
+from main_2 import DatabaseManager
+from pdf_store import pdf_file
+from metrics import COVER_RENDER_SECONDS
+
+logger = logging.getLogger(__name__)
+
+def pick_width(requested):
+    # Smallest generated width that covers the request, else the largest
+    for width in COVER_WIDTHS:
+        if requested <= width:
+            return width
+    return COVER_WIDTHS[-1]
+
+def cover_path(book_id, width):
+    return os.path.join(COVER_DIR, str(book_id), f'{width}.webp')
+
+def _encode(image, quality):
+    buffer = io.BytesIO()
+    image.save(buffer, format='WEBP', quality=quality, method=4)
+    return buffer.getvalue()
+
+def render_covers(pdf_path):
+    # Imported here so that importing covers (main does, for cover_path)
+    # does not load the imaging stack
+    from pdf2image import convert_from_path
+    from PIL import Image, ImageFilter
+
+    # Rasterize straight at the largest cover width rather than at full page
+    # resolution and scaling down afterwards
+    with COVER_RENDER_SECONDS.time(stage='rasterize'):
+        pages = convert_from_path(
+            pdf_path, first_page=1, last_page=1, size=(COVER_WIDTHS[-1], None), timeout=RENDER_TIMEOUT_SECONDS
+        )
+    if not pages:
+        raise ValueError(f"No pages rendered from {pdf_path}")
+    page = pages[0].convert('RGB')
+
+    covers = {}
+    for width in COVER_WIDTHS:
+        height = max(1, round(page.height * width / page.width))
+        with COVER_RENDER_SECONDS.time(stage='resize'):
+            image = page if width == page.width else page.resize((width, height), Image.LANCZOS)
+        with COVER_RENDER_SECONDS.time(stage='encode'):
+            covers[width] = _encode(image, COVER_QUALITY)
+
+    height = max(1, round(page.height * COVER_PLACEHOLDER_WIDTH / page.width))
+    tiny = page.resize((COVER_PLACEHOLDER_WIDTH, height), Image.BILINEAR).filter(ImageFilter.GaussianBlur(1))
+    placeholder = 'data:image/webp;base64,' + base64.b64encode(_encode(tiny, 30)).decode('ascii')
+
+    version = hashlib.sha256(covers[COVER_WIDTHS[-1]]).hexdigest()[:16]
+    return covers, placeholder, version
+
+def generate_covers(book):
+    with pdf_file(book) as pdf_path:
+        covers, placeholder, version = render_covers(pdf_path)
+    os.makedirs(os.path.dirname(cover_path(book.id, COVER_WIDTHS[0])), exist_ok=True)
+    for width, data in covers.items():
+        # Write then rename so a concurrent request never serves a partial file
+        path = cover_path(book.id, width)
+        with open(path + '.tmp', 'wb') as f:
+            f.write(data)
+        os.replace(path + '.tmp', path)
+
+    DatabaseManager.set_cover(book.id, placeholder, version)
+    book.cover_placeholder, book.cover_version = placeholder, version
+    logger.info("Generated covers %s for book %s", version, book.id)
+    return version
+
+def remove_covers(book_id):
+    # Drops the files only; the row's cover_version is reset by the
+    # books_covers_reset trigger when the book's PDF changes
+    for width in COVER_WIDTHS:
+        try:
+            os.remove(cover_path(book_id, width))
+        except FileNotFoundError:
+            pass
+
+def ingest_covers(missing_only=True):
+    generated = failed = 0
+    for book in DatabaseManager.get_all_books():
+        if missing_only and book.cover_version:
+            continue
+        try:
+            generate_covers(book)
+            generated += 1
+        except Exception as e:
+            failed += 1
+            logger.error("Cover generation failed for book %s: %s", book.id, e)
+            logger.error(traceback.format_exc())
+    return generated, failed
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate cover thumbnails for the catalog")
+    parser.add_argument('--all', action='store_true', help="Regenerate covers that already exist")
+    args = parser.parse_args(argv)
+
+    from log_config import configure_logging
+    configure_logging()
+    DatabaseManager.init_db()
+    generated, failed = ingest_covers(missing_only=not args.all)
+    print(f"Generated covers for {generated} books ({failed} failed)")
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,319 @@
+# library_watcher.py
+# Keeps the catalog in step with the PDF files under LIBRARY_DIR. When a PDF
+# is added, replaced or removed, the books whose pdf_path points at it get the
+# new content stored (pdf_sha256) and their page_count and page sizes
+# refreshed, and only their generated covers are dropped; nothing else is
+# touched.
+#
+# Changes are detected by size and mtime, then confirmed by hashing, so a
+# touched but unchanged file costs one hash and no writes. Books are linked
+# to every file seen, changed or not, so a book added after its PDF was
+# first indexed is picked up by the next scan. The last known
+# state of every file is kept in the pdf_files table: a restart re-stats the
+# library but only re-hashes what differs. inotify (Linux, through libc) is
+# used when available; elsewhere, or if it cannot be set up, the library is
+# polled every WATCH_POLL_SECONDS.
+#
+#   python library_watcher.py            watch until interrupted
+#   python library_watcher.py --once     reconcile once and exit
+import os
+import sys
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+import logging
+import argparse
+import traceback
+from config import LIBRARY_DIR, WATCH_POLL_SECONDS, WATCH_DEBOUNCE_SECONDS, WATCH_RESCAN_SECONDS
+from main_2 import DatabaseManager
+from covers import remove_covers
+from page_sizes import read_page_sizes, page_count
+import pdf_store
+
+logger = logging.getLogger(__name__)
+
+# pdf_path spellings looked up per query when linking books to files
+LINK_BATCH = 500
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+              | IN_DELETE_SELF | IN_MOVE_SELF)
+_EVENT_HEADER = struct.Struct('iIII')
+
+class Inotify:
+    # Recursive watch on a directory tree. Raises OSError when inotify is
+    # not available (not Linux, or out of watches).
+    def __init__(self):
+        libc_name = ctypes.util.find_library('c')
+        if not sys.platform.startswith('linux') or not libc_name:
+            raise OSError(errno.ENOSYS, "inotify is only available on Linux")
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._paths = {}
+
+    def add_watch(self, path):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {path}")
+        self._paths[wd] = path
+
+    def watch_tree(self, root):
+        for directory, _, _ in os.walk(root):
+            self.add_watch(directory)
+
+    def read(self, timeout):
+        # Returns [(path, mask)]; an overflow is reported as (None, IN_Q_OVERFLOW)
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+
+        events, offset = [], 0
+        while offset < len(data):
+            wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                events.append((None, mask))
+                continue
+            directory = self._paths.get(wd)
+            if mask & IN_IGNORED:
+                self._paths.pop(wd, None)
+                continue
+            if directory is not None:
+                events.append((os.path.join(directory, os.fsdecode(name)) if name else directory, mask))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+def _read_page_sizes(path):
+    try:
+        return read_page_sizes(path)
+    except Exception as e:
+        logger.warning("Could not read pages of %s: %s", path, e)
+        return None
+
+class LibraryWatcher:
+    def __init__(self, root=LIBRARY_DIR):
+        self.root = root
+        # {path relative to root: (size, mtime_ns, sha256, page_count)}
+        self.state = DatabaseManager.get_pdf_files()
+
+    def _relative(self, path):
+        return os.path.relpath(path, self.root)
+
+    def _spellings(self, relative):
+        # The ways a book's pdf_path may refer to this file
+        path = os.path.normpath(os.path.join(self.root, relative))
+        return sorted({path, os.path.abspath(path), os.path.join('.', path)})
+
+    def _books_by_file(self, relatives):
+        # {relative: [books whose pdf_path names the file]}
+        spelled = {spelling: relative for relative in relatives for spelling in self._spellings(relative)}
+        paths, found = sorted(spelled), {}
+        for offset in range(0, len(paths), LINK_BATCH):
+            for book in DatabaseManager.find_books_by_pdf_paths(paths[offset:offset + LINK_BATCH]):
+                found.setdefault(spelled[book.pdf_path], []).append(book)
+        return found
+
+    def scan(self):
+        # Full reconcile: stats every PDF, hashes only the ones that differ.
+        # A missing root (say, an unmounted volume) is an error rather than
+        # every file having been removed.
+        if not os.path.isdir(self.root):
+            raise FileNotFoundError(f"Library directory not found: {self.root}")
+        seen, candidates = set(), []
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                if not name.lower().endswith('.pdf'):
+                    continue
+                relative = self._relative(os.path.join(directory, name))
+                seen.add(relative)
+                candidates.append(relative)
+        candidates.extend(relative for relative in self.state if relative not in seen)
+        return self.check(candidates)
+
+    def check(self, relatives):
+        changed, removed, unchanged = [], [], []
+        for relative in set(relatives):
+            path = os.path.join(self.root, relative)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                if relative in self.state:
+                    removed.append(relative)
+                continue
+            known = self.state.get(relative)
+            if known is None or known[:2] != (stat.st_size, stat.st_mtime_ns):
+                changed.append(relative)
+            else:
+                unchanged.append(relative)
+        return self.process(changed, removed, unchanged)
+
+    def process(self, changed, removed, unchanged=()):
+        # unchanged files are not hashed again, only linked to their books
+        start = time.perf_counter()
+        saved, replaced, sizes = {}, {}, {}
+        # {relative: (sha256, page_count)} of every file whose books are linked
+        linked = {relative: self.state[relative][2:] for relative in unchanged}
+        for relative in changed:
+            path = os.path.join(self.root, relative)
+            try:
+                before = os.stat(path)
+                digest = pdf_store.hash_file(path)
+                after = os.stat(path)
+            except FileNotFoundError:
+                if relative in self.state:
+                    removed.append(relative)
+                continue
+            if (before.st_size, before.st_mtime_ns) != (after.st_size, after.st_mtime_ns):
+                # Still being written; the next event or scan picks it up
+                continue
+
+            known = self.state.get(relative)
+            if known is not None and known[2] == digest:
+                # Touched, not changed: the recorded stat moves, and books
+                # still get linked below
+                saved[relative] = (after.st_size, after.st_mtime_ns, digest, known[3])
+            else:
+                runs = _read_page_sizes(path)
+                if runs is not None:
+                    sizes[digest] = runs
+                saved[relative] = (after.st_size, after.st_mtime_ns, digest, page_count(runs) if runs else None)
+                replaced[relative] = digest
+            linked[relative] = saved[relative][2:]
+
+        updates, rendered = [], []
+        for relative, books in self._books_by_file(linked).items():
+            digest, pages = linked[relative]
+            # Content is stored the first time a book points at it
+            if not pdf_store.exists(digest):
+                pdf_store.put_file(os.path.join(self.root, relative))
+            for book in books:
+                if book.pdf_sha256 != digest or book.page_count != pages:
+                    updates.append({'id': book.id, 'pdf_sha256': digest, 'page_count': pages})
+                if book.pdf_sha256 != digest:
+                    rendered.append(book.id)
+
+        for relative in removed:
+            for book in DatabaseManager.find_books_by_pdf_paths(self._spellings(relative)):
+                # Stored content keeps being served; without it the book has no PDF
+                logger.warning("PDF for book %s was removed: %s%s", book.id, relative,
+                               '' if book.pdf_sha256 else ' (no stored copy)')
+
+        if saved or removed:
+            DatabaseManager.save_pdf_files(saved, removed)
+        if sizes:
+            DatabaseManager.save_page_sizes(sizes)
+        if updates:
+            DatabaseManager.bulk_update_books(updates)
+        for book_id in rendered:
+            remove_covers(book_id)
+
+        self.state.update(saved)
+        for relative in removed:
+            self.state.pop(relative, None)
+        if replaced or removed or updates:
+            logger.info("Library sync: %s changed, %s removed, %s books updated in %.2fs",
+                        len(replaced), len(removed), len(updates), time.perf_counter() - start)
+        return len(replaced), len(removed), len(updates)
+
+    def run(self):
+        try:
+            notifier = Inotify()
+            notifier.watch_tree(self.root)
+        except OSError as e:
+            logger.warning("inotify unavailable (%s); polling %s every %ss", e, self.root, WATCH_POLL_SECONDS)
+            notifier = None
+
+        # A missing root or locked database must not end the watcher before it
+        # starts; the next poll or rescan retries
+        self._safely(self.scan)
+        if notifier is None:
+            while True:
+                time.sleep(WATCH_POLL_SECONDS)
+                self._safely(self.scan)
+
+        logger.info("Watching %s for PDF changes", self.root)
+        pending, last_event, last_scan = set(), 0.0, time.monotonic()
+        while True:
+            timeout = WATCH_DEBOUNCE_SECONDS if pending else WATCH_RESCAN_SECONDS
+            full_scan = False
+            for path, mask in notifier.read(timeout):
+                last_event = time.monotonic()
+                if mask & IN_Q_OVERFLOW:
+                    logger.warning("inotify queue overflowed; rescanning %s", self.root)
+                    full_scan = True
+                elif mask & IN_ISDIR:
+                    if mask & (IN_CREATE | IN_MOVED_TO):
+                        # Files may have landed before the watch was added
+                        self._safely(notifier.watch_tree, path)
+                        full_scan = True
+                    elif mask & (IN_DELETE | IN_MOVED_FROM):
+                        prefix = self._relative(path) + os.sep
+                        pending.update(relative for relative in self.state if relative.startswith(prefix))
+                elif mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                    full_scan = True
+                elif path.lower().endswith('.pdf') and not mask & IN_CREATE:
+                    # IN_CREATE is followed by IN_CLOSE_WRITE once the file is complete
+                    pending.add(self._relative(path))
+
+            now = time.monotonic()
+            if full_scan or now - last_scan >= WATCH_RESCAN_SECONDS:
+                pending.clear()
+                last_scan = now
+                self._safely(self.scan)
+            elif pending and now - last_event >= WATCH_DEBOUNCE_SECONDS:
+                batch, pending = pending, set()
+                self._safely(self.check, batch)
+
+    def _safely(self, function, *args):
+        try:
+            function(*args)
+        except Exception as e:
+            logger.error("Library watcher error: %s", e)
+            logger.error(traceback.format_exc())
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sync the catalog with the PDF library directory")
+    parser.add_argument('--dir', default=LIBRARY_DIR, help="Library directory (default: %(default)s)")
+    parser.add_argument('--once', action='store_true', help="Reconcile once and exit")
+    args = parser.parse_args(argv)
+
+    from log_config import configure_logging
+    configure_logging()
+    DatabaseManager.init_db()
+    watcher = LibraryWatcher(args.dir)
+    if args.once:
+        changed, removed, updated = watcher.scan()
+        print(f"{changed} PDFs changed, {removed} removed, {updated} books updated")
+        return 0
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,134 @@
+# log_config.py
+import os
+import sys
+import atexit
+import json
+import queue
+import random
+import logging
+import logging.handlers
+from config import LOG_LEVEL, LOG_LEVELS, LOG_FILE, LOG_JSON, LOG_SAMPLE_RATE
+
+# Pass as extra= on high-volume INFO lines (per-request chatter) so they are
+# subject to LOG_SAMPLE_RATE. Warnings and errors are never sampled.
+SAMPLED = {'sampled': True}
+
+CONSOLE_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+FILE_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'sampled'}
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        # Anything passed through extra= becomes a top-level field
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+class SamplingFilter(logging.Filter):
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if record.levelno > logging.INFO or not getattr(record, 'sampled', False):
+            return True
+        return self.rate >= 1.0 or random.random() < self.rate
+
+class _RequestQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        # Only merge the arguments into the message here (they may be mutated
+        # after the call returns); the stock prepare() also runs the formatter
+        # and copies the record, which is the listener's job
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+_queue_handler = None
+_listener = None
+_output_handlers = []
+
+def _parse_levels(spec):
+    levels = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        name, _, level = item.partition('=')
+        levels[name.strip()] = level.strip().upper()
+    return levels
+
+def _start_listener():
+    global _listener
+    _queue_handler.queue = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(
+        _queue_handler.queue, *_output_handlers, respect_handler_level=True
+    )
+    _listener.start()
+
+def configure_logging(level=LOG_LEVEL, levels=LOG_LEVELS, log_file=LOG_FILE,
+                      json_output=LOG_JSON, sample_rate=LOG_SAMPLE_RATE, console=True):
+    global _queue_handler
+    if _queue_handler is not None:
+        return
+
+    log_dir = os.path.dirname(log_file)
+    if log_dir:
+        os.makedirs(log_dir, exist_ok=True)
+
+    file_handler = logging.FileHandler(log_file, mode='a')
+    file_handler.setFormatter(JsonFormatter() if json_output else logging.Formatter(FILE_FORMAT))
+
+    console_handler = logging.StreamHandler(sys.stderr)
+    console_handler.setLevel(logging.INFO)
+    console_handler.setFormatter(logging.Formatter(CONSOLE_FORMAT))
+
+    _output_handlers[:] = [file_handler, console_handler] if console else [file_handler]
+
+    # Request threads only enqueue records; formatting for output and all file
+    # I/O happen on the listener thread
+    _queue_handler = _RequestQueueHandler(queue.SimpleQueue())
+    if sample_rate < 1.0:
+        _queue_handler.addFilter(SamplingFilter(sample_rate))
+
+    root = logging.getLogger()
+    root.handlers[:] = [_queue_handler]
+    root.setLevel(level.upper())
+    for name, module_level in _parse_levels(levels).items():
+        logging.getLogger(name).setLevel(module_level)
+
+    _start_listener()
+
+def queue_depth():
+    return _queue_handler.queue.qsize() if _queue_handler is not None else 0
+
+@atexit.register
+def stop_logging():
+    # Flushes everything still queued and detaches the handlers, after which
+    # configure_logging may be called again
+    global _listener, _queue_handler
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+    if _queue_handler is not None:
+        logging.getLogger().removeHandler(_queue_handler)
+        _queue_handler = None
+    for handler in _output_handlers:
+        handler.close()
+    _output_handlers.clear()
+
+def _restart_after_fork():
+    # The listener thread does not survive fork; give each child its own
+    # queue and listener so logs from forked workers are not lost
+    global _listener
+    if _queue_handler is not None:
+        _listener = None
+        _start_listener()
+
+os.register_at_fork(after_in_child=_restart_after_fork)
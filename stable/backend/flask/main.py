@@ -1,131 +1,455 @@
 # main.py
+import time
+_import_started = time.perf_counter()
 import logging
+import sqlite3
 import traceback
-from flask import Flask, jsonify, send_file, abort, request
+from flask import Flask, Response, jsonify, send_file, abort, request, redirect, url_for
 from flask_cors import CORS
+from werkzeug.exceptions import HTTPException, ServiceUnavailable
+from werkzeug.middleware.proxy_fix import ProxyFix
 import os
 from preview import PDFPreview
+from page_sizes import page_sizes_for, page_size
+import render_budget
+from render_budget import RenderBusy
+from render_jobs import render_job, RenderCancelled, RenderTimeout
 from main_2 import DatabaseManager, Book
-
-# Configure logging
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    filename='app_logs/app_errors.log',
-    filemode='a'
+from auth import require_admin, key_set
+from covers import pick_width, cover_path, generate_covers
+import pdf_store
+from storage import StorageUnavailable
+from log_config import configure_logging, queue_depth, SAMPLED
+import metrics
+import profiling
+import query_trace
+from query_trace import query_budget
+from rate_limit import rate_limited, render_slot, client_key
+from config import (
+    PREVIEW_MAX_SCALE, SUGGEST_MAX_LIMIT, CHANGES_MAX_LIMIT, REVIEWS_MAX_LIMIT, RENDER_OVERSIZE,
+    RENDER_TILE_SIZE, COVER_WIDTHS, TRUSTED_PROXIES
 )
-logger = logging.getLogger(__name__)
+import suggest
+import changes
 
-# Console handler for immediate visibility
-console_handler = logging.StreamHandler()
-console_handler.setLevel(logging.INFO)
-formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-console_handler.setFormatter(formatter)
-logger.addHandler(console_handler)
+# Configure logging (queued; file I/O happens off the request thread)
+configure_logging()
+logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
+if TRUSTED_PROXIES:
+    # request.remote_addr (rate limit keys, logs) becomes the client address
+    # the trusted proxies report rather than the last proxy's
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXIES)
 CORS(app, resources={r"/api/v1/*": {"origins": "http://localhost:5173"}})
+metrics.init_app(app)
+metrics.register_queue_depth('log', queue_depth)
+profiling.init_app(app)
+query_trace.init_app(app)
+metrics.STARTUP_SECONDS.set(time.perf_counter() - _import_started, phase='import')
 
 # Routes
 @app.route('/api/v1/books/', methods=['GET'])
+@query_budget(3)
 def get_books():
+    filters = {
+        'category': request.args.get('category'),
+        'author': request.args.get('author'),
+        'year_from': request.args.get('year_from'),
+        'year_to': request.args.get('year_to'),
+        'sort': request.args.get('sort'),
+        'limit': request.args.get('limit'),
+        'offset': request.args.get('offset'),
+    }
+    for key in ('year_from', 'year_to', 'limit', 'offset'):
+        if filters[key] is not None:
+            try:
+                filters[key] = int(filters[key])
+            except ValueError:
+                abort(400, description=f"'{key}' must be an integer")
+    if filters['offset'] is None:
+        filters['offset'] = 0
+
     try:
-        logger.info("Fetching all books")
-        books = DatabaseManager.get_all_books()
+        logger.info("Fetching books", extra=SAMPLED)
+        books = DatabaseManager.find_books(**filters)
         return jsonify([book.to_dict() for book in books])
+    except ValueError as e:
+        abort(400, description=str(e))
     except Exception as e:
-        logger.error(f"Error fetching books: {str(e)}")
+        logger.error("Error fetching books: %s", e)
         logger.error(traceback.format_exc())
         abort(500, description="Internal server error while fetching books")
 
+# Delta sync: books changed since a catalog version (0 for everything)
+@app.route('/api/v1/books/changes', methods=['GET'])
+@query_budget(5)
+def get_book_changes():
+    since = request.args.get('since', 0, type=int)
+    limit = request.args.get('limit', 500, type=int)
+    if since < 0:
+        abort(400, description="'since' must be a non-negative integer")
+    if not 1 <= limit <= CHANGES_MAX_LIMIT:
+        abort(400, description=f"'limit' must be between 1 and {CHANGES_MAX_LIMIT}")
+
+    try:
+        return jsonify(DatabaseManager.get_changes(since, limit))
+    except ValueError as e:
+        abort(400, description=str(e))
+    except Exception as e:
+        logger.error("Error fetching changes since %s: %s", since, e)
+        logger.error(traceback.format_exc())
+        abort(500, description="Internal server error while fetching changes")
+
+# Later polls run while the response streams, outside the view's budget
+@app.route('/api/v1/books/changes/stream', methods=['GET'])
+@query_budget(1)
+def stream_book_changes():
+    since = request.args.get('since', type=int)
+    if since is None:
+        since = request.headers.get('Last-Event-ID', type=int)
+    if not changes.acquire_stream():
+        abort(503, description="Too many open change streams; poll /api/v1/books/changes instead",
+              retry_after=5)
+
+    try:
+        version = DatabaseManager.get_catalog_version()
+        response = Response(
+            changes.stream_versions(version, since),
+            mimetype='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        )
+    except Exception:
+        changes.release_stream()
+        raise
+    # The server closes the response when the stream ends or the client goes
+    # away, whether or not the generator ever ran
+    response.call_on_close(changes.release_stream)
+    return response
+
+@app.route('/api/v1/facets', methods=['GET'])
+@query_budget(5)
+def get_facets():
+    limit = request.args.get('limit', type=int)
+    try:
+        return jsonify(DatabaseManager.get_facets(limit))
+    except Exception as e:
+        logger.error("Error fetching facets: %s", e)
+        logger.error(traceback.format_exc())
+        abort(500, description="Internal server error while fetching facets")
+
+# Reviews, newest first. Pass the returned next_before to get the next page.
+@app.route('/api/v1/books/<int:book_id>/reviews', methods=['GET'])
+@query_budget(3)
+def get_book_reviews(book_id):
+    limit = request.args.get('limit', 20, type=int)
+    before = request.args.get('before', type=int)
+    if not 1 <= limit <= REVIEWS_MAX_LIMIT:
+        abort(400, description=f"'limit' must be between 1 and {REVIEWS_MAX_LIMIT}")
+
+    book = DatabaseManager.get_book_by_id(book_id)
+    if not book:
+        abort(404, description="Book not found")
+
+    reviews = DatabaseManager.get_book_reviews(book_id, limit=limit + 1, before=before)
+    has_more = len(reviews) > limit
+    reviews = reviews[:limit]
+    return jsonify({
+        "book_id": book_id,
+        "review_count": book.review_count,
+        "reviews": [review.to_dict() for review in reviews],
+        "next_before": reviews[-1].id if has_more else None,
+    })
+
 @app.route('/api/v1/books/<int:book_id>/download', methods=['GET'])
+@rate_limited('download')
+@query_budget(2)
 def download_pdf(book_id):
     try:
-        logger.info(f"Attempting to download PDF for book {book_id}")
+        logger.info("Attempting to download PDF for book %s", book_id, extra=SAMPLED)
         book = DatabaseManager.get_book_by_id(book_id)
         
         if not book:
-            logger.warning(f"Book not found for download: {book_id}")
+            logger.warning("Book not found for download: %s", book_id)
             abort(404, description="Book not found")
         
+        if pdf_store.exists(book.pdf_sha256):
+            logger.info("Downloading stored PDF: %s", book.pdf_sha256, extra=SAMPLED)
+            return pdf_store.pdf_response(
+                book.pdf_sha256, os.path.basename(book.pdf_path or f"{book.pdf_sha256}.pdf"),
+                as_attachment=True
+            )
+
         pdf_path = book.pdf_path
         
-        if not os.path.exists(pdf_path):
-            logger.error(f"PDF file not found: {pdf_path}")
+        if not pdf_path or not os.path.exists(pdf_path):
+            logger.error("PDF file not found: %s", pdf_path)
             abort(404, description="PDF file not found")
         
-        logger.info(f"Downloading PDF: {pdf_path}")
-        return send_file(pdf_path, as_attachment=True)
+        logger.info("Downloading PDF: %s", pdf_path, extra=SAMPLED)
+        return send_file(os.path.abspath(pdf_path), as_attachment=True, etag=True)
     
+    except (HTTPException, StorageUnavailable):
+        raise
     except Exception as e:
-        logger.error(f"Error downloading PDF for book {book_id}: {str(e)}")
+        logger.error("Error downloading PDF for book %s: %s", book_id, e)
         logger.error(traceback.format_exc())
         abort(500, description="Internal server error during PDF download")
 
+def render_priority():
+    # Scheduling class of this render (render_budget.py). Clients mark
+    # speculative fetches with ?priority=prefetch, or the browser does with
+    # Sec-Purpose / Purpose: prefetch.
+    priority = request.args.get('priority')
+    if priority is not None:
+        if priority not in render_budget.PRIORITIES:
+            abort(400, description=f"'priority' must be one of {', '.join(render_budget.PRIORITIES)}")
+        return priority
+    purpose = request.headers.get('Sec-Purpose') or request.headers.get('Purpose') or ''
+    return 'prefetch' if 'prefetch' in purpose else render_budget.INTERACTIVE
+
+def render_session(book_id):
+    # Which renders a new interactive render supersedes (render_jobs.py):
+    # those of the same viewer of the same book. A viewer is the view id a
+    # client sends (X-View-Id, or ?view= where headers cannot be set, one
+    # per open viewer), else a verified token. Addresses are shared behind
+    # NAT and proxies, so anonymous renders without a view id supersede
+    # nothing.
+    client = client_key()
+    view = request.headers.get('X-View-Id') or request.args.get('view')
+    if view:
+        if len(view) > 64:
+            abort(400, description="view id must be at most 64 characters")
+        return f"{client}:{view}:{book_id}"
+    if client.startswith('user:'):
+        return f"{client}:{book_id}"
+    return None
+
+def _preview_request(book_id):
+    # Validated (book, page, scale, page size in points) for the preview
+    # routes. Renders lease the PDF again (pdf_store.pdf_file) once admitted,
+    # as a cached copy may be evicted while they wait.
+    page = request.args.get('page', 0, type=int)
+    scale = request.args.get('scale', 1.0, type=float)
+    if page < 0:
+        abort(400, description="'page' must be a non-negative integer")
+    if not 0 < scale <= PREVIEW_MAX_SCALE:
+        abort(400, description=f"'scale' must be between 0 and {PREVIEW_MAX_SCALE}")
+
+    book = DatabaseManager.get_book_by_id(book_id)
+    if not book:
+        logger.warning("Book not found for preview: %s", book_id)
+        abort(404, description="Book not found")
+
+    with pdf_store.pdf_file(book) as pdf_path:
+        if not pdf_path or not os.path.exists(pdf_path):
+            logger.error("PDF file not found: %s", pdf_path)
+            abort(404, description="PDF file not found")
+        size = page_size(page_sizes_for(book, pdf_path), page)
+    if size is None:
+        abort(404, description=f"Page {page} not found")
+    return book, page, scale, size
+
 @app.route('/api/v1/books/<int:book_id>/preview', methods=['GET'])
+@rate_limited('preview')
+@query_budget(4)
 def get_pdf_preview(book_id):
     try:
-        logger.info(f"Attempting to get preview for book {book_id}")
-        book = DatabaseManager.get_book_by_id(book_id)
-        
-        if not book:
-            logger.warning(f"Book not found for preview: {book_id}")
-            abort(404, description="Book not found")
-        
-        pdf_path = book.pdf_path
-        
-        # Get query parameters
-        page = int(request.args.get('page', 0))
-        scale = float(request.args.get('scale', 1.0))
+        logger.info("Attempting to get preview for book %s", book_id, extra=SAMPLED)
+        book, page, scale, size = _preview_request(book_id)
+        priority = render_priority()
 
-        logger.info(f"Generating preview for {pdf_path}, page {page}, scale {scale}")
-        
-        # Generate preview
-        preview_image = PDFPreview.generate_preview(pdf_path, page, scale)
-        total_pages = PDFPreview.get_total_pages(pdf_path)
+        tile = request.args.get('tile')
+        crop = None
+        if tile is not None:
+            # One tile of the page at the requested scale, see /preview/tiles
+            try:
+                column, row = (int(part) for part in tile.split(','))
+            except ValueError:
+                abort(400, description="'tile' must be '<column>,<row>'")
+            crop = render_budget.tile_crop(size, scale, column, row)
+            if crop is None:
+                abort(404, description=f"Tile {tile} not found")
+            cost = render_budget.estimate_bytes(crop[2], crop[3])
+        elif render_budget.oversized(size, scale) and RENDER_OVERSIZE == 'tile':
+            return redirect(url_for('get_pdf_preview_tiles', book_id=book_id, page=page, scale=scale), 303)
+        else:
+            requested = scale
+            scale, cost = render_budget.plan(size, scale)
+            if scale != requested:
+                render_budget.RENDER_ADMISSIONS.inc(priority=priority, outcome='downscaled')
+                logger.info("Downscaled preview of book %s page %s from %s to %s", book_id, page, requested, scale)
+
+        logger.info("Generating preview for book %s, page %s, scale %s", book_id, page, scale, extra=SAMPLED)
+
+        # Generate preview. A newer interactive request from this viewer for
+        # another page or scale of the book cancels this one (render_jobs.py).
+        client = client_key()
+        interactive = priority == render_budget.INTERACTIVE
+        session = render_session(book_id) if interactive else None
+        try:
+            with render_job(session, (page, scale), request.environ) as job, \
+                    render_slot('preview' if interactive else f'preview-{priority}'), \
+                    render_budget.scheduler.reserve(cost, priority, (client, book_id), job), \
+                    pdf_store.pdf_file(book) as pdf_path:
+                preview_image = PDFPreview.generate_preview(pdf_path, page, scale, crop, job)
+        except RenderBusy as e:
+            abort(503, description=str(e), retry_after=5)
+        except RenderTimeout as e:
+            abort(504, description=str(e))
+        except RenderCancelled as e:
+            logger.info("Preview of book %s page %s cancelled: %s", book_id, page, e.reason, extra=SAMPLED)
+            if e.reason == 'preempted':
+                abort(503, description=str(e), retry_after=5)
+            # The client has moved on or gone; nobody reads this response
+            abort(409, description=str(e))
 
-        logger.info(f"Preview generated successfully for book {book_id}")
-        return send_file(
+        logger.info("Preview generated successfully for book %s", book_id, extra=SAMPLED)
+        response = send_file(
             preview_image, 
             mimetype='image/png',
             as_attachment=False
         )
+        response.headers['X-Preview-Scale'] = f'{scale:g}'
+        return response
 
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Error in get_pdf_preview for book {book_id}: {str(e)}")
+        logger.error("Error in get_pdf_preview for book %s: %s", book_id, e)
         logger.error(traceback.format_exc())
         abort(500, description=f"Internal server error generating preview: {str(e)}")
 
+@app.route('/api/v1/books/<int:book_id>/preview/tiles', methods=['GET'])
+@query_budget(4)
+def get_pdf_preview_tiles(book_id):
+    # Tile URLs covering one page at the requested scale; each tile renders
+    # within RENDER_MAX_JOB_MB however large the page is
+    book, page, scale, size = _preview_request(book_id)
+    width, height, columns, rows = render_budget.tile_grid(size, scale)
+    return jsonify({
+        "page": page,
+        "scale": scale,
+        "width": width,
+        "height": height,
+        "tile_size": RENDER_TILE_SIZE,
+        "tiles": [
+            {
+                "column": column,
+                "row": row,
+                "url": url_for('get_pdf_preview', book_id=book.id, page=page, scale=scale, tile=f"{column},{row}"),
+            }
+            for row in range(rows) for column in range(columns)
+        ],
+    })
+
 @app.route('/api/v1/books/<int:book_id>/page-count', methods=['GET'])
+@query_budget(3)
 def get_book_page_count(book_id):
     try:
-        logger.info(f"Retrieving page count for book {book_id}")
+        logger.info("Retrieving page count for book %s", book_id, extra=SAMPLED)
         book = DatabaseManager.get_book_by_id(book_id)
         
         if not book:
-            logger.warning(f"Book not found for page count: {book_id}")
+            logger.warning("Book not found for page count: %s", book_id)
             abort(404, description="Book not found")
         
-        pdf_path = book.pdf_path
-        total_pages = PDFPreview.get_total_pages(pdf_path)
+        # Indexed by library_watcher; older rows are counted on demand
+        total_pages = book.page_count
+        if total_pages is None:
+            with pdf_store.pdf_file(book) as pdf_path:
+                total_pages = PDFPreview.get_total_pages(pdf_path)
 
-        logger.info(f"Page count retrieved: {total_pages} for book {book_id}")
+        logger.info("Page count retrieved: %s for book %s", total_pages, book_id, extra=SAMPLED)
         return jsonify({"total_pages": total_pages})
 
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Error retrieving page count for book {book_id}: {str(e)}")
+        logger.error("Error retrieving page count for book %s: %s", book_id, e)
         logger.error(traceback.format_exc())
         abort(500, description="Internal server error retrieving page count")
 
+# Covers rasterize page 0 at the largest cover width; pages are rarely
+# taller than twice their width
+COVER_RENDER_BYTES = render_budget.estimate_bytes(COVER_WIDTHS[-1], 2 * COVER_WIDTHS[-1])
+
+@app.route('/api/v1/books/<int:book_id>/cover', methods=['GET'])
+@query_budget(3)
+def get_book_cover(book_id):
+    requested = request.args.get('w', 320, type=int)
+    book = DatabaseManager.get_book_by_id(book_id)
+    if not book:
+        abort(404, description="Book not found")
+
+    width = pick_width(requested)
+    path = cover_path(book.id, width)
+    if not book.cover_version or not os.path.exists(path):
+        # Not ingested yet: render on first request. Cards show the
+        # placeholder meanwhile, so this runs as background work.
+        try:
+            with render_budget.scheduler.reserve(COVER_RENDER_BYTES, 'batch', ('covers', book_id)):
+                generate_covers(book)
+        except RenderBusy as e:
+            abort(503, description=str(e), retry_after=5)
+        except Exception as e:
+            logger.error("Error generating cover for book %s: %s", book_id, e)
+            logger.error(traceback.format_exc())
+            abort(404, description="Cover not available")
+
+    # Versioned URLs (book.covers) never change content; anything else must
+    # revalidate against the ETag
+    versioned = request.args.get('v') == book.cover_version
+    response = send_file(
+        os.path.abspath(path), mimetype='image/webp', etag=book.cover_version, conditional=True,
+        max_age=31536000 if versioned else None
+    )
+    if versioned:
+        response.cache_control.immutable = True
+    return response
+
+# Content-addressed PDFs: the URL names the content, so it can be cached forever
+@app.route('/api/v1/pdfs/<digest>', methods=['GET'])
+@rate_limited('download')
+def get_pdf_by_digest(digest):
+    if not pdf_store.exists(digest):
+        abort(404, description="PDF not found")
+    response = pdf_store.pdf_response(digest, f"{digest}.pdf", max_age=31536000)
+    response.cache_control.immutable = True
+    return response
+
+@app.route('/api/v1/books/<int:book_id>/pdf', methods=['POST'])
+@require_admin
+@query_budget(3)
+def upload_pdf(book_id):
+    upload = request.files.get('file')
+    if upload is None:
+        abort(400, description="Multipart field 'file' is required")
+    if not DatabaseManager.get_book_by_id(book_id):
+        abort(404, description="Book not found")
+
+    try:
+        digest, stored = pdf_store.put_stream(upload.stream)
+        DatabaseManager.bulk_update_books([{'id': book_id, 'pdf_sha256': digest}])
+    except Exception as e:
+        logger.error("Error storing PDF for book %s: %s", book_id, e)
+        logger.error(traceback.format_exc())
+        abort(500, description="Internal server error storing PDF")
+
+    logger.info("PDF %s attached to book %s (%s)", digest, book_id, 'stored' if stored else 'deduplicated')
+    return jsonify({"sha256": digest, "deduplicated": not stored, "pdf_url": f"/api/v1/pdfs/{digest}"})
+
 # Advanced Search Route
 @app.route('/api/v1/books/search', methods=['GET'])
+@rate_limited('search')
+@query_budget(3)
 def search_books():
     try:
         query = request.args.get('q', '').strip()
-        logger.info(f"Search query received: {query}")
+        logger.info("Search query received: %s", query, extra=SAMPLED)
         
         if not query:
-            logger.info("Empty search query")
+            logger.info("Empty search query", extra=SAMPLED)
             return jsonify([])
         
         books = DatabaseManager.get_all_books()
@@ -138,27 +462,154 @@ def search_books():
                 query.lower() in book.category.lower())
         ]
         
-        logger.info(f"Search returned {len(filtered_books)} results")
+        logger.info("Search returned %s results", len(filtered_books), extra=SAMPLED)
         return jsonify([book.to_dict() for book in filtered_books])
 
     except Exception as e:
-        logger.error(f"Error in book search: {str(e)}")
+        logger.error("Error in book search: %s", e)
         logger.error(traceback.format_exc())
         abort(500, description="Internal server error during book search")
 
+# Autocomplete, served from the in-memory prefix index (suggest.py)
+@app.route('/api/v1/books/suggest', methods=['GET'])
+@rate_limited('suggest')
+# Served from memory; the index syncs with the catalog in the background
+@query_budget(0)
+def suggest_books():
+    prefix = request.args.get('prefix', '')
+    if not suggest.normalize(prefix):
+        abort(400, description="'prefix' must contain at least one letter or digit")
+    limit = request.args.get('limit', 8, type=int)
+    if not 1 <= limit <= SUGGEST_MAX_LIMIT:
+        abort(400, description=f"'limit' must be between 1 and {SUGGEST_MAX_LIMIT}")
+
+    result = suggest.index.suggest(prefix, limit)
+    if result is None:
+        abort(503, description="Suggestion index is still loading")
+    return jsonify(result)
+
+# Admin Bulk Edit Routes
+@app.route('/api/v1/books/batch', methods=['PATCH'])
+@require_admin
+# One UPDATE per distinct set of fields in the batch, plus cache refreshes
+@query_budget(8)
+def bulk_update_books():
+    payload = request.get_json(silent=True) or {}
+    updates = payload.get('updates')
+    if not isinstance(updates, list):
+        abort(400, description="Request body must contain an 'updates' list")
+
+    try:
+        updated = DatabaseManager.bulk_update_books(updates)
+    except (ValueError, sqlite3.IntegrityError) as e:
+        # Constraint failures roll the whole batch back; nothing was applied
+        abort(400, description=str(e))
+    except Exception as e:
+        logger.error("Error in bulk update: %s", e)
+        logger.error(traceback.format_exc())
+        abort(500, description="Internal server error during bulk update")
+
+    logger.info("Bulk update applied to %s books", updated)
+    return jsonify({"updated": updated})
+
+@app.route('/api/v1/books/batch/delete', methods=['POST'])
+@require_admin
+@query_budget(4)
+def bulk_delete_books():
+    payload = request.get_json(silent=True) or {}
+    book_ids = payload.get('ids')
+    if not isinstance(book_ids, list):
+        abort(400, description="Request body must contain an 'ids' list")
+
+    try:
+        deleted = DatabaseManager.bulk_delete_books(book_ids)
+    except (ValueError, sqlite3.IntegrityError) as e:
+        # Constraint failures roll the whole batch back; nothing was applied
+        abort(400, description=str(e))
+    except Exception as e:
+        logger.error("Error in bulk delete: %s", e)
+        logger.error(traceback.format_exc())
+        abort(500, description="Internal server error during bulk delete")
+
+    logger.info("Bulk delete removed %s books", deleted)
+    return jsonify({"deleted": deleted})
+
+# Prometheus scrape endpoint
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    return Response(metrics.render_metrics(), mimetype=metrics.CONTENT_TYPE)
+
 # Error Handlers with Detailed Logging
+@app.errorhandler(400)
+def bad_request(error):
+    logger.warning("Bad Request Error: %s", error)
+    return jsonify({
+        "error": "Bad Request",
+        "message": error.description
+    }), 400
+
+@app.errorhandler(401)
+def unauthorized(error):
+    logger.warning("Unauthorized Error: %s", error)
+    return jsonify({
+        "error": "Unauthorized",
+        "message": error.description
+    }), 401
+
+@app.errorhandler(429)
+def too_many_requests(error):
+    logger.warning("Too Many Requests: %s", error)
+    response = jsonify({
+        "error": "Too Many Requests",
+        "message": error.description
+    })
+    if getattr(error, 'retry_after', None):
+        response.headers['Retry-After'] = str(error.retry_after)
+    return response, 429
+
 @app.errorhandler(404)
 def not_found(error):
-    logger.warning(f"Not Found Error: {str(error)}")
+    logger.warning("Not Found Error: %s", error)
     return jsonify({
         "error": "Not Found",
         "message": str(error)
     }), 404
 
+@app.errorhandler(503)
+def service_unavailable(error):
+    logger.warning("Service Unavailable: %s", error)
+    response = jsonify({
+        "error": "Service Unavailable",
+        "message": error.description
+    })
+    response.headers['Retry-After'] = str(getattr(error, 'retry_after', None) or 5)
+    return response, 503
+
+@app.errorhandler(StorageUnavailable)
+def storage_unavailable(error):
+    # Raised outside pdf_response, e.g. by pdf_store.exists()
+    logger.warning("PDF storage unavailable: %s", error)
+    return service_unavailable(ServiceUnavailable(description="PDF storage is unavailable"))
+
+@app.errorhandler(409)
+def conflict(error):
+    return jsonify({
+        "error": "Conflict",
+        "message": error.description
+    }), 409
+
+@app.errorhandler(504)
+def gateway_timeout(error):
+    logger.warning("Gateway Timeout: %s", error)
+    return jsonify({
+        "error": "Gateway Timeout",
+        "message": error.description
+    }), 504
+
 @app.errorhandler(500)
 def server_error(error):
-    logger.error(f"Internal Server Error: {str(error)}")
-    logger.error(f"Traceback: {traceback.format_exc()}")
+    logger.error("Internal Server Error: %s", error)
+    logger.error("Traceback: %s", traceback.format_exc())
     return jsonify({
         "error": "Internal Server Error",
         "message": "An unexpected error occurred"
@@ -167,19 +618,32 @@ def server_error(error):
 # Initialization Function
 def initialize_app():
     try:
-        # Ensure logs directory exists
-        os.makedirs('app_logs', exist_ok=True)
-        
+        started = time.perf_counter()
         logger.info("Initializing application")
         DatabaseManager.init_db()
         DatabaseManager.insert_sample_data()
-        logger.info("Application initialization complete")
+        if not PDFPreview.renderer_available():
+            # The catalog still works; only previews fail
+            logger.error("pdftoppm not found on PATH: install poppler-utils, or every preview will fail")
+        elapsed = time.perf_counter() - started
+        metrics.STARTUP_SECONDS.set(elapsed, phase='init')
+        logger.info("Application initialization complete in %.3fs", elapsed)
     except Exception as e:
-        logger.error(f"Initialization error: {str(e)}")
+        logger.error("Initialization error: %s", e)
         logger.error(traceback.format_exc())
         raise
 
-# Main Execution
+# Per-process setup for forked workers (see serve.py). Anything holding
+# connections, threads or cached data must be created here, not in the parent
+def initialize_worker():
+    started = time.perf_counter()
+    DatabaseManager.invalidate_caches()
+    DatabaseManager.start_writer()
+    key_set.start()
+    suggest.index.start()
+    metrics.STARTUP_SECONDS.set(time.perf_counter() - started, phase='worker_init')
+
+# Main Execution (development server; use serve.py in production)
 if __name__ == '__main__':
     try:
         initialize_app()
@@ -190,5 +654,5 @@ if __name__ == '__main__':
             debug=True
         )
     except Exception as e:
-        logger.critical(f"Critical error starting application: {str(e)}")
+        logger.critical("Critical error starting application: %s", e)
         logger.critical(traceback.format_exc())
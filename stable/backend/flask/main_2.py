@@ -1,25 +1,45 @@
 # main_2.py
 import os
+import json
 import logging
 import traceback
 import sqlite3
 from typing import List, Optional
-
-# Configure logging
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    filename='app_logs/database_errors.log',
-    filemode='a'
+from config import (
+    DATABASE_PATH, DB_BUSY_TIMEOUT_MS, WRITE_GROUP_COMMIT_MS, WRITE_BATCH_MAX, COVER_WIDTHS,
+    REVIEW_PREVIEW_COUNT
 )
+from write_queue import create_write_queue
+from migrations import migrate, SCHEMA_VERSION
+from log_config import SAMPLED
+from metrics import observe_db, register_queue_depth
+from query_trace import CONNECTION_FACTORY
+
 logger = logging.getLogger(__name__)
 
-# Console handler for immediate visibility
-console_handler = logging.StreamHandler()
-console_handler.setLevel(logging.INFO)
-formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-console_handler.setFormatter(formatter)
-logger.addHandler(console_handler)
+# Columns that may be changed through update_book / bulk_update_books
+BOOK_UPDATABLE_FIELDS = (
+    'title', 'author', 'category', 'description', 'cover_image',
+    'publication_year', 'isbn', 'pdf_path', 'pdf_sha256', 'page_count'
+)
+# Value types accepted by bulk updates; the NOT NULL columns cannot be cleared
+BOOK_INTEGER_FIELDS = ('publication_year', 'page_count')
+BOOK_REQUIRED_FIELDS = ('title', 'author', 'category')
+
+# Sort orders accepted by find_books; id breaks ties so paging is stable
+BOOK_SORTS = {
+    'title': 'title ASC, id ASC',
+    '-title': 'title DESC, id DESC',
+    'author': 'author ASC, id ASC',
+    '-author': 'author DESC, id DESC',
+    'year': 'publication_year ASC, id ASC',
+    '-year': 'publication_year DESC, id DESC',
+}
+
+# Callables run after a write has been committed, used by anything that
+# caches catalog data to drop stale entries. Hooks receive the ids of the
+# books that changed, or None when anything may have changed.
+_cache_invalidation_hooks = []
 
 class Book:
     def __init__(self, row):
@@ -32,8 +52,26 @@ class Book:
         self.publication_year = row['publication_year']
         self.isbn = row['isbn']
         self.pdf_path = row['pdf_path']
+        self.cover_placeholder = row['cover_placeholder']
+        self.cover_version = row['cover_version']
+        self.pdf_sha256 = row['pdf_sha256']
+        self.review_count = row['review_count']
+        self.latest_review_id = row['latest_review_id']
+        # Filled in by library_watcher; None until the PDF has been indexed
+        self.page_count = row['page_count']
+        # Newest reviews only (at most REVIEW_PREVIEW_COUNT, none by default);
+        # the rest are paged through /api/v1/books/<id>/reviews
         self.reviews = []
 
+    def cover_urls(self):
+        # Versioned URLs are immutable: a new cover gets a new version
+        if not self.cover_version:
+            return None
+        return {
+            width: f"/api/v1/books/{self.id}/cover?w={width}&v={self.cover_version}"
+            for width in COVER_WIDTHS
+        }
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -44,6 +82,13 @@ class Book:
             'cover_image': self.cover_image,
             'publication_year': self.publication_year,
             'isbn': self.isbn,
+            'cover_placeholder': self.cover_placeholder,
+            'covers': self.cover_urls(),
+            'pdf_url': f"/api/v1/pdfs/{self.pdf_sha256}" if self.pdf_sha256 else None,
+            'page_count': self.page_count,
+            'review_count': self.review_count,
+            'latest_review_id': self.latest_review_id,
+            'reviews_url': f"/api/v1/books/{self.id}/reviews",
             'reviews': [review.to_dict() for review in self.reviews]
         }
 
@@ -63,54 +108,52 @@ class Review:
         }
 
 class DatabaseManager:
+    @staticmethod
+    def register_cache_invalidation_hook(hook):
+        _cache_invalidation_hooks.append(hook)
+        return hook
+
+    @staticmethod
+    def invalidate_caches(book_ids: Optional[List[int]] = None):
+        for hook in _cache_invalidation_hooks:
+            try:
+                hook(book_ids)
+            except Exception as e:
+                logger.error("Cache invalidation hook failed: %s", e)
+                logger.error(traceback.format_exc())
+
+    @staticmethod
+    def start_writer():
+        write_queue.start()
+
     @staticmethod
     def get_db_connection():
         try:
-            conn = sqlite3.connect('books.db')
+            conn = sqlite3.connect(
+                DATABASE_PATH, timeout=DB_BUSY_TIMEOUT_MS / 1000.0, factory=CONNECTION_FACTORY
+            )
             conn.row_factory = sqlite3.Row
             logger.debug("Database connection established")
             return conn
         except sqlite3.Error as e:
-            logger.error(f"Database connection error: {str(e)}")
+            logger.error("Database connection error: %s", e)
             logger.error(traceback.format_exc())
             raise
 
     @staticmethod
     def init_db():
         try:
-            logger.info("Initializing database")
             conn = DatabaseManager.get_db_connection()
-            cursor = conn.cursor()
-            
-            # Create Books Table
-            cursor.execute('''
-            CREATE TABLE IF NOT EXISTS books (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                title TEXT NOT NULL,
-                author TEXT NOT NULL,
-                category TEXT NOT NULL,
-                description TEXT,
-                cover_image TEXT,
-                publication_year INTEGER,
-                isbn TEXT,
-                pdf_path TEXT
-            )''')
-
-            # Create Reviews Table
-            cursor.execute('''
-            CREATE TABLE IF NOT EXISTS reviews (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                book_id INTEGER,
-                text TEXT NOT NULL,
-                author TEXT NOT NULL,
-                FOREIGN KEY(book_id) REFERENCES books(id)
-            )''')
-            
-            conn.commit()
-            conn.close()
-            logger.info("Database initialization complete")
+            try:
+                applied = migrate(conn)
+            finally:
+                conn.close()
+            if applied:
+                logger.info("Database schema migrated to version %s", applied[-1])
+            else:
+                logger.info("Database schema is current (version %s)", SCHEMA_VERSION)
         except Exception as e:
-            logger.error(f"Database initialization error: {str(e)}")
+            logger.error("Database initialization error: %s", e)
             logger.error(traceback.format_exc())
             raise
 
@@ -121,9 +164,10 @@ class DatabaseManager:
             conn = DatabaseManager.get_db_connection()
             cursor = conn.cursor()
 
-            # Check if books exist
-            cursor.execute("SELECT COUNT(*) FROM books")
-            if cursor.fetchone()[0] > 0:
+            # Check if books exist (EXISTS stops at the first row; COUNT(*)
+            # would scan the whole table on every start)
+            cursor.execute("SELECT EXISTS (SELECT 1 FROM books)")
+            if cursor.fetchone()[0]:
                 logger.info("Sample data already exists")
                 conn.close()
                 return
@@ -172,107 +216,431 @@ class DatabaseManager:
             conn.close()
             logger.info("Sample data insertion complete")
         except Exception as e:
-            logger.error(f"Sample data insertion error: {str(e)}")
+            logger.error("Sample data insertion error: %s", e)
             logger.error(traceback.format_exc())
             raise
 
     @staticmethod
-    def get_book_reviews(book_id: int) -> List[Review]:
+    @observe_db('get_book_reviews')
+    def get_book_reviews(book_id: int, limit: Optional[int] = None,
+                         before: Optional[int] = None) -> List[Review]:
+        # Newest first; `before` is the id of the last review already seen
         try:
-            logger.info(f"Retrieving reviews for book {book_id}")
+            logger.info("Retrieving reviews for book %s", book_id, extra=SAMPLED)
             conn = DatabaseManager.get_db_connection()
             cursor = conn.cursor()
-            
-            cursor.execute("SELECT * FROM reviews WHERE book_id = ?", (book_id,))
+
+            query = "SELECT id, book_id, text, author FROM reviews WHERE book_id = ?"
+            params = (book_id,)
+            if before is not None:
+                query += " AND id < ?"
+                params += (before,)
+            query += " ORDER BY id DESC"
+            if limit is not None:
+                query += " LIMIT ?"
+                params += (limit,)
+            cursor.execute(query, params)
             reviews = [Review(row) for row in cursor.fetchall()]
             
             conn.close()
-            logger.info(f"Retrieved {len(reviews)} reviews for book {book_id}")
+            logger.info("Retrieved %s reviews for book %s", len(reviews), book_id, extra=SAMPLED)
             return reviews
         except Exception as e:
-            logger.error(f"Error retrieving reviews for book {book_id}: {str(e)}")
+            logger.error("Error retrieving reviews for book %s: %s", book_id, e)
             logger.error(traceback.format_exc())
             return []
 
     @staticmethod
+    @observe_db('get_all_books')
     def get_all_books() -> List[Book]:
         try:
-            logger.info("Retrieving all books")
-            conn = DatabaseManager.get_db_connection()
+            logger.info("Retrieving all books", extra=SAMPLED)
+            books = DatabaseManager._query_books("", (), "", None, 0)
+            logger.info("Retrieved %s books", len(books), extra=SAMPLED)
+            return books
+        except Exception as e:
+            logger.error("Error retrieving all books: %s", e)
+            logger.error(traceback.format_exc())
+            return []
+
+    @staticmethod
+    @observe_db('find_books')
+    def find_books(category: Optional[str] = None, author: Optional[str] = None,
+                   year_from: Optional[int] = None, year_to: Optional[int] = None,
+                   sort: Optional[str] = None, limit: Optional[int] = None,
+                   offset: int = 0) -> List[Book]:
+        if sort is not None and sort not in BOOK_SORTS:
+            raise ValueError(f"Unknown sort order: {sort}")
+
+        conditions, params = [], []
+        if category is not None:
+            conditions.append("category = ?")
+            params.append(category)
+        if author is not None:
+            conditions.append("author = ?")
+            params.append(author)
+        if year_from is not None:
+            conditions.append("publication_year >= ?")
+            params.append(year_from)
+        if year_to is not None:
+            conditions.append("publication_year <= ?")
+            params.append(year_to)
+
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        order = f" ORDER BY {BOOK_SORTS[sort]}" if sort else ""
+        logger.info("Finding books%s%s", where, order, extra=SAMPLED)
+        return DatabaseManager._query_books(where, tuple(params), order, limit, offset)
+
+    @staticmethod
+    def _query_books(where, params, order, limit, offset) -> List[Book]:
+        page = ""
+        if limit is not None:
+            page = " LIMIT ? OFFSET ?"
+            params = params + (limit, offset)
+
+        conn = DatabaseManager.get_db_connection()
+        try:
             cursor = conn.cursor()
-            
-            cursor.execute("SELECT * FROM books")
+            select = f"SELECT * FROM books{where}{order}{page}"
+            cursor.execute(select, params)
             books = [Book(row) for row in cursor.fetchall()]
-            
-            for book in books:
-                book.reviews = DatabaseManager.get_book_reviews(book.id)
-            
-            conn.close()
-            logger.info(f"Retrieved {len(books)} books")
+
+            # Newest reviews for the whole result in one query instead of one
+            # per book; only books that have any are looked up
+            by_id = {book.id: book for book in books if book.review_count}
+            if by_id and REVIEW_PREVIEW_COUNT > 0:
+                subquery = f"SELECT id FROM books{where}{order}{page}" if page else f"SELECT id FROM books{where}"
+                cursor.execute(f'''
+                SELECT id, book_id, text, author FROM (
+                    SELECT id, book_id, text, author,
+                           ROW_NUMBER() OVER (PARTITION BY book_id ORDER BY id DESC) AS position
+                    FROM reviews WHERE book_id IN ({subquery})
+                ) WHERE position <= ? ORDER BY book_id, id DESC
+                ''', params + (REVIEW_PREVIEW_COUNT,))
+                for row in cursor.fetchall():
+                    book = by_id.get(row['book_id'])
+                    if book is not None:
+                        book.reviews.append(Review(row))
             return books
+        finally:
+            conn.close()
+
+    @staticmethod
+    @observe_db('get_facets')
+    def get_facets(limit: Optional[int] = None) -> dict:
+        try:
+            conn = DatabaseManager.get_db_connection()
+            cursor = conn.cursor()
+            facets = {}
+            for facet in ('category', 'author'):
+                query = "SELECT value, count FROM book_facets WHERE facet = ? ORDER BY count DESC, value"
+                params = (facet,)
+                if limit is not None:
+                    query += " LIMIT ?"
+                    params += (limit,)
+                cursor.execute(query, params)
+                facets[facet] = [{'value': row['value'], 'count': row['count']} for row in cursor.fetchall()]
+            conn.close()
+            return facets
         except Exception as e:
-            logger.error(f"Error retrieving all books: {str(e)}")
+            logger.error("Error retrieving facets: %s", e)
             logger.error(traceback.format_exc())
+            raise
+
+    @staticmethod
+    @observe_db('get_catalog_version')
+    def get_catalog_version() -> int:
+        conn = DatabaseManager.get_db_connection()
+        try:
+            return conn.execute("SELECT COALESCE(MAX(version), 0) FROM book_changes").fetchone()[0]
+        finally:
+            conn.close()
+
+    @staticmethod
+    @observe_db('get_changes')
+    def get_changes(since: int, limit: int) -> dict:
+        # Changes after `since`, oldest first. `version` is what the client
+        # passes as `since` next time; has_more means call again right away.
+        conn = DatabaseManager.get_db_connection()
+        try:
+            cursor = conn.cursor()
+            current = cursor.execute("SELECT COALESCE(MAX(version), 0) FROM book_changes").fetchone()[0]
+            if since > current:
+                raise ValueError(f"Version {since} is ahead of the catalog (at {current}); sync again from 0")
+            cursor.execute('''
+            SELECT book_id, version, op FROM book_changes
+            WHERE version > ? AND version <= ? ORDER BY version LIMIT ?
+            ''', (since, current, limit + 1))
+            rows = cursor.fetchall()
+        finally:
+            conn.close()
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        upserts = [row['book_id'] for row in rows if row['op'] == 'upsert']
+        books = {}
+        if upserts:
+            where = f" WHERE id IN ({','.join('?' * len(upserts))})"
+            books = {book.id: book for book in DatabaseManager._query_books(where, tuple(upserts), "", None, 0)}
+
+        changes = []
+        for row in rows:
+            book = books.get(row['book_id'])
+            # A book deleted after its change was read is reported as deleted
+            op = row['op'] if book is not None or row['op'] == 'delete' else 'delete'
+            changes.append({
+                'id': row['book_id'],
+                'op': op,
+                'book': book.to_dict() if op == 'upsert' else None,
+            })
+        return {
+            'version': rows[-1]['version'] if has_more else current,
+            'has_more': has_more,
+            'changes': changes,
+        }
+
+    @staticmethod
+    @observe_db('find_books_by_pdf_paths')
+    def find_books_by_pdf_paths(paths: List[str]) -> List[Book]:
+        # Exact matches on pdf_path (indexed); callers pass every spelling
+        # of a path they want to match
+        if not paths:
             return []
+        where = f" WHERE pdf_path IN ({','.join('?' * len(paths))})"
+        return DatabaseManager._query_books(where, tuple(paths), "", None, 0)
 
     @staticmethod
+    @observe_db('get_pdf_files')
+    def get_pdf_files() -> dict:
+        # library_watcher's last known state: {path: (size, mtime_ns, sha256, page_count)}
+        conn = DatabaseManager.get_db_connection()
+        try:
+            return {
+                row['path']: (row['size'], row['mtime_ns'], row['sha256'], row['page_count'])
+                for row in conn.execute("SELECT path, size, mtime_ns, sha256, page_count FROM pdf_files")
+            }
+        finally:
+            conn.close()
+
+    @staticmethod
+    @observe_db('save_pdf_files')
+    def save_pdf_files(saved: dict, removed: List[str]):
+        return write_queue.execute(_save_pdf_files, saved, removed)
+
+    @staticmethod
+    @observe_db('get_page_sizes')
+    def get_page_sizes(digest: str) -> Optional[list]:
+        conn = DatabaseManager.get_db_connection()
+        try:
+            row = conn.execute("SELECT sizes FROM pdf_page_sizes WHERE sha256 = ?", (digest,)).fetchone()
+        finally:
+            conn.close()
+        return json.loads(row['sizes']) if row else None
+
+    @staticmethod
+    @observe_db('save_page_sizes')
+    def save_page_sizes(sizes: dict):
+        # {sha256: runs}; content addressed, so rows are only ever replaced
+        # with the same value
+        rows = [(digest, json.dumps(runs, separators=(',', ':'))) for digest, runs in sizes.items()]
+        return write_queue.execute(_save_page_sizes, rows)
+
+    @staticmethod
+    @observe_db('get_book_by_id')
     def get_book_by_id(book_id: int) -> Optional[Book]:
         try:
-            logger.info(f"Attempting to retrieve book with ID: {book_id}")
+            logger.info("Attempting to retrieve book with ID: %s", book_id, extra=SAMPLED)
             conn = DatabaseManager.get_db_connection()
             cursor = conn.cursor()
             
             cursor.execute("SELECT * FROM books WHERE id = ?", (book_id,))
             result = cursor.fetchone()
+            conn.close()
             
             if not result:
-                logger.warning(f"No book found with ID: {book_id}")
+                logger.warning("No book found with ID: %s", book_id)
                 return None
             
             book = Book(result)
-            book.reviews = DatabaseManager.get_book_reviews(book.id)
-            logger.info(f"Book retrieved: {book.title} (ID: {book.id})")
+            logger.info("Book retrieved: %s (ID: %s)", book.title, book.id, extra=SAMPLED)
             return book
         except Exception as e:
-            logger.error(f"Error retrieving book by ID {book_id}: {str(e)}")
+            logger.error("Error retrieving book by ID %s: %s", book_id, e)
             logger.error(traceback.format_exc())
             return None
 
     @staticmethod
+    # Observed (and its statements charged) as bulk_delete_books
     def delete_book(book_id: int) -> bool:
         try:
-            logger.info(f"Attempting to delete book with ID: {book_id}")
-            conn = DatabaseManager.get_db_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute("DELETE FROM books WHERE id = ?", (book_id,))
-            conn.commit()
-            conn.close()
-            logger.info(f"Book with ID {book_id} deleted successfully")
+            logger.info("Attempting to delete book with ID: %s", book_id)
+            DatabaseManager.bulk_delete_books([book_id])
+            logger.info("Book with ID %s deleted successfully", book_id)
             return True
         except Exception as e:
-            logger.error(f"Error deleting book with ID {book_id}: {str(e)}")
+            logger.error("Error deleting book with ID %s: %s", book_id, e)
             logger.error(traceback.format_exc())
             return False
 
     @staticmethod
+    @observe_db('update_book')
     def update_book(book_id: int, updated_data: dict) -> bool:
         try:
-            logger.info(f"Attempting to update book with ID: {book_id}")
-            conn = DatabaseManager.get_db_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-            UPDATE books SET title = ?, author = ?, category = ?, 
-            description = ?, cover_image = ?, publication_year = ?, 
-            isbn = ?, pdf_path = ? WHERE id = ?
-            ''', (*updated_data.values(), book_id))
-            
-            conn.commit()
-            conn.close()
-            logger.info(f"Book with ID {book_id} updated successfully")
+            logger.info("Attempting to update book with ID: %s", book_id)
+            params = (*updated_data.values(), book_id)
+            write_queue.execute(_update_book, params)
+            DatabaseManager.invalidate_caches([book_id])
+            logger.info("Book with ID %s updated successfully", book_id)
             return True
         except Exception as e:
-            logger.error(f"Error updating book with ID {book_id}: {str(e)}")
+            logger.error("Error updating book with ID %s: %s", book_id, e)
             logger.error(traceback.format_exc())
             return False
+
+    @staticmethod
+    @observe_db('add_review')
+    def add_review(book_id: int, text: str, author: str) -> Optional[int]:
+        try:
+            logger.info("Adding review for book %s", book_id)
+            review_id = write_queue.execute(_insert_review, (book_id, text, author))
+            DatabaseManager.invalidate_caches([book_id])
+            logger.info("Review %s added for book %s", review_id, book_id)
+            return review_id
+        except Exception as e:
+            logger.error("Error adding review for book %s: %s", book_id, e)
+            logger.error(traceback.format_exc())
+            return None
+
+    @staticmethod
+    @observe_db('set_cover')
+    def set_cover(book_id: int, placeholder: Optional[str], version: Optional[str]) -> bool:
+        try:
+            write_queue.execute(_set_cover, (placeholder, version, book_id))
+            DatabaseManager.invalidate_caches([book_id])
+            logger.info("Cover %s stored for book %s", version, book_id)
+            return True
+        except Exception as e:
+            logger.error("Error storing cover for book %s: %s", book_id, e)
+            logger.error(traceback.format_exc())
+            return False
+
+    @staticmethod
+    @observe_db('bulk_update_books')
+    def bulk_update_books(updates: List[dict]) -> int:
+        # Each update is {'id': <book id>, <field>: <value>, ...}. Rows that
+        # touch the same set of fields share one executemany statement and
+        # every statement runs inside a single transaction.
+        # The whole batch is checked before anything is queued, so one bad
+        # item rejects the batch rather than failing its transaction.
+        grouped = {}
+        for index, update in enumerate(updates):
+            if not isinstance(update, dict) or not _is_integer(update.get('id')):
+                raise ValueError(f"Update {index}: each update must be an object with an integer 'id'")
+
+            fields = tuple(sorted(key for key in update if key != 'id'))
+            unknown = [field for field in fields if field not in BOOK_UPDATABLE_FIELDS]
+            if unknown:
+                raise ValueError(f"Update {index}: unknown book fields: {', '.join(unknown)}")
+            for field in fields:
+                error = _field_error(field, update[field])
+                if error:
+                    raise ValueError(f"Update {index} (book {update['id']}): '{field}' {error}")
+            if not fields:
+                continue
+
+            params = tuple(update[field] for field in fields) + (update['id'],)
+            grouped.setdefault(fields, []).append(params)
+
+        if not grouped:
+            return 0
+
+        logger.info("Bulk updating %s books in %s statement groups", len(updates), len(grouped))
+        try:
+            updated = write_queue.execute(_bulk_update_books, grouped)
+        except Exception as e:
+            logger.error("Bulk update error: %s", e)
+            logger.error(traceback.format_exc())
+            raise
+
+        DatabaseManager.invalidate_caches([update['id'] for update in updates])
+        logger.info("Bulk update complete: %s books updated", updated)
+        return updated
+
+    @staticmethod
+    @observe_db('bulk_delete_books')
+    def bulk_delete_books(book_ids: List[int]) -> int:
+        if not all(_is_integer(book_id) for book_id in book_ids):
+            raise ValueError("Book ids must be integers")
+        if not book_ids:
+            return 0
+
+        logger.info("Bulk deleting %s books", len(book_ids))
+        try:
+            deleted = write_queue.execute(_bulk_delete_books, [(book_id,) for book_id in book_ids])
+        except Exception as e:
+            logger.error("Bulk delete error: %s", e)
+            logger.error(traceback.format_exc())
+            raise
+
+        DatabaseManager.invalidate_caches(list(book_ids))
+        logger.info("Bulk delete complete: %s books deleted", deleted)
+        return deleted
+
+def _is_integer(value):
+    # JSON true/false arrive as bools, which are ints to Python
+    return isinstance(value, int) and not isinstance(value, bool)
+
+def _field_error(field, value):
+    if value is None:
+        return "cannot be null" if field in BOOK_REQUIRED_FIELDS else None
+    if field in BOOK_INTEGER_FIELDS:
+        return None if _is_integer(value) else "must be an integer"
+    return None if isinstance(value, str) else "must be a string"
+
+# Write operations, executed on the writer thread inside a group commit
+def _update_book(cursor, params):
+    cursor.execute('''
+    UPDATE books SET title = ?, author = ?, category = ?, 
+    description = ?, cover_image = ?, publication_year = ?, 
+    isbn = ?, pdf_path = ? WHERE id = ?
+    ''', params)
+    return cursor.rowcount
+
+def _set_cover(cursor, params):
+    cursor.execute("UPDATE books SET cover_placeholder = ?, cover_version = ? WHERE id = ?", params)
+    return cursor.rowcount
+
+def _insert_review(cursor, params):
+    cursor.execute("INSERT INTO reviews (book_id, text, author) VALUES (?, ?, ?)", params)
+    return cursor.lastrowid
+
+def _bulk_update_books(cursor, grouped):
+    updated = 0
+    for fields, rows in grouped.items():
+        assignments = ', '.join(f"{field} = ?" for field in fields)
+        cursor.executemany(f"UPDATE books SET {assignments} WHERE id = ?", rows)
+        updated += cursor.rowcount
+    return updated
+
+def _save_pdf_files(cursor, saved, removed):
+    cursor.executemany(
+        "INSERT OR REPLACE INTO pdf_files (path, size, mtime_ns, sha256, page_count) VALUES (?, ?, ?, ?, ?)",
+        [(path, *state) for path, state in saved.items()]
+    )
+    cursor.executemany("DELETE FROM pdf_files WHERE path = ?", [(path,) for path in removed])
+
+def _save_page_sizes(cursor, rows):
+    cursor.executemany("INSERT OR REPLACE INTO pdf_page_sizes (sha256, sizes) VALUES (?, ?)", rows)
+
+def _bulk_delete_books(cursor, rows):
+    # Reviews reference books without ON DELETE CASCADE, so remove them
+    # explicitly in the same transaction
+    cursor.executemany("DELETE FROM reviews WHERE book_id = ?", rows)
+    cursor.executemany("DELETE FROM books WHERE id = ?", rows)
+    return cursor.rowcount
+
+# All writes from this process go through one group-committing writer thread
+write_queue = create_write_queue(
+    DatabaseManager.get_db_connection, WRITE_GROUP_COMMIT_MS, WRITE_BATCH_MAX
+)
+register_queue_depth('sqlite_writer', write_queue.depth)
@@ -0,0 +1,243 @@
+# metrics.py
+# In-process metrics rendered in the Prometheus text exposition format.
+# Each worker process keeps its own series; every sample carries a `pid`
+# label so series from different workers never collide when scraped
+# through a load balancer or aggregated with sum without (pid).
+import os
+import time
+import bisect
+import threading
+from functools import wraps
+from contextlib import contextmanager
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry = []
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    pairs.append(('pid', os.getpid()))
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+        _registry.append(self)
+
+    def _key(self, labels):
+        return tuple(labels.get(name, '') for name in self.labelnames)
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_sample(key, value))
+        return lines
+
+    def _render_sample(self, key, value):
+        return [f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}']
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    # Either set explicitly or computed at scrape time from `callback`, which
+    # returns a number (unlabelled) or a {label tuple: number} dict
+    def __init__(self, name, documentation, labelnames=(), callback=None):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def render(self):
+        if self.callback is not None:
+            current = self.callback()
+            if not isinstance(current, dict):
+                current = {(): current}
+            with self._lock:
+                self._values = dict(current)
+        return super().render()
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket (non-cumulative) counts, then count and sum
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0, 0.0]
+            state[0][index] += 1
+            state[1] += 1
+            state[2] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        with self._lock:
+            items = sorted((key, [list(state[0]), state[1], state[2]]) for key, state in self._values.items())
+        for key, (counts, count, total) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, [('le', _format_value(bound))])
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f'{self.name}_count{labels} {count}')
+            lines.append(f'{self.name}_sum{labels} {_format_value(total)}')
+        return lines
+
+def render_metrics():
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+# HTTP
+HTTP_REQUESTS = Counter(
+    'books_http_requests_total', 'HTTP requests handled', ('route', 'method', 'status')
+)
+HTTP_LATENCY = Histogram(
+    'books_http_request_duration_seconds', 'HTTP request latency', ('route', 'method', 'status')
+)
+
+# Preview rendering, split by stage (rasterize, encode). Pages are
+# rasterized at the output size, so there is no resize stage.
+RENDER_SECONDS = Histogram(
+    'books_render_stage_duration_seconds', 'Preview render time by stage', ('stage',)
+)
+# Cover generation (covers.py), kept apart so thumbnail batches do not skew
+# preview latency: one rasterize, then a resize and encode per cover width
+COVER_RENDER_SECONDS = Histogram(
+    'books_cover_render_seconds', 'Cover render time by stage', ('stage',)
+)
+
+# Database
+DB_QUERIES = Counter(
+    'books_db_queries_total', 'DatabaseManager calls', ('method', 'outcome')
+)
+DB_QUERY_SECONDS = Histogram(
+    'books_db_query_duration_seconds', 'DatabaseManager call latency', ('method',)
+)
+
+# Caches: record_cache_lookup(name, hit) from any cache in the service
+CACHE_LOOKUPS = Counter(
+    'books_cache_lookups_total', 'Cache lookups', ('cache', 'result')
+)
+
+def record_cache_lookup(cache, hit):
+    CACHE_LOOKUPS.inc(cache=cache, result='hit' if hit else 'miss')
+
+# Queue depths, sampled at scrape time from registered callables
+_queue_depths = {}
+
+def register_queue_depth(name, depth):
+    _queue_depths[name] = depth
+
+QUEUE_DEPTH = Gauge(
+    'books_queue_depth', 'Items waiting in internal queues', ('queue',),
+    callback=lambda: {(name,): depth() for name, depth in _queue_depths.items()}
+)
+
+# Startup: import, init (master) and worker_init (per forked worker)
+STARTUP_SECONDS = Gauge(
+    'books_startup_seconds', 'Time spent in each startup phase', ('phase',)
+)
+
+# The observed DatabaseManager method running on this thread, so statement
+# tracing (query_trace.py) can name it
+_db_call = threading.local()
+
+def current_db_method():
+    return getattr(_db_call, 'method', None)
+
+def observe_db(method):
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            outcome = 'error'
+            caller, _db_call.method = current_db_method(), method
+            try:
+                result = func(*args, **kwargs)
+                outcome = 'ok'
+                return result
+            finally:
+                _db_call.method = caller
+                DB_QUERIES.inc(method=method, outcome=outcome)
+                DB_QUERY_SECONDS.observe(time.perf_counter() - start, method=method)
+        return wrapper
+    return decorator
+
+def init_app(app):
+    # Request count and latency for every route, labelled by the URL rule so
+    # /books/1/preview and /books/2/preview share a series
+    from flask import g, request
+
+    @app.before_request
+    def _start_timer():
+        g.metrics_start = time.perf_counter()
+
+    @app.after_request
+    def _record_request(response):
+        start = g.pop('metrics_start', None)
+        if start is not None:
+            route = request.url_rule.rule if request.url_rule else 'unmatched'
+            labels = {'route': route, 'method': request.method, 'status': response.status_code}
+            HTTP_REQUESTS.inc(**labels)
+            HTTP_LATENCY.observe(time.perf_counter() - start, **labels)
+        return response
@@ -0,0 +1,304 @@
+# migrations.py
+# Versioned schema for books.db. Each migration runs once, in order, and is
+# recorded in schema_version; when the database is already current, migrate()
+# costs a single SELECT and writes nothing. Migrations are written to be safe
+# on databases created before versioning existed (which report version 0 but
+# may already have some of these objects).
+#
+# To change the schema, append a migration; never edit one that has shipped.
+import sqlite3
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Indexes backing the find_books filters and sort orders
+BOOK_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS idx_books_category_year ON books(category, publication_year)",
+    "CREATE INDEX IF NOT EXISTS idx_books_category_title ON books(category, title)",
+    "CREATE INDEX IF NOT EXISTS idx_books_author_year ON books(author, publication_year)",
+    "CREATE INDEX IF NOT EXISTS idx_books_year ON books(publication_year)",
+    "CREATE INDEX IF NOT EXISTS idx_books_title ON books(title)",
+    "CREATE INDEX IF NOT EXISTS idx_books_pdf_sha256 ON books(pdf_sha256)",
+)
+
+# Reviews are always read per book, newest first
+REVIEW_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS idx_reviews_book_id ON reviews(book_id, id)",
+)
+
+# book_facets holds per-category and per-author book counts. The triggers keep
+# it in step with every insert, delete and update of books, so facet queries
+# never have to aggregate the books table.
+FACET_TRIGGERS = (
+    '''
+    CREATE TRIGGER IF NOT EXISTS books_facets_insert AFTER INSERT ON books BEGIN
+        INSERT INTO book_facets (facet, value, count) VALUES ('category', NEW.category, 1)
+            ON CONFLICT(facet, value) DO UPDATE SET count = count + 1;
+        INSERT INTO book_facets (facet, value, count) VALUES ('author', NEW.author, 1)
+            ON CONFLICT(facet, value) DO UPDATE SET count = count + 1;
+    END''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS books_facets_delete AFTER DELETE ON books BEGIN
+        UPDATE book_facets SET count = count - 1 WHERE facet = 'category' AND value = OLD.category;
+        UPDATE book_facets SET count = count - 1 WHERE facet = 'author' AND value = OLD.author;
+        DELETE FROM book_facets WHERE facet = 'category' AND value = OLD.category AND count <= 0;
+        DELETE FROM book_facets WHERE facet = 'author' AND value = OLD.author AND count <= 0;
+    END''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS books_facets_update AFTER UPDATE OF category, author ON books BEGIN
+        INSERT INTO book_facets (facet, value, count) VALUES ('category', NEW.category, 1)
+            ON CONFLICT(facet, value) DO UPDATE SET count = count + 1;
+        INSERT INTO book_facets (facet, value, count) VALUES ('author', NEW.author, 1)
+            ON CONFLICT(facet, value) DO UPDATE SET count = count + 1;
+        UPDATE book_facets SET count = count - 1 WHERE facet = 'category' AND value = OLD.category;
+        UPDATE book_facets SET count = count - 1 WHERE facet = 'author' AND value = OLD.author;
+        DELETE FROM book_facets WHERE facet = 'category' AND value = OLD.category AND count <= 0;
+        DELETE FROM book_facets WHERE facet = 'author' AND value = OLD.author AND count <= 0;
+    END''',
+)
+
+# Columns added to books after the original schema
+COVER_COLUMNS = (
+    ('cover_placeholder', 'TEXT'),
+    ('cover_version', 'TEXT'),
+    ('pdf_sha256', 'TEXT'),
+)
+REVIEW_AGGREGATE_COLUMNS = (
+    ('review_count', 'INTEGER NOT NULL DEFAULT 0'),
+    ('latest_review_id', 'INTEGER'),
+)
+LIBRARY_COLUMNS = (
+    ('page_count', 'INTEGER'),
+)
+
+# review_count and latest_review_id on the book row follow every review
+# insert, delete and move, so listings never have to count reviews
+REVIEW_AGGREGATE_TRIGGERS = (
+    '''
+    CREATE TRIGGER IF NOT EXISTS reviews_aggregate_insert AFTER INSERT ON reviews BEGIN
+        UPDATE books SET review_count = review_count + 1, latest_review_id = NEW.id
+        WHERE id = NEW.book_id;
+    END''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS reviews_aggregate_delete AFTER DELETE ON reviews BEGIN
+        UPDATE books SET review_count = review_count - 1,
+            latest_review_id = (SELECT MAX(id) FROM reviews WHERE book_id = OLD.book_id)
+        WHERE id = OLD.book_id;
+    END''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS reviews_aggregate_move AFTER UPDATE OF book_id ON reviews
+    WHEN OLD.book_id IS NOT NEW.book_id BEGIN
+        UPDATE books SET review_count = review_count - 1,
+            latest_review_id = (SELECT MAX(id) FROM reviews WHERE book_id = OLD.book_id)
+        WHERE id = OLD.book_id;
+        UPDATE books SET review_count = review_count + 1,
+            latest_review_id = (SELECT MAX(id) FROM reviews WHERE book_id = NEW.book_id)
+        WHERE id = NEW.book_id;
+    END''',
+)
+
+# Generated covers belong to the PDF they were rendered from
+COVER_TRIGGERS = (
+    "DROP TRIGGER IF EXISTS books_covers_reset",
+    '''
+    CREATE TRIGGER books_covers_reset AFTER UPDATE OF pdf_path, pdf_sha256 ON books
+    WHEN OLD.pdf_path IS NOT NEW.pdf_path OR OLD.pdf_sha256 IS NOT NEW.pdf_sha256 BEGIN
+        UPDATE books SET cover_placeholder = NULL, cover_version = NULL WHERE id = NEW.id;
+    END''',
+)
+
+# book_changes keeps the latest version of every book that was inserted,
+# updated or deleted (deletes stay as tombstones), numbered from one global
+# sequence. A review insert or delete bumps its book, because reviews are part
+# of the book payload. /api/v1/books/changes?since=<version> is one range scan
+# of idx_book_changes_version.
+def _change_upsert(book_id, op):
+    return f'''
+        INSERT INTO book_changes (book_id, version, op)
+        VALUES ({book_id}, (SELECT COALESCE(MAX(version), 0) + 1 FROM book_changes), '{op}')
+        ON CONFLICT(book_id) DO UPDATE SET version = excluded.version, op = excluded.op;'''
+
+CHANGE_TRIGGERS = (
+    f"CREATE TRIGGER IF NOT EXISTS books_changes_insert AFTER INSERT ON books BEGIN{_change_upsert('NEW.id', 'upsert')}\n    END",
+    f"CREATE TRIGGER IF NOT EXISTS books_changes_update AFTER UPDATE ON books BEGIN{_change_upsert('NEW.id', 'upsert')}\n    END",
+    f"CREATE TRIGGER IF NOT EXISTS books_changes_delete AFTER DELETE ON books BEGIN{_change_upsert('OLD.id', 'delete')}\n    END",
+    f'''CREATE TRIGGER IF NOT EXISTS reviews_changes_insert AFTER INSERT ON reviews
+    WHEN EXISTS (SELECT 1 FROM books WHERE id = NEW.book_id) BEGIN{_change_upsert('NEW.book_id', 'upsert')}
+    END''',
+    f'''CREATE TRIGGER IF NOT EXISTS reviews_changes_delete AFTER DELETE ON reviews
+    WHEN EXISTS (SELECT 1 FROM books WHERE id = OLD.book_id) BEGIN{_change_upsert('OLD.book_id', 'upsert')}
+    END''',
+)
+
+def _add_columns(cursor, columns):
+    cursor.execute("PRAGMA table_info(books)")
+    existing = {row[1] for row in cursor.fetchall()}
+    for column, column_type in columns:
+        if column not in existing:
+            cursor.execute(f"ALTER TABLE books ADD COLUMN {column} {column_type}")
+
+def _create_tables(cursor):
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS books (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        title TEXT NOT NULL,
+        author TEXT NOT NULL,
+        category TEXT NOT NULL,
+        description TEXT,
+        cover_image TEXT,
+        publication_year INTEGER,
+        isbn TEXT,
+        pdf_path TEXT
+    )''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS reviews (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        book_id INTEGER,
+        text TEXT NOT NULL,
+        author TEXT NOT NULL,
+        FOREIGN KEY(book_id) REFERENCES books(id)
+    )''')
+
+def _add_cover_columns(cursor):
+    _add_columns(cursor, COVER_COLUMNS)
+    for statement in COVER_TRIGGERS:
+        cursor.execute(statement)
+
+def _create_book_indexes(cursor):
+    for statement in BOOK_INDEXES:
+        cursor.execute(statement)
+
+def _create_facets(cursor):
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS book_facets (
+        facet TEXT NOT NULL,
+        value TEXT NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (facet, value)
+    )''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_book_facets_count ON book_facets(facet, count DESC)")
+    for statement in FACET_TRIGGERS:
+        cursor.execute(statement)
+
+    cursor.execute("SELECT EXISTS (SELECT 1 FROM book_facets), EXISTS (SELECT 1 FROM books)")
+    has_facets, has_books = cursor.fetchone()
+    if has_books and not has_facets:
+        cursor.execute('''
+        INSERT INTO book_facets (facet, value, count)
+        SELECT 'category', category, COUNT(*) FROM books GROUP BY category
+        UNION ALL
+        SELECT 'author', author, COUNT(*) FROM books GROUP BY author
+        ''')
+
+def _create_change_log(cursor):
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS book_changes (
+        book_id INTEGER PRIMARY KEY,
+        version INTEGER NOT NULL,
+        op TEXT NOT NULL
+    )''')
+    cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_book_changes_version ON book_changes(version)")
+    for statement in CHANGE_TRIGGERS:
+        cursor.execute(statement)
+
+    # Existing books start out as changes, so syncing from version 0 yields
+    # the whole catalog
+    cursor.execute("SELECT EXISTS (SELECT 1 FROM book_changes)")
+    if not cursor.fetchone()[0]:
+        cursor.execute("INSERT INTO book_changes (book_id, version, op) SELECT id, id, 'upsert' FROM books")
+
+def _add_review_aggregates(cursor):
+    _add_columns(cursor, REVIEW_AGGREGATE_COLUMNS)
+    for statement in REVIEW_INDEXES:
+        cursor.execute(statement)
+    for statement in REVIEW_AGGREGATE_TRIGGERS:
+        cursor.execute(statement)
+    cursor.execute('''
+    UPDATE books SET
+        review_count = (SELECT COUNT(*) FROM reviews WHERE book_id = books.id),
+        latest_review_id = (SELECT MAX(id) FROM reviews WHERE book_id = books.id)
+    WHERE id IN (SELECT DISTINCT book_id FROM reviews)
+    ''')
+
+def _create_library_index(cursor):
+    # pdf_files is library_watcher's record of every PDF in the library
+    # directory, so a restart re-stats files instead of re-hashing them
+    _add_columns(cursor, LIBRARY_COLUMNS)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_books_pdf_path ON books(pdf_path)")
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS pdf_files (
+        path TEXT PRIMARY KEY,
+        size INTEGER NOT NULL,
+        mtime_ns INTEGER NOT NULL,
+        sha256 TEXT NOT NULL,
+        page_count INTEGER
+    ) WITHOUT ROWID''')
+
+def _create_page_sizes(cursor):
+    # Run-length encoded page dimensions per stored PDF (page_sizes.py)
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS pdf_page_sizes (
+        sha256 TEXT PRIMARY KEY,
+        sizes TEXT NOT NULL
+    ) WITHOUT ROWID''')
+
+# (version, description, function(cursor))
+SCHEMA_MIGRATIONS = (
+    (1, 'books and reviews tables', _create_tables),
+    (2, 'cover and pdf_sha256 columns', _add_cover_columns),
+    (3, 'catalog indexes', _create_book_indexes),
+    (4, 'book facets', _create_facets),
+    (5, 'book change log', _create_change_log),
+    (6, 'review index and aggregates', _add_review_aggregates),
+    (7, 'pdf library index and page counts', _create_library_index),
+    (8, 'pdf page sizes', _create_page_sizes),
+)
+SCHEMA_VERSION = SCHEMA_MIGRATIONS[-1][0]
+
+def current_version(conn):
+    try:
+        return conn.execute("SELECT MAX(version) FROM schema_version").fetchone()[0] or 0
+    except sqlite3.OperationalError:
+        return 0
+
+def migrate(conn):
+    # Returns the versions applied, [] when the schema was already current
+    version = current_version(conn)
+    if version >= SCHEMA_VERSION:
+        if version > SCHEMA_VERSION:
+            logger.warning("Database schema version %s is newer than this code (%s)", version, SCHEMA_VERSION)
+        return []
+
+    # WAL lets readers proceed while the writer thread holds the lock; the
+    # mode is stored in the file and cannot change inside a transaction
+    conn.execute("PRAGMA journal_mode=WAL")
+    isolation_level, conn.isolation_level = conn.isolation_level, None
+    applied = []
+    try:
+        # The write lock serializes processes starting at the same time; the
+        # version is re-read once it is held
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute('''
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                description TEXT NOT NULL,
+                applied_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )''')
+            version = current_version(conn)
+            cursor = conn.cursor()
+            for number, description, apply in SCHEMA_MIGRATIONS:
+                if number <= version:
+                    continue
+                logger.info("Applying schema migration %s: %s", number, description)
+                apply(cursor)
+                cursor.execute("INSERT INTO schema_version (version, description) VALUES (?, ?)",
+                               (number, description))
+                applied.append(number)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    finally:
+        conn.isolation_level = isolation_level
+    return applied
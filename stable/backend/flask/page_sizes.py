@@ -0,0 +1,67 @@
+# page_sizes.py
+# Page dimensions in PDF points (1/72 in), as rendered: rotation applied,
+# media box. Render admission (render_budget.py) needs them to know what a
+# page will cost before rasterizing it.
+#
+# Sizes are stored run-length encoded, [[count, width, height], ...], since
+# most documents use one or two page formats. Stored content is keyed by its
+# digest in pdf_page_sizes (filled by library_watcher on ingest, or on the
+# first preview); PDFs known only by pdf_path are measured once per file
+# version and kept in memory.
+import os
+import logging
+from functools import lru_cache
+from main_2 import DatabaseManager
+
+logger = logging.getLogger(__name__)
+
+_DIGEST_CACHE_MAX = 4096
+_by_digest = {}
+
+def read_page_sizes(pdf_path):
+    from PyPDF2 import PdfReader
+    runs = []
+    for page in PdfReader(pdf_path).pages:
+        width, height = round(float(page.mediabox.width), 2), round(float(page.mediabox.height), 2)
+        if (page.rotation or 0) % 180:
+            width, height = height, width
+        if runs and runs[-1][1:] == [width, height]:
+            runs[-1][0] += 1
+        else:
+            runs.append([1, width, height])
+    return runs
+
+def page_count(runs):
+    return sum(run[0] for run in runs)
+
+def page_size(runs, page):
+    # (width, height) of a zero-based page, or None past the last page
+    for count, width, height in runs:
+        if page < count:
+            return width, height
+        page -= count
+    return None
+
+@lru_cache(maxsize=256)
+def _read_file_version(pdf_path, mtime_ns, size):
+    return read_page_sizes(pdf_path)
+
+def page_sizes_for(book, pdf_path):
+    # pdf_store.pdf_file falls back to pdf_path when the digest is not in the
+    # store, and that file may not hold the digest's content
+    digest = book.pdf_sha256
+    if not digest or os.path.basename(pdf_path) != f'{digest}.pdf':
+        stat = os.stat(pdf_path)
+        return _read_file_version(pdf_path, stat.st_mtime_ns, stat.st_size)
+
+    # Content addressed, so never stale
+    runs = _by_digest.get(digest)
+    if runs is None:
+        runs = DatabaseManager.get_page_sizes(digest)
+        if runs is None:
+            runs = read_page_sizes(pdf_path)
+            DatabaseManager.save_page_sizes({digest: runs})
+        if len(_by_digest) >= _DIGEST_CACHE_MAX:
+            _by_digest.pop(next(iter(_by_digest)))
+        _by_digest[digest] = runs
+    return runs
@@ -0,0 +1,179 @@
+# pdf_store.py
+# Content-addressed PDF storage. Files are stored once per SHA-256 digest
+# under the key <aa>/<bb>/<digest>.pdf of the configured storage backend
+# (storage.py) and books reference the digest in pdf_sha256. Identical
+# uploads share one file, and the digest doubles as a stable cache key and
+# ETag.
+#
+# Import PDFs referenced by pdf_path:  python pdf_store.py import
+import os
+import re
+import sys
+import hashlib
+import logging
+import argparse
+import tempfile
+import traceback
+from contextlib import contextmanager
+from storage import storage, StorageUnavailable
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+SHA256_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+def is_digest(value):
+    return bool(value) and SHA256_PATTERN.match(value) is not None
+
+def key_for(digest):
+    return f'{digest[:2]}/{digest[2:4]}/{digest}.pdf'
+
+def exists(digest):
+    return is_digest(digest) and storage.exists(key_for(digest))
+
+def local_path(digest):
+    # A file on this machine, fetched into the cache first if need be. Use
+    # pdf_file() when the path is read after this returns.
+    return storage.local_path(key_for(digest))
+
+def hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def put_stream(stream):
+    # Streams into a temporary file while hashing, then hands it to the
+    # backend. Returns (digest, stored) where stored is False when the
+    # content was already present.
+    os.makedirs(storage.staging_dir, exist_ok=True)
+    digest = hashlib.sha256()
+    fd, temp_path = tempfile.mkstemp(dir=storage.staging_dir, suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+                f.write(chunk)
+        return _commit(temp_path, digest.hexdigest())
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+def put_file(path):
+    with open(path, 'rb') as f:
+        return put_stream(f)
+
+def _commit(temp_path, digest):
+    if exists(digest):
+        return digest, False
+    storage.put_file(key_for(digest), temp_path)
+    return digest, True
+
+@contextmanager
+def pdf_file(book):
+    # Path of the book's PDF, valid until the block exits. Stored content
+    # wins (leased, so the cache keeps it); books not yet imported fall back
+    # to pdf_path.
+    if book.pdf_sha256 and exists(book.pdf_sha256):
+        with storage.lease(key_for(book.pdf_sha256)) as path:
+            yield path
+    else:
+        yield book.pdf_path
+
+def pdf_response(digest, download_name, as_attachment=False, max_age=None):
+    # Files on local disk go through send_file. Otherwise the requested byte
+    # range is streamed straight from the backend, so a client resuming a
+    # download or a viewer fetching one page does not wait for (or make us
+    # cache) the whole object. The object is opened before the response is
+    # returned, so a missing one is a 404 and an unreachable store a 503.
+    from flask import request, send_file, Response, abort
+
+    key = key_for(digest)
+    path = storage.cached_path(key)
+    if path is not None:
+        return send_file(
+            os.path.abspath(path), mimetype='application/pdf', as_attachment=as_attachment,
+            download_name=download_name, etag=digest, max_age=max_age, conditional=True
+        )
+
+    response = Response(mimetype='application/pdf', direct_passthrough=True)
+    response.set_etag(digest)
+    response.accept_ranges = 'bytes'
+    response.headers.set('Content-Disposition', 'attachment' if as_attachment else 'inline',
+                         filename=download_name)
+    if max_age is not None:
+        response.cache_control.public = True
+        response.cache_control.max_age = max_age
+    if request.if_none_match.contains(digest):
+        response.status_code = 304
+        return response
+
+    try:
+        size = storage.size(key)
+        start, stop = 0, size
+        byte_range = request.range
+        # Multiple ranges and stale If-Range validators get the whole file
+        if (byte_range is not None and len(byte_range.ranges) == 1
+                and request.if_range.etag in (None, digest) and request.if_range.date is None):
+            bounds = byte_range.range_for_length(size)
+            if bounds is None:
+                response.status_code = 416
+                response.content_range = f'bytes */{size}'
+                return response
+            start, stop = bounds
+            response.status_code = 206
+            response.content_range = byte_range.make_content_range(size)
+        body = storage.open_range(key, start, stop - 1) if stop > start else []
+    except FileNotFoundError:
+        abort(404, description="PDF not found")
+    except StorageUnavailable as e:
+        logger.warning("PDF storage unavailable: %s", e)
+        abort(503, description="PDF storage is unavailable", retry_after=5)
+
+    response.content_length = stop - start
+    response.response = body
+    return response
+
+def import_books():
+    # Hashes every book whose PDF is still only referenced by pdf_path and
+    # records the digest; duplicate files end up stored once
+    from main_2 import DatabaseManager
+
+    updates, stored, missing = [], 0, 0
+    for book in DatabaseManager.get_all_books():
+        if book.pdf_sha256 and exists(book.pdf_sha256):
+            continue
+        if not book.pdf_path or not os.path.exists(book.pdf_path):
+            missing += 1
+            logger.warning("PDF for book %s not found: %s", book.id, book.pdf_path)
+            continue
+        try:
+            digest, new = put_file(book.pdf_path)
+        except OSError as e:
+            missing += 1
+            logger.error("Error importing PDF for book %s: %s", book.id, e)
+            logger.error(traceback.format_exc())
+            continue
+        stored += int(new)
+        updates.append({'id': book.id, 'pdf_sha256': digest})
+
+    if updates:
+        DatabaseManager.bulk_update_books(updates)
+    return len(updates), stored, missing
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Content-addressed PDF store")
+    parser.add_argument('command', choices=('import',))
+    parser.parse_args(argv)
+
+    from log_config import configure_logging
+    from main_2 import DatabaseManager
+    configure_logging()
+    DatabaseManager.init_db()
+    linked, stored, missing = import_books()
+    print(f"Linked {linked} books to {stored} newly stored PDFs ({missing} missing)")
+    return 1 if missing else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,73 +1,116 @@
 # preview.py
 import os
+import shutil
 import traceback
 import logging
+import subprocess
 from flask import abort
-from pdf2image import convert_from_path
 import io
-from PIL import Image
-from PyPDF2 import PdfReader
+import time
+from config import PREVIEW_DPI, RENDER_TIMEOUT_SECONDS, RENDER_POLL_SECONDS
+from log_config import SAMPLED
+from metrics import RENDER_SECONDS
+from render_jobs import RenderJob, RenderCancelled, RenderTimeout, RENDER_CANCELLATIONS
 
-# Configure logging
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    filename='preview_errors.log'
-)
 logger = logging.getLogger(__name__)
 
+# PIL and PyPDF2 are imported on first use rather than at module load, which
+# keeps them out of every process start and every CLI import
+
 class PDFPreview:
     @staticmethod
-    def generate_preview(pdf_path, page=0, scale=1.0):
+    def renderer_available():
+        # pdftoppm comes from poppler-utils, a system package (see req.txt)
+        return shutil.which('pdftoppm') is not None
+
+    @staticmethod
+    def rasterize(pdf_path, page, dpi, crop=None, job=None, timeout=RENDER_TIMEOUT_SECONDS):
+        # Renders one zero-based page with pdftoppm straight at the output
+        # resolution; crop is (x, y, width, height) in output pixels, and
+        # pdftoppm only rasterizes that region. The process is killed when
+        # it outlives `timeout` or `job` is cancelled (render_jobs.py).
+        from PIL import Image
+        args = ['pdftoppm', '-r', f'{dpi:.4f}', '-f', str(page + 1), '-l', str(page + 1)]
+        if crop is not None:
+            x, y, width, height = crop
+            args += ['-x', str(x), '-y', str(y), '-W', str(width), '-H', str(height)]
+        args.append(pdf_path)
+
+        job = job or RenderJob()
+        deadline = time.monotonic() + timeout
         try:
-            logger.info(f"Generating preview for {pdf_path}, page {page}, scale {scale}")
-            
-            # Validate PDF path
-            if not os.path.exists(pdf_path):
-                logger.error(f"PDF file not found: {pdf_path}")
-                abort(404, description="PDF file not found")
+            process = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, start_new_session=True)
+        except FileNotFoundError:
+            raise RuntimeError("pdftoppm not found; install poppler-utils to render previews")
+        job.attach(process)
+        try:
+            while True:
+                try:
+                    stdout, stderr = process.communicate(
+                        timeout=max(0.0, min(RENDER_POLL_SECONDS, deadline - time.monotonic()))
+                    )
+                    break
+                except subprocess.TimeoutExpired:
+                    job.check()
+                    if time.monotonic() >= deadline:
+                        RENDER_CANCELLATIONS.inc(reason='timeout')
+                        raise RenderTimeout(f"Rendering page {page + 1} took longer than {timeout:g}s")
+        finally:
+            job.detach()
+            if process.returncode is None:
+                process.kill()
+                process.communicate()
+        if process.returncode != 0:
+            # Killed by cancel() between polls
+            job.check()
 
-            # Convert PDF page to image
-            pages = convert_from_path(
-                pdf_path, 
-                first_page=page+1, 
-                last_page=page+2
-            )
+        if process.returncode != 0 or not stdout:
+            raise RuntimeError(f"pdftoppm exited with {process.returncode}: "
+                               f"{stderr.decode(errors='replace').strip()}")
+        return Image.open(io.BytesIO(stdout))
 
-            if not pages:
-                logger.warning(f"No pages generated for {pdf_path}")
-                abort(404, description="Unable to generate preview")
+    @staticmethod
+    def generate_preview(pdf_path, page=0, scale=1.0, crop=None, job=None):
+        try:
+            logger.info("Generating preview for %s, page %s, scale %s", pdf_path, page, scale, extra=SAMPLED)
 
-            # Get the first (or only) page
-            image = pages[0]
+            # Validate PDF path
+            if not os.path.exists(pdf_path):
+                logger.error("PDF file not found: %s", pdf_path)
+                abort(404, description="PDF file not found")
 
-            # Resize image if scale is not 1.0
-            if scale != 1.0:
-                new_size = (int(image.width * scale), int(image.height * scale))
-                image = image.resize(new_size, Image.LANCZOS)
+            # Rasterize at the requested scale rather than at PREVIEW_DPI and
+            # resizing afterwards: sharper, and no full-size intermediate
+            with RENDER_SECONDS.time(stage='rasterize'):
+                image = PDFPreview.rasterize(pdf_path, page, PREVIEW_DPI * scale, crop, job)
+                image.load()
 
             # Convert image to bytes
-            img_byte_arr = io.BytesIO()
-            image.save(img_byte_arr, format='PNG')
-            img_byte_arr.seek(0)
+            with RENDER_SECONDS.time(stage='encode'):
+                img_byte_arr = io.BytesIO()
+                image.save(img_byte_arr, format='PNG')
+                img_byte_arr.seek(0)
 
-            logger.info(f"Preview generated successfully for {pdf_path}")
+            logger.info("Preview generated successfully for %s", pdf_path, extra=SAMPLED)
             return img_byte_arr
 
+        except (RenderCancelled, RenderTimeout):
+            raise
         except Exception as e:
-            logger.error(f"Preview generation error: {str(e)}")
-            logger.error(f"Traceback: {traceback.format_exc()}")
+            logger.error("Preview generation error: %s", e)
+            logger.error("Traceback: %s", traceback.format_exc())
             abort(500, description=f"Error generating preview: {str(e)}")
 
     @staticmethod
     def get_total_pages(pdf_path):
+        from PyPDF2 import PdfReader
         try:
-            logger.info(f"Getting total pages for {pdf_path}")
+            logger.info("Getting total pages for %s", pdf_path, extra=SAMPLED)
             reader = PdfReader(pdf_path)
             total_pages = len(reader.pages)
-            logger.info(f"Total pages: {total_pages}")
+            logger.info("Total pages: %s", total_pages, extra=SAMPLED)
             return total_pages
         except Exception as e:
-            logger.error(f"Page count error: {str(e)}")
-            logger.error(f"Traceback: {traceback.format_exc()}")
+            logger.error("Page count error: %s", e)
+            logger.error("Traceback: %s", traceback.format_exc())
             return 0
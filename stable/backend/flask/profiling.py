@@ -0,0 +1,160 @@
+# profiling.py
+# Opt-in profiling. With BOOKS_PROFILING unset, init_app installs nothing, so
+# there is no per-request cost. When enabled:
+#   X-Profile: cpu     cProfile the request, dump a .prof (pstats) file
+#   X-Profile: sample  sample the request thread's stack, dump a .folded file
+#                      (collapsed stacks for flamegraph.pl / speedscope)
+# Both require an admin bearer token. BOOKS_TRACEMALLOC_FRAMES > 0 also starts
+# tracemalloc and enables the snapshot-diff endpoint.
+import os
+import sys
+import time
+import logging
+import cProfile
+import threading
+import tracemalloc
+from collections import Counter
+from flask import g, request, jsonify, abort
+from auth import is_admin_request, require_admin
+from config import PROFILING_ENABLED, PROFILE_DIR, PROFILE_SAMPLE_INTERVAL_MS, TRACEMALLOC_FRAMES
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = 'X-Profile'
+
+class StackSampler:
+    # Periodically records the stack of one thread via sys._current_frames()
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+
+    def write_folded(self, path):
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+def _output_path(suffix):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    route = (request.url_rule.rule if request.url_rule else 'unmatched').strip('/').replace('/', '_')
+    route = route.replace('<', '').replace('>', '').replace(':', '-') or 'root'
+    now = time.time()
+    stamp = f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(now))}.{int(now * 1000) % 1000:03d}"
+    name = f"{stamp}-{os.getpid()}-{route}.{suffix}"
+    return os.path.join(PROFILE_DIR, name)
+
+def _start_profile():
+    mode = request.headers.get(PROFILE_HEADER)
+    if not mode:
+        return
+    if mode not in ('cpu', 'sample') or not is_admin_request():
+        logger.warning("Ignoring %s header on %s (unknown mode or not admin)", PROFILE_HEADER, request.path)
+        return
+
+    if mode == 'cpu':
+        profiler = cProfile.Profile()
+        profiler.enable()
+    else:
+        profiler = StackSampler(threading.get_ident(), PROFILE_SAMPLE_INTERVAL_MS / 1000.0)
+        profiler.start()
+    g.profiler = (mode, profiler)
+
+def _finish_profile(response):
+    active = g.pop('profiler', None)
+    if active is None:
+        return response
+
+    mode, profiler = active
+    if mode == 'cpu':
+        profiler.disable()
+        path = _output_path('prof')
+        profiler.dump_stats(path)
+    else:
+        profiler.stop()
+        path = _output_path('folded')
+        profiler.write_folded(path)
+
+    logger.info("Wrote %s profile for %s to %s", mode, request.path, path)
+    response.headers['X-Profile-Output'] = os.path.basename(path)
+    return response
+
+# Snapshots are kept per process; each call diffs against the previous one
+_last_snapshot = None
+_snapshot_lock = threading.Lock()
+
+@require_admin
+def tracemalloc_diff():
+    global _last_snapshot
+    if not tracemalloc.is_tracing():
+        abort(404, description="tracemalloc is not enabled")
+
+    limit = request.args.get('limit', 25, type=int)
+    key_type = request.args.get('group_by', 'lineno')
+    if key_type not in ('lineno', 'filename', 'traceback'):
+        abort(400, description="group_by must be lineno, filename or traceback")
+
+    snapshot = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    ))
+    with _snapshot_lock:
+        previous, _last_snapshot = _last_snapshot, snapshot
+
+    if previous is None:
+        stats = [
+            {'location': str(stat.traceback), 'size': stat.size, 'count': stat.count}
+            for stat in snapshot.statistics(key_type)[:limit]
+        ]
+    else:
+        stats = [
+            {
+                'location': str(stat.traceback),
+                'size': stat.size, 'size_diff': stat.size_diff,
+                'count': stat.count, 'count_diff': stat.count_diff,
+            }
+            for stat in snapshot.compare_to(previous, key_type)[:limit]
+        ]
+
+    current, peak = tracemalloc.get_traced_memory()
+    return jsonify({
+        'pid': os.getpid(),
+        'baseline': previous is None,
+        'traced_current': current,
+        'traced_peak': peak,
+        'stats': stats,
+    })
+
+def init_app(app):
+    if not PROFILING_ENABLED:
+        return
+
+    app.before_request(_start_profile)
+    app.after_request(_finish_profile)
+    app.add_url_rule(
+        '/api/v1/admin/profiling/tracemalloc', 'tracemalloc_diff', tracemalloc_diff, methods=['GET']
+    )
+    if TRACEMALLOC_FRAMES > 0 and not tracemalloc.is_tracing():
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+    logger.info("Profiling enabled (output in %s, tracemalloc %s)",
+                PROFILE_DIR, 'on' if tracemalloc.is_tracing() else 'off')
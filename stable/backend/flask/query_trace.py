@@ -0,0 +1,359 @@
+# query_trace.py
+# Per-statement accounting for SQLite. With QUERY_TRACE_ENABLED, connections
+# from DatabaseManager.get_db_connection are TracedConnections: their cursors
+# count every statement when it executes and time the execute plus any
+# fetchone/fetchmany/fetchall reading its rows, with the rows it returned or
+# changed. Rows read by iterating the cursor are neither timed nor counted,
+# which keeps bulk scans (suggest.py) free of per-row overhead. Each
+# statement is charged to the route being served and to the DatabaseManager
+# method issuing it (metrics.observe_db); writes run by the writer thread are
+# charged to the request that queued them (write_queue.py), and statements
+# outside any request to the thread.
+#
+#   GET /api/v1/admin/queries      top statements by total time in this worker
+#   DELETE /api/v1/admin/queries   start counting afresh
+#
+# Statements slower than QUERY_SLOW_MS are logged with their EXPLAIN QUERY
+# PLAN. Every request counts its statements (X-Query-Count header and the
+# books_db_statements_per_request histogram); a route decorated with
+# @query_budget(n) that issues more than n logs a warning, or, with
+# QUERY_BUDGET_STRICT, fails with QueryBudgetExceeded so an N+1 regression
+# breaks the test run. count_queries() counts an arbitrary block.
+import os
+import re
+import time
+import sqlite3
+import logging
+import threading
+from functools import wraps, lru_cache
+from contextlib import contextmanager, closing
+from config import (
+    QUERY_TRACE_ENABLED, QUERY_SLOW_MS, QUERY_BUDGET_STRICT, QUERY_TRACE_MAX_STATEMENTS
+)
+from metrics import Histogram, current_db_method
+
+logger = logging.getLogger(__name__)
+
+QUERY_COUNT_HEADER = 'X-Query-Count'
+
+STATEMENTS_PER_REQUEST = Histogram(
+    'books_db_statements_per_request', 'SQLite statements issued per request', ('route',),
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100, 250)
+)
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+class QueryCount:
+    def __init__(self, label):
+        self.label = label
+        self.count = 0
+        self.seconds = 0.0
+
+# Open counts for this thread (the request's, then any count_queries blocks)
+# and, on the writer thread, the caller a queued write is charged to
+_local = threading.local()
+
+def _scopes():
+    return getattr(_local, 'scopes', ())
+
+def capture():
+    # What a statement run on behalf of this thread should be charged to;
+    # see attributed()
+    return _scopes(), getattr(_local, 'caller', None) or current_db_method()
+
+@contextmanager
+def attributed(captured):
+    previous = _scopes(), getattr(_local, 'caller', None)
+    _local.scopes, _local.caller = captured
+    try:
+        yield
+    finally:
+        _local.scopes, _local.caller = previous
+
+@contextmanager
+def count_queries(label='block'):
+    counter = QueryCount(label)
+    previous = _scopes()
+    _local.scopes = previous + (counter,)
+    try:
+        yield counter
+    finally:
+        _local.scopes = previous
+
+def query_budget(limit):
+    # Route decorator: the most statements one request to the view may issue
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            with count_queries(view.__name__) as counter:
+                response = view(*args, **kwargs)
+            if counter.count > limit:
+                message = f"{view.__name__} issued {counter.count} queries (budget {limit})"
+                if QUERY_BUDGET_STRICT:
+                    raise QueryBudgetExceeded(message)
+                logger.warning("%s", message)
+            return response
+        return wrapper
+    return decorator
+
+class _Statement:
+    __slots__ = ('sql', 'calls', 'seconds', 'max_seconds', 'rows', 'callers', 'plan')
+
+    def __init__(self, sql):
+        self.sql = sql
+        self.calls = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.rows = 0
+        # {(route, method): [calls, seconds]}
+        self.callers = {}
+        self.plan = None
+
+_statements = {}
+_statements_lock = threading.Lock()
+_since = time.time()
+_OTHER = '<other statements>'
+
+@lru_cache(maxsize=1024)
+def normalize(sql):
+    # One entry per statement shape: whitespace collapsed and IN lists of any
+    # length folded together
+    sql = ' '.join(sql.split())
+    return re.sub(r'\?(?:\s*,\s*\?)+', '?, ...', sql)
+
+_EXPLAINABLE = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+def _explain(connection, sql, parameters):
+    # EXPLAIN QUERY PLAN as an indented tree; the statement's own connection
+    # may already be closed by the time its cursor is finished
+    if not sql.lstrip().upper().startswith(_EXPLAINABLE):
+        return None
+    try:
+        rows = sqlite3.Cursor(connection).execute(f"EXPLAIN QUERY PLAN {sql}", parameters).fetchall()
+    except sqlite3.ProgrammingError:
+        with closing(sqlite3.connect(connection.database)) as fresh:
+            rows = fresh.execute(f"EXPLAIN QUERY PLAN {sql}", parameters).fetchall()
+    depth, plan = {0: -1}, []
+    for node, parent, _, detail in rows:
+        depth[node] = depth.get(parent, -1) + 1
+        plan.append('  ' * depth[node] + detail)
+    return plan
+
+class _Execution:
+    # One run of a statement; fetches of its rows add to it
+    __slots__ = ('connection', 'sql', 'parameters', 'statement', 'totals', 'scopes', 'key', 'seconds', 'rows',
+                 'logged')
+
+    def __init__(self, connection, sql, parameters, statement, totals, scopes, key):
+        self.connection = connection
+        self.sql = sql
+        self.parameters = parameters
+        self.statement = statement
+        self.totals = totals
+        self.scopes = scopes
+        self.key = key
+        self.seconds = 0.0
+        self.rows = 0
+        self.logged = False
+
+def _record(connection, sql, parameters, seconds, rows):
+    # Counts one execution of `sql` and charges it `seconds`
+    scopes, caller = capture()
+    for counter in scopes:
+        counter.count += 1
+    route = scopes[0].label if scopes else threading.current_thread().name
+    key = (route, caller or '-')
+
+    shape = normalize(sql)
+    with _statements_lock:
+        statement = _statements.get(shape)
+        if statement is None:
+            if len(_statements) >= QUERY_TRACE_MAX_STATEMENTS:
+                shape = _OTHER
+            statement = _statements.setdefault(shape, _Statement(shape))
+        statement.calls += 1
+        totals = statement.callers.setdefault(key, [0, 0.0])
+        totals[0] += 1
+    execution = _Execution(connection, sql, parameters, statement, totals, scopes, key)
+    _charge(execution, seconds, rows)
+    return execution
+
+def _charge(execution, seconds, rows):
+    for counter in execution.scopes:
+        counter.seconds += seconds
+    execution.seconds += seconds
+    execution.rows += rows
+    statement = execution.statement
+    with _statements_lock:
+        statement.seconds += seconds
+        statement.max_seconds = max(statement.max_seconds, execution.seconds)
+        statement.rows += rows
+        execution.totals[1] += seconds
+        plan = statement.plan
+
+    # Logged once, when the execution crosses the threshold
+    if execution.logged or execution.seconds * 1000 < QUERY_SLOW_MS:
+        return
+    execution.logged = True
+    if plan is None and execution.parameters is not None and statement.sql != _OTHER:
+        try:
+            plan = _explain(execution.connection, execution.sql, execution.parameters)
+        except Exception as e:
+            logger.debug("EXPLAIN QUERY PLAN failed for %s: %s", statement.sql, e)
+            plan = []
+        statement.plan = plan
+    logger.warning("Slow query (%.1f ms, %s rows, %s via %s): %s%s",
+                   execution.seconds * 1000, execution.rows, execution.key[0], execution.key[1], statement.sql,
+                   ''.join('\n    ' + line for line in plan or ()))
+
+class TracedCursor(sqlite3.Cursor):
+    # The statement last executed, which fetches are charged to. Nothing is
+    # recorded on close or collection, so tracing never runs from a finalizer.
+    _execution = None
+
+    def execute(self, sql, parameters=()):
+        self._execution = None
+        start = time.perf_counter()
+        try:
+            super().execute(sql, parameters)
+        finally:
+            self._executed(sql, parameters, time.perf_counter() - start)
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        self._execution = None
+        start = time.perf_counter()
+        try:
+            super().executemany(sql, seq_of_parameters)
+        finally:
+            # No plan for a batch: there is no single set of parameters
+            self._executed(sql, None, time.perf_counter() - start)
+        return self
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(time.perf_counter() - start, row is not None)
+        return row
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._fetched(time.perf_counter() - start, len(rows))
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(time.perf_counter() - start, len(rows))
+        return rows
+
+    def _executed(self, sql, parameters, seconds):
+        rows = max(self.rowcount, 0) if self.description is None else 0
+        try:
+            self._execution = _record(self.connection, sql, parameters, seconds, rows)
+        except Exception as e:
+            logger.error("Query trace error: %s", e)
+
+    def _fetched(self, seconds, rows):
+        if self._execution is None:
+            return
+        try:
+            _charge(self._execution, seconds, rows)
+        except Exception as e:
+            logger.error("Query trace error: %s", e)
+
+class TracedConnection(sqlite3.Connection):
+    def __init__(self, database, *args, **kwargs):
+        super().__init__(database, *args, **kwargs)
+        self.database = database
+
+    def cursor(self, factory=TracedCursor):
+        return super().cursor(factory)
+
+    # Connection.execute* make their cursors without calling cursor()
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+CONNECTION_FACTORY = TracedConnection if QUERY_TRACE_ENABLED else sqlite3.Connection
+
+def top_statements(limit=25, order='total'):
+    sort_keys = {
+        'total': lambda s: s.seconds,
+        'mean': lambda s: s.seconds / s.calls,
+        'max': lambda s: s.max_seconds,
+        'calls': lambda s: s.calls,
+        'rows': lambda s: s.rows,
+    }
+    with _statements_lock:
+        statements = sorted(_statements.values(), key=sort_keys[order], reverse=True)[:limit]
+        return [
+            {
+                'sql': s.sql,
+                'calls': s.calls,
+                'total_seconds': round(s.seconds, 6),
+                'mean_seconds': round(s.seconds / s.calls, 6),
+                'max_seconds': round(s.max_seconds, 6),
+                'rows': s.rows,
+                'callers': [
+                    {'route': route, 'method': method, 'calls': calls, 'total_seconds': round(seconds, 6)}
+                    for (route, method), (calls, seconds)
+                    in sorted(s.callers.items(), key=lambda item: item[1][1], reverse=True)[:5]
+                ],
+                'plan': s.plan,
+            }
+            for s in statements
+        ]
+
+def reset():
+    global _since
+    with _statements_lock:
+        _statements.clear()
+        _since = time.time()
+
+def admin_queries():
+    from flask import request, jsonify, abort
+    if request.method == 'DELETE':
+        reset()
+        return '', 204
+
+    limit = request.args.get('limit', 25, type=int)
+    order = request.args.get('order', 'total')
+    if order not in ('total', 'mean', 'max', 'calls', 'rows'):
+        abort(400, description="order must be total, mean, max, calls or rows")
+    return jsonify({
+        'pid': os.getpid(),
+        'since': _since,
+        'statements': top_statements(limit, order),
+    })
+
+def _start_request():
+    from flask import request
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    _local.scopes = (QueryCount(route),)
+
+def _finish_request(response):
+    scopes = _scopes()
+    if scopes:
+        STATEMENTS_PER_REQUEST.observe(scopes[0].count, route=scopes[0].label)
+        response.headers[QUERY_COUNT_HEADER] = str(scopes[0].count)
+    return response
+
+def _end_request(error=None):
+    _local.scopes = ()
+
+def init_app(app):
+    if not QUERY_TRACE_ENABLED:
+        return
+
+    # Imported here so that CLI tools using DatabaseManager do not load
+    # the web stack
+    from auth import require_admin
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.teardown_request(_end_request)
+    app.add_url_rule('/api/v1/admin/queries', 'admin_queries', require_admin(admin_queries), methods=['GET', 'DELETE'])
@@ -0,0 +1,174 @@
+# rate_limit.py
+# Token-bucket rate limiting for the expensive routes, plus a cap on how many
+# renders one client may have in flight. Routes opt in with
+# @rate_limited('<group>') using a group from config.RATE_LIMITS; a client
+# over budget gets 429 with Retry-After.
+#
+# Buckets are kept in memory per worker by default. Setting RATE_LIMIT_DB
+# moves them into a small SQLite file so every worker draws on the same
+# budget. The render cap is always per worker: an in-flight count cannot be
+# recovered from a shared file if a worker dies mid-render.
+import os
+import math
+import time
+import sqlite3
+import logging
+import threading
+from functools import wraps
+from contextlib import contextmanager
+from flask import abort, request, g
+import jwt
+from auth import get_bearer_token, decode_admin_token
+from config import RATE_LIMITS, RATE_LIMIT_ENABLED, RATE_LIMIT_DB, RENDERS_PER_CLIENT, DB_BUSY_TIMEOUT_MS
+from metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMITED = Counter(
+    'books_rate_limited_total', 'Requests rejected by rate limiting', ('group', 'reason')
+)
+
+class MemoryBuckets:
+    # Buckets idle long enough to have refilled completely are dropped
+    # whenever the table grows past max_keys
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, burst, cost=1.0):
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._prune(now, rate, burst)
+        return allowed, 0.0 if allowed else (cost - tokens) / rate
+
+    def _prune(self, now, rate, burst):
+        full_after = burst / rate
+        for key in [k for k, (_, updated) in self._buckets.items() if now - updated >= full_after]:
+            del self._buckets[key]
+
+class SQLiteBuckets:
+    # Shared across worker processes through one SQLite file. Each take is a
+    # single short IMMEDIATE transaction; wall-clock time is used because
+    # monotonic clocks are not comparable between processes.
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=DB_BUSY_TIMEOUT_MS / 1000.0, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=OFF')
+            conn.execute('''
+            CREATE TABLE IF NOT EXISTS rate_buckets (
+                key TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated REAL NOT NULL
+            ) WITHOUT ROWID
+            ''')
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def take(self, key, rate, burst, cost=1.0):
+        conn = self._connection()
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT tokens, updated FROM rate_buckets WHERE key = ?', (key,)).fetchone()
+            tokens, updated = row if row else (burst, now)
+            tokens = min(burst, tokens + max(0.0, now - updated) * rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            conn.execute('INSERT OR REPLACE INTO rate_buckets (key, tokens, updated) VALUES (?, ?, ?)',
+                         (key, tokens, now))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return allowed, 0.0 if allowed else (cost - tokens) / rate
+
+buckets = SQLiteBuckets(RATE_LIMIT_DB) if RATE_LIMIT_DB else MemoryBuckets()
+
+def client_key():
+    # Cached per request: preview checks both the bucket and the render cap
+    if 'rate_limit_client' in g:
+        return g.rate_limit_client
+    key = f'ip:{request.remote_addr}'
+    token = get_bearer_token()
+    if token:
+        # Only verified tokens get their own budget, so random bearer
+        # strings cannot be used to mint fresh buckets
+        try:
+            key = f"user:{decode_admin_token(token).get('email')}"
+        except jwt.InvalidTokenError:
+            pass
+    g.rate_limit_client = key
+    return key
+
+def _reject(group, reason, retry_after, description):
+    RATE_LIMITED.inc(group=group, reason=reason)
+    logger.warning("Rate limited %s on %s (%s)", client_key(), group, reason)
+    abort(429, description=description, retry_after=max(1, math.ceil(retry_after)))
+
+def check_rate_limit(group, cost=1.0):
+    if not RATE_LIMIT_ENABLED:
+        return
+    rate, burst = RATE_LIMITS[group]
+    try:
+        allowed, retry_after = buckets.take(f'{group}:{client_key()}', rate, burst, cost)
+    except sqlite3.Error as e:
+        # Fail open: a broken limiter store must not take the API down
+        logger.error("Rate limit store error: %s", e)
+        return
+    if not allowed:
+        _reject(group, 'rate', retry_after, f"Too many {group} requests")
+
+def rate_limited(group):
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            check_rate_limit(group)
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+_renders = {}
+_renders_lock = threading.Lock()
+
+@contextmanager
+def render_slot(group='preview'):
+    # Caps concurrent renders per client and group within this worker
+    if not RATE_LIMIT_ENABLED:
+        yield
+        return
+
+    key = f'{group}:{client_key()}'
+    with _renders_lock:
+        active = _renders.get(key, 0)
+        if active >= RENDERS_PER_CLIENT:
+            full = True
+        else:
+            full = False
+            _renders[key] = active + 1
+    if full:
+        _reject(group, 'concurrency', 1, "Too many concurrent renders")
+
+    try:
+        yield
+    finally:
+        with _renders_lock:
+            remaining = _renders[key] - 1
+            if remaining:
+                _renders[key] = remaining
+            else:
+                del _renders[key]
@@ -0,0 +1,263 @@
+# render_budget.py
+# Admission and scheduling for renders. A render's peak memory is estimated
+# from the page's stored dimensions (page_sizes.py) and the requested scale:
+# RENDER_BYTES_PER_PIXEL covers poppler's bitmap, the PPM it pipes back, the
+# decoded image and the PNG being encoded. Each render reserves that much
+# from a per-worker budget, and one of RENDER_SLOTS, before it starts;
+# renders never overlap beyond either.
+#
+# Waiting renders are ordered by self-clocked fair queuing: every flow (one
+# priority class, client and book) is charged cost / class weight per render
+# and the render with the earliest finish tag goes next, so interactive work
+# is preferred over prefetch and batch in RENDER_PRIORITY_WEIGHTS proportion
+# and no client or book can crowd out the others. The chosen render waits
+# until it fits rather than letting smaller ones past, so large renders are
+# not starved. While the p95 latency of interactive renders is above
+# RENDER_INTERACTIVE_P95_TARGET_SECONDS and interactive renders are waiting,
+# prefetch and batch renders are held back, and running ones are cancelled
+# to make room.
+#
+# A single render may use at most RENDER_MAX_JOB_MB. Larger requests are
+# rendered at the largest scale that fits (the response says which), or,
+# with RENDER_OVERSIZE='tile', sent to a manifest of RENDER_TILE_SIZE px tiles
+# that are each rendered on their own.
+import math
+import time
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from config import (
+    PREVIEW_DPI, RENDER_MEMORY_BUDGET_MB, RENDER_MAX_JOB_MB, RENDER_BYTES_PER_PIXEL,
+    RENDER_QUEUE_TIMEOUT_SECONDS, RENDER_TILE_SIZE, RENDER_POLL_SECONDS, RENDER_SLOTS,
+    RENDER_PRIORITY_WEIGHTS, RENDER_INTERACTIVE_P95_TARGET_SECONDS, RENDER_P95_WINDOW_SECONDS
+)
+from metrics import Counter, Gauge, Histogram
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+MAX_JOB_BYTES = RENDER_MAX_JOB_MB * MB
+
+PRIORITIES = tuple(RENDER_PRIORITY_WEIGHTS)
+INTERACTIVE = 'interactive'
+
+class RenderBusy(Exception):
+    pass
+
+def pixels_for(size, scale):
+    # Output size in pixels of a page `size` points across, as pdftoppm
+    # rounds it
+    dpi = PREVIEW_DPI * scale
+    return math.ceil(size[0] * dpi / 72), math.ceil(size[1] * dpi / 72)
+
+def estimate_bytes(width, height):
+    return width * height * RENDER_BYTES_PER_PIXEL
+
+def plan(size, scale):
+    # Returns (scale, cost): the requested scale when the page fits in one
+    # render, otherwise the largest (two decimal) scale that does
+    cost = estimate_bytes(*pixels_for(size, scale))
+    if cost <= MAX_JOB_BYTES:
+        return scale, cost
+    fitted = math.floor(scale * math.sqrt(MAX_JOB_BYTES / cost) * 100) / 100
+    while fitted > 0.01 and estimate_bytes(*pixels_for(size, fitted)) > MAX_JOB_BYTES:
+        fitted -= 0.01
+    fitted = max(0.01, round(fitted, 2))
+    return fitted, estimate_bytes(*pixels_for(size, fitted))
+
+def oversized(size, scale):
+    return estimate_bytes(*pixels_for(size, scale)) > MAX_JOB_BYTES
+
+def tile_grid(size, scale):
+    width, height = pixels_for(size, scale)
+    return width, height, math.ceil(width / RENDER_TILE_SIZE), math.ceil(height / RENDER_TILE_SIZE)
+
+def tile_crop(size, scale, column, row):
+    # (x, y, width, height) in output pixels, clipped to the page; None when
+    # the tile lies outside it
+    width, height, columns, rows = tile_grid(size, scale)
+    if not (0 <= column < columns and 0 <= row < rows):
+        return None
+    x, y = column * RENDER_TILE_SIZE, row * RENDER_TILE_SIZE
+    return x, y, min(RENDER_TILE_SIZE, width - x), min(RENDER_TILE_SIZE, height - y)
+
+class _Request:
+    __slots__ = ('priority', 'flow', 'cost', 'job', 'finish', 'arrived', 'started')
+
+    def __init__(self, priority, flow, cost, job):
+        self.priority = priority
+        self.flow = flow
+        self.cost = cost
+        self.job = job
+        self.finish = 0.0
+        self.arrived = time.monotonic()
+        self.started = None
+
+class RenderScheduler:
+    def __init__(self, memory_limit, slots, weights, p95_target, p95_window):
+        self.memory_limit = memory_limit
+        self.slots = slots
+        self.weights = weights
+        self.p95_target = p95_target
+        self.p95_window = p95_window
+        self.reserved = 0
+        self._cond = threading.Condition()
+        self._waiting = []
+        self._running = []
+        # Virtual time (the finish tag of the last render admitted) and each
+        # flow's latest finish tag
+        self._virtual = 0.0
+        self._finish = {}
+        # (finished at, seconds from arrival to completion) of interactive renders
+        self._latencies = deque(maxlen=1024)
+        self._p95 = (0.0, 0.0)
+
+    def wake(self):
+        with self._cond:
+            self._cond.notify_all()
+
+    # The public readers below are called from metric scrapes on other
+    # threads; reserve() holds the lock already and uses the _ helpers
+
+    def interactive_p95(self):
+        with self._cond:
+            return self._interactive_p95()
+
+    def overloaded(self):
+        with self._cond:
+            return self._overloaded()
+
+    def depth(self, priority):
+        with self._cond:
+            waiting = list(self._waiting)
+        return sum(1 for request in waiting if request.priority == priority)
+
+    def active(self, priority):
+        with self._cond:
+            running = list(self._running)
+        return sum(1 for request in running if request.priority == priority)
+
+    def _interactive_p95(self):
+        now = time.monotonic()
+        computed_at, value = self._p95
+        if now - computed_at >= 1.0:
+            recent = sorted(seconds for finished, seconds in self._latencies if now - finished <= self.p95_window)
+            value = recent[min(len(recent) - 1, int(len(recent) * 0.95))] if recent else 0.0
+            self._p95 = (now, value)
+        return value
+
+    def _overloaded(self):
+        return self._interactive_p95() > self.p95_target
+
+    def _next(self, overloaded):
+        candidates = self._waiting
+        if overloaded and any(r.priority == INTERACTIVE for r in candidates):
+            candidates = [r for r in candidates if r.priority == INTERACTIVE]
+        return min(candidates, key=lambda r: (r.finish, r.arrived), default=None)
+
+    def _fits(self, request):
+        # An idle worker admits anything, so no render is refused for size
+        if not self._running:
+            return True
+        return len(self._running) < self.slots and self.reserved + request.cost <= self.memory_limit
+
+    def _preempt(self):
+        # Cancels the most recently started background render, unless one
+        # already cancelled has yet to release its share
+        if any(running.job is not None and running.job.cancelled for running in self._running):
+            return
+        for running in reversed(self._running):
+            if running.priority != INTERACTIVE and running.job is not None and not running.job.cancelled:
+                logger.info("Preempting %s render for interactive work", running.priority)
+                running.job.cancel('preempted')
+                return
+
+    @contextmanager
+    def reserve(self, cost, priority=INTERACTIVE, flow=None, job=None, timeout=RENDER_QUEUE_TIMEOUT_SECONDS):
+        # A waiting job (render_jobs.RenderJob) is checked for cancellation
+        # every RENDER_POLL_SECONDS and leaves the queue when cancelled
+        request = _Request(priority, flow, cost, job)
+        deadline = request.arrived + timeout
+        key = (priority, flow)
+        with self._cond:
+            previous = self._finish.get(key)
+            request.finish = max(self._virtual, previous or 0.0) + cost / self.weights[priority]
+            self._finish[key] = request.finish
+            self._waiting.append(request)
+            try:
+                while True:
+                    overloaded = self._overloaded()
+                    if self._next(overloaded) is request:
+                        if self._fits(request):
+                            break
+                        if priority == INTERACTIVE and overloaded:
+                            self._preempt()
+                    if job is not None:
+                        job.check()
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        RENDER_ADMISSIONS.inc(priority=priority, outcome='timeout')
+                        raise RenderBusy(f"No render capacity within {timeout:g}s")
+                    self._cond.wait(min(remaining, RENDER_POLL_SECONDS))
+            except BaseException:
+                # Timed out or cancelled: the flow is not charged for a render
+                # that never ran, unless a later one already built on its tag
+                if self._finish.get(key) == request.finish:
+                    if previous is None:
+                        self._finish.pop(key, None)
+                    else:
+                        self._finish[key] = previous
+                raise
+            finally:
+                self._waiting.remove(request)
+                self._cond.notify_all()
+            self._virtual = max(self._virtual, request.finish)
+            if len(self._finish) > 10000:
+                self._finish = {k: tag for k, tag in self._finish.items() if tag > self._virtual}
+            self.reserved += cost
+            request.started = time.monotonic()
+            self._running.append(request)
+
+        waited = request.started - request.arrived
+        RENDER_ADMISSION_WAIT.observe(waited, priority=priority)
+        RENDER_ADMISSIONS.inc(priority=priority, outcome='queued' if waited > 0.001 else 'admitted')
+
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.reserved -= cost
+                self._running.remove(request)
+                if priority == INTERACTIVE:
+                    now = time.monotonic()
+                    self._latencies.append((now, now - request.arrived))
+                self._cond.notify_all()
+
+scheduler = RenderScheduler(
+    RENDER_MEMORY_BUDGET_MB * MB, RENDER_SLOTS, RENDER_PRIORITY_WEIGHTS,
+    RENDER_INTERACTIVE_P95_TARGET_SECONDS, RENDER_P95_WINDOW_SECONDS
+)
+
+RENDER_ADMISSIONS = Counter(
+    'books_render_admissions_total', 'Render admission outcomes', ('priority', 'outcome')
+)
+RENDER_ADMISSION_WAIT = Histogram(
+    'books_render_admission_wait_seconds', 'Time renders waited for admission', ('priority',)
+)
+RENDER_QUEUE_DEPTH = Gauge(
+    'books_render_queue_depth', 'Renders waiting for admission', ('priority',),
+    callback=lambda: {(priority,): scheduler.depth(priority) for priority in PRIORITIES}
+)
+RENDER_ACTIVE = Gauge(
+    'books_render_active', 'Renders in progress', ('priority',),
+    callback=lambda: {(priority,): scheduler.active(priority) for priority in PRIORITIES}
+)
+RENDER_INTERACTIVE_P95 = Gauge(
+    'books_render_interactive_p95_seconds', 'p95 interactive render latency, queueing included',
+    callback=lambda: scheduler.interactive_p95()
+)
+RENDER_MEMORY_RESERVED = Gauge(
+    'books_render_memory_reserved_bytes', 'Estimated memory held by renders in progress',
+    callback=lambda: scheduler.reserved
+)
@@ -0,0 +1,132 @@
+# render_jobs.py
+# Deadlines and cancellation for preview renders. Every render runs pdftoppm
+# in its own process group under a RenderJob, and the process is killed as
+# soon as any of these happens:
+#
+#   - it runs past RENDER_TIMEOUT_SECONDS (RenderTimeout)
+#   - the client closes its connection (checked every RENDER_POLL_SECONDS)
+#   - the same viewer asks for a different page or scale of the same book,
+#     which supersedes every render of theirs still queued or running
+#     (main.render_session says who a viewer is; without one, nothing is
+#     superseded)
+#
+# The scheduler also cancels background renders to make room for interactive
+# ones (render_budget.py). Cancelled renders raise RenderCancelled and release
+# their memory reservation and render slot straight away, so the capacity goes to requests
+# someone is still waiting for. Supersession is tracked per worker; browsers
+# keep one connection to one worker while paging, so that is where it counts.
+import os
+import select
+import signal
+import socket
+import logging
+import threading
+from contextlib import contextmanager
+from metrics import Counter
+from render_budget import scheduler
+
+logger = logging.getLogger(__name__)
+
+RENDER_CANCELLATIONS = Counter(
+    'books_render_cancellations_total', 'Renders stopped before completing', ('reason',)
+)
+
+class RenderCancelled(Exception):
+    def __init__(self, reason):
+        super().__init__(f"Render cancelled ({reason})")
+        self.reason = reason
+
+class RenderTimeout(Exception):
+    pass
+
+def _client_gone(sock):
+    # A closed connection reads as EOF; pipelined data means it is alive
+    try:
+        readable, _, _ = select.select([sock], [], [], 0)
+        return bool(readable) and sock.recv(1, socket.MSG_PEEK) == b''
+    except ValueError:
+        # TLS sockets cannot peek; treat the client as present
+        return False
+    except OSError:
+        return True
+
+class RenderJob:
+    def __init__(self, target=None, sock=None):
+        self.target = target
+        self.sock = sock
+        self.reason = None
+        self._process = None
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        return self.reason is not None
+
+    def cancel(self, reason):
+        with self._lock:
+            if self.reason is not None:
+                return
+            self.reason = reason
+            process = self._process
+        RENDER_CANCELLATIONS.inc(reason=reason)
+        if process is not None:
+            _kill(process)
+        # Let a queued render notice now rather than at its next poll
+        scheduler.wake()
+
+    def check(self):
+        # Called while queued and while rendering; raises once cancelled
+        if self.reason is None and self.sock is not None and _client_gone(self.sock):
+            self.cancel('disconnected')
+        if self.reason is not None:
+            raise RenderCancelled(self.reason)
+
+    def attach(self, process):
+        with self._lock:
+            self._process = process
+            cancelled = self.reason is not None
+        if cancelled:
+            _kill(process)
+
+    def detach(self):
+        with self._lock:
+            self._process = None
+
+def _kill(process):
+    # pdftoppm runs in its own session, so the whole group goes
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+@contextmanager
+def render_job(session, target, environ):
+    # `session` groups one client's requests for one document; `target` is
+    # what they asked for. Renders of other targets in the session are
+    # cancelled; tiles of the same page share a target and coexist.
+    sock = environ.get('gunicorn.socket') or environ.get('werkzeug.socket')
+    job = RenderJob(target, sock)
+    if session is None:
+        # Background work (prefetch, batch) neither supersedes nor is superseded
+        yield job
+        return
+    with _sessions_lock:
+        jobs = _sessions.setdefault(session, [])
+        superseded = [other for other in jobs if other.target != target]
+        jobs.append(job)
+    for other in superseded:
+        logger.info("Render of %s superseded by %s in %s", other.target, target, session)
+        other.cancel('superseded')
+
+    try:
+        yield job
+    finally:
+        with _sessions_lock:
+            jobs = _sessions.get(session, [])
+            if job in jobs:
+                jobs.remove(job)
+            if not jobs:
+                _sessions.pop(session, None)
@@ -0,0 +1,56 @@
+# serve.py
+# Production entry point: python serve.py
+#
+# The app is imported and initialized once in the master process, then forked
+# into SERVER_WORKERS workers running SERVER_THREADS threads each. Per-process
+# state (the SQLite writer thread, caches) is created after the fork.
+# Send SIGHUP to the master to gracefully replace the workers, USR2 followed by
+# QUIT to the old master to pick up new code (the app is preloaded, so HUP
+# alone reuses the already imported modules), and SIGTERM to shut down.
+import logging
+from gunicorn.app.base import BaseApplication
+from config import (
+    SERVER_BIND, SERVER_WORKERS, SERVER_THREADS, SERVER_TIMEOUT,
+    SERVER_GRACEFUL_TIMEOUT, SERVER_KEEPALIVE, SERVER_MAX_REQUESTS,
+    SERVER_MAX_REQUESTS_JITTER
+)
+from main import app, initialize_app, initialize_worker
+
+logger = logging.getLogger(__name__)
+
+def post_fork(server, worker):
+    initialize_worker()
+    logger.info("Worker %s initialized", worker.pid)
+
+class BooksServer(BaseApplication):
+    def __init__(self, application, options):
+        self.application = application
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        return self.application
+
+def server_options():
+    return {
+        'bind': SERVER_BIND,
+        'workers': SERVER_WORKERS,
+        'threads': SERVER_THREADS,
+        'worker_class': 'gthread',
+        'timeout': SERVER_TIMEOUT,
+        'graceful_timeout': SERVER_GRACEFUL_TIMEOUT,
+        'keepalive': SERVER_KEEPALIVE,
+        'max_requests': SERVER_MAX_REQUESTS,
+        'max_requests_jitter': SERVER_MAX_REQUESTS_JITTER,
+        'preload_app': True,
+        'post_fork': post_fork,
+    }
+
+if __name__ == '__main__':
+    initialize_app()
+    logger.info("Starting %s workers x %s threads on %s", SERVER_WORKERS, SERVER_THREADS, SERVER_BIND)
+    BooksServer(app, server_options()).run()
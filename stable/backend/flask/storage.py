@@ -0,0 +1,350 @@
+# storage.py
+# Where pdf_store keeps PDF bytes. Keys are relative paths such as
+# "ab/cd/<digest>.pdf"; since they are content addressed, an object never
+# changes once written, which is what makes the cache below safe.
+#
+#   LocalStorage   files under a directory (the default)
+#   S3Storage      any S3-compatible bucket (AWS, MinIO, Ceph, moto_server),
+#                  needs boto3; point BOOKS_S3_ENDPOINT_URL at a local MinIO
+#                  or `moto_server` to run against a stand-in
+#   CachedStorage  wraps a remote backend with a size-bounded local
+#                  read-through cache, evicting least recently used files
+#
+# Rendering needs a real file for poppler, so local_path() downloads into the
+# cache; downloads instead stream just the requested byte range from the
+# backend when the object is not cached yet. Code that reads the file by path
+# holds a lease(key) for as long as it does, so eviction cannot remove the
+# file underneath it.
+import os
+import time
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager
+from config import (
+    STORAGE_BACKEND, PDF_STORE_DIR, S3_BUCKET, S3_PREFIX, S3_ENDPOINT_URL, S3_REGION,
+    STORAGE_CACHE_DIR, STORAGE_CACHE_MAX_BYTES, RENDER_TIMEOUT_SECONDS
+)
+from metrics import record_cache_lookup, Gauge
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+
+# Error codes S3-compatible stores answer with for a key that does not exist
+S3_NOT_FOUND_CODES = ('404', 'NoSuchKey', 'NotFound')
+
+class StorageUnavailable(Exception):
+    # The backend could not be reached or failed the request; worth retrying
+    pass
+
+def _read_file_range(path, start, end):
+    # Yields bytes start..end inclusive
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+class LocalStorage:
+    def __init__(self, root):
+        self.root = root
+        self.staging_dir = root
+
+    def _path(self, key):
+        return os.path.join(self.root, key)
+
+    def exists(self, key):
+        return os.path.exists(self._path(key))
+
+    def size(self, key):
+        return os.path.getsize(self._path(key))
+
+    def cached_path(self, key):
+        path = self._path(key)
+        return path if os.path.exists(path) else None
+
+    def local_path(self, key):
+        return self.cached_path(key)
+
+    @contextmanager
+    def lease(self, key):
+        # Stored files are never removed
+        yield self.cached_path(key)
+
+    def put_file(self, key, source_path):
+        # Takes ownership of source_path (moved into place)
+        target = self._path(key)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.chmod(source_path, 0o444)
+        os.replace(source_path, target)
+
+    def open_range(self, key, start, end):
+        return _read_file_range(self._path(key), start, end)
+
+class S3Storage:
+    def __init__(self, bucket, prefix='', endpoint_url=None, region=None):
+        self.bucket = bucket
+        self.prefix = prefix.strip('/') + '/' if prefix.strip('/') else ''
+        self.endpoint_url = endpoint_url
+        self.region = region
+        self._client = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        # boto3 clients are thread safe but must not cross a fork
+        if self._client is None or self._pid != os.getpid():
+            with self._lock:
+                if self._client is None or self._pid != os.getpid():
+                    try:
+                        import boto3
+                    except ImportError:
+                        raise RuntimeError("BOOKS_STORAGE_BACKEND=s3 requires boto3")
+                    self._client = boto3.client('s3', endpoint_url=self.endpoint_url, region_name=self.region)
+                    self._pid = os.getpid()
+        return self._client
+
+    def _key(self, key):
+        return self.prefix + key
+
+    def _call(self, operation, key, **kwargs):
+        # A missing object raises FileNotFoundError; any other failure to
+        # get an answer from the store raises StorageUnavailable
+        client = self.client
+        try:
+            return getattr(client, operation)(Bucket=self.bucket, Key=self._key(key), **kwargs)
+        except client.exceptions.ClientError as e:
+            if e.response.get('Error', {}).get('Code') in S3_NOT_FOUND_CODES:
+                raise FileNotFoundError(key) from e
+            raise StorageUnavailable(f"S3 {operation} of {key} failed: {e}") from e
+        except Exception as e:
+            raise StorageUnavailable(f"S3 {operation} of {key} failed: {e}") from e
+
+    def _head(self, key):
+        try:
+            return self._call('head_object', key)
+        except FileNotFoundError:
+            return None
+
+    def exists(self, key):
+        return self._head(key) is not None
+
+    def size(self, key):
+        head = self._head(key)
+        if head is None:
+            raise FileNotFoundError(key)
+        return head['ContentLength']
+
+    def download(self, key, target_path):
+        self.client.download_file(self.bucket, self._key(key), target_path)
+
+    def put_file(self, key, source_path):
+        self.client.upload_file(
+            source_path, self.bucket, self._key(key), ExtraArgs={'ContentType': 'application/pdf'}
+        )
+
+    def open_range(self, key, start, end):
+        # The request is made here, not on first iteration, so a missing or
+        # unreachable object fails before any response headers are sent
+        body = self._call('get_object', key, Range=f'bytes={start}-{end}')['Body']
+        return self._stream(body)
+
+    @staticmethod
+    def _stream(body):
+        try:
+            yield from body.iter_chunks(CHUNK_SIZE)
+        finally:
+            body.close()
+
+class CachedStorage:
+    # Files are cached under cache_dir with the same key layout. Recency is
+    # the file mtime (touched on every hit), so workers sharing the directory
+    # agree on what is least recently used. Eviction runs when this process
+    # has added enough to push the total over max_bytes and trims to 90%.
+    #
+    # Eviction skips files leased in this process, and files used within the
+    # last lease_seconds, which may be leased by another worker sharing the
+    # directory: a lease touches its file, and renders (the longest readers)
+    # are killed after RENDER_TIMEOUT_SECONDS. Until those age out the cache
+    # may stay over budget.
+    def __init__(self, backend, cache_dir, max_bytes, lease_seconds=RENDER_TIMEOUT_SECONDS):
+        self.backend = backend
+        self.cache_dir = cache_dir
+        self.staging_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.lease_seconds = lease_seconds
+        self._known = set()
+        self._lock = threading.Lock()
+        self._cached_bytes = None
+        self._downloads = {}
+        # {path: number of leases held in this process}
+        self._leases = {}
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def _scan(self):
+        entries = []
+        for directory, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith('.part'):
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def cached_bytes(self):
+        if self._cached_bytes is None:
+            self._cached_bytes = sum(size for _, size, _ in self._scan())
+        return self._cached_bytes
+
+    def _added(self, key, size):
+        # The file just added is never evicted, even if it alone exceeds the
+        # budget: the caller is about to read it
+        keep = self._path(key)
+        with self._lock:
+            if self._cached_bytes is None:
+                # The first scan already sees the new file
+                self.cached_bytes()
+            else:
+                self._cached_bytes += size
+            if self._cached_bytes <= self.max_bytes:
+                return
+            entries = sorted(self._scan())
+            total = sum(size for _, size, _ in entries)
+            target = self.max_bytes * 0.9
+            in_use_since = time.time() - self.lease_seconds
+            for mtime, size, path in entries:
+                if total <= target or mtime > in_use_since:
+                    break
+                if path == keep or path in self._leases:
+                    continue
+                try:
+                    # Readers that already opened the file keep their handle
+                    os.remove(path)
+                    total -= size
+                except FileNotFoundError:
+                    pass
+            self._cached_bytes = total
+            logger.info("Evicted PDF cache down to %s bytes", total)
+
+    def cached_path(self, key):
+        path = self._path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            record_cache_lookup('pdf_storage', False)
+            return None
+        record_cache_lookup('pdf_storage', True)
+        return path
+
+    def exists(self, key):
+        # Objects are immutable, so a positive answer can be remembered
+        if key in self._known or os.path.exists(self._path(key)):
+            return True
+        if self.backend.exists(key):
+            self._known.add(key)
+            return True
+        return False
+
+    def size(self, key):
+        path = self._path(key)
+        if os.path.exists(path):
+            return os.path.getsize(path)
+        return self.backend.size(key)
+
+    def local_path(self, key):
+        path = self.cached_path(key)
+        if path is not None:
+            return path
+
+        # One download per key at a time within this process
+        with self._lock:
+            event = self._downloads.get(key)
+            owner = event is None
+            if owner:
+                event = self._downloads[key] = threading.Event()
+        if not owner:
+            event.wait()
+            return self.cached_path(key)
+
+        try:
+            os.makedirs(os.path.dirname(self._path(key)), exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.part')
+            os.close(fd)
+            try:
+                self.backend.download(key, temp_path)
+                size = os.path.getsize(temp_path)
+                os.replace(temp_path, self._path(key))
+            finally:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+            logger.info("Cached %s (%s bytes)", key, size)
+            self._known.add(key)
+            self._added(key, size)
+            return self._path(key)
+        finally:
+            with self._lock:
+                self._downloads.pop(key, None)
+            event.set()
+
+    @contextmanager
+    def lease(self, key):
+        # local_path(key), pinned until the block exits. The pin is taken
+        # before the lookup so an eviction cannot slip in between.
+        path = self._path(key)
+        with self._lock:
+            self._leases[path] = self._leases.get(path, 0) + 1
+        try:
+            yield self.local_path(key)
+        finally:
+            with self._lock:
+                remaining = self._leases[path] - 1
+                if remaining:
+                    self._leases[path] = remaining
+                else:
+                    del self._leases[path]
+
+    def put_file(self, key, source_path):
+        # Upload, then keep the file: a fresh upload is likely read soon.
+        # Remote backends upload a copy and leave source_path in place.
+        self.backend.put_file(key, source_path)
+        os.makedirs(os.path.dirname(self._path(key)), exist_ok=True)
+        size = os.path.getsize(source_path)
+        os.replace(source_path, self._path(key))
+        self._known.add(key)
+        self._added(key, size)
+
+    def open_range(self, key, start, end):
+        path = self.cached_path(key)
+        if path is not None:
+            return _read_file_range(path, start, end)
+        return self.backend.open_range(key, start, end)
+
+def create_storage():
+    if STORAGE_BACKEND == 'local':
+        return LocalStorage(PDF_STORE_DIR)
+    if STORAGE_BACKEND == 's3':
+        if not S3_BUCKET:
+            raise RuntimeError("BOOKS_S3_BUCKET is required for the s3 storage backend")
+        os.makedirs(STORAGE_CACHE_DIR, exist_ok=True)
+        backend = S3Storage(S3_BUCKET, S3_PREFIX, S3_ENDPOINT_URL, S3_REGION)
+        return CachedStorage(backend, STORAGE_CACHE_DIR, STORAGE_CACHE_MAX_BYTES)
+    raise RuntimeError(f"Unknown storage backend: {STORAGE_BACKEND}")
+
+storage = create_storage()
+
+STORAGE_CACHE_BYTES = Gauge(
+    'books_storage_cache_bytes', 'Bytes held in the local PDF cache',
+    callback=lambda: storage.cached_bytes() if isinstance(storage, CachedStorage) else 0
+)
@@ -0,0 +1,353 @@
+# suggest.py
+# In-memory prefix index behind /api/v1/books/suggest.
+#
+# Titles are normalized (accents stripped, case folded, punctuation collapsed)
+# and kept in one sorted array, once per word start ("the sealed nectar",
+# "sealed nectar", "nectar"), so the books with a word matching a prefix are a
+# contiguous range found by bisection. A max segment tree over the books'
+# popularity returns the top k of any range in O(k log n) without scanning
+# it; a book reached through two of its words is returned once. Authors and
+# categories come from book_facets and are indexed and ranked by book count
+# the same way.
+#
+# Changed books are hidden in the snapshot and re-read into a small overlay
+# that queries scan linearly. Writes from this process arrive through the
+# cache invalidation hook; writes from other workers are read from the
+# book_changes log every SUGGEST_SYNC_SECONDS. Once the overlay grows past
+# SUGGEST_OVERLAY_MAX a fresh snapshot is built in the background and swapped
+# in. Author and category counts are not tracked by the overlay, so a
+# snapshot older than SUGGEST_REFRESH_SECONDS is rebuilt too, but only once
+# the catalog version has moved past the one it was loaded at.
+import os
+import re
+import time
+import heapq
+import itertools
+import bisect
+import logging
+import threading
+import traceback
+import unicodedata
+from array import array
+from config import SUGGEST_OVERLAY_MAX, SUGGEST_REFRESH_SECONDS, SUGGEST_SYNC_SECONDS
+from main_2 import DatabaseManager
+
+logger = logging.getLogger(__name__)
+
+_NON_ALNUM = re.compile(r'[^0-9a-z]+')
+_PREFIX_END = '\U0010ffff'
+
+def normalize(text):
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch)).casefold()
+    return _NON_ALNUM.sub(' ', text).strip()
+
+def word_starts(key):
+    # A normalized key and each of its suffixes that starts a word
+    starts = [key]
+    position = key.find(' ')
+    while position >= 0:
+        starts.append(key[position + 1:])
+        position = key.find(' ', position + 1)
+    return starts
+
+def _expand(entries):
+    # (keys, score, payload) -> one (key, score, payload) per word start
+    return [(key, score, payload) for keys, score, payload in entries for key in keys]
+
+class RangeTopK:
+    # Sorted keys with a max segment tree over their scores
+    def __init__(self, entries):
+        # entries: (key, score, payload), sorted here by key
+        entries.sort(key=lambda entry: entry[0])
+        self.keys = [entry[0] for entry in entries]
+        self.scores = array('q', (entry[1] for entry in entries))
+        self.payloads = [entry[2] for entry in entries]
+        self.size = len(entries)
+
+        # tree[size + i] = i; inner nodes hold the index of their subtree max
+        tree = array('q', bytes(8 * 2 * max(1, self.size)))
+        for i in range(self.size):
+            tree[self.size + i] = i
+        scores = self.scores
+        for node in range(self.size - 1, 0, -1):
+            left, right = tree[2 * node], tree[2 * node + 1]
+            tree[node] = left if scores[left] >= scores[right] else right
+        self.tree = tree
+
+    def _argmax(self, lo, hi):
+        # Index of the highest score in keys[lo:hi], or -1 if empty
+        best = -1
+        scores, tree = self.scores, self.tree
+        lo += self.size
+        hi += self.size
+        while lo < hi:
+            if lo & 1:
+                candidate = tree[lo]
+                if best < 0 or scores[candidate] > scores[best]:
+                    best = candidate
+                lo += 1
+            if hi & 1:
+                hi -= 1
+                candidate = tree[hi]
+                if best < 0 or scores[candidate] > scores[best]:
+                    best = candidate
+            lo >>= 1
+            hi >>= 1
+        return best
+
+    def prefix_range(self, prefix):
+        lo = bisect.bisect_left(self.keys, prefix)
+        hi = bisect.bisect_left(self.keys, prefix + _PREFIX_END, lo)
+        return lo, hi
+
+    def top(self, prefix, k, skip=None):
+        # Yields (score, payload) in descending score order; payloads for
+        # which skip(payload) is true are passed over. skip is consulted
+        # lazily, so it may depend on what was already yielded.
+        lo, hi = self.prefix_range(prefix)
+        heap = []
+        best = self._argmax(lo, hi)
+        if best >= 0:
+            heap.append((-self.scores[best], best, lo, hi))
+        found = 0
+        while heap and found < k:
+            _, index, lo, hi = heapq.heappop(heap)
+            payload = self.payloads[index]
+            if skip is None or not skip(payload):
+                found += 1
+                yield self.scores[index], payload
+            for sub_lo, sub_hi in ((lo, index), (index + 1, hi)):
+                best = self._argmax(sub_lo, sub_hi)
+                if best >= 0:
+                    heapq.heappush(heap, (-self.scores[best], best, sub_lo, sub_hi))
+
+class Snapshot:
+    def __init__(self, version, titles, authors, categories):
+        # Catalog version (book_changes) the snapshot is known to include,
+        # and the one its rows (and facet counts) were loaded at
+        self.version = version
+        self.loaded_version = version
+        self.titles = titles
+        self.authors = authors
+        self.categories = categories
+        self.hidden = set()
+        self.overlay = {}
+        # {book id: ticket of the load its overlay entry came from}
+        self.loaded_by = {}
+
+def _book_entry(row):
+    # Payload is (id, title, author); popularity is 1 + review count
+    return word_starts(normalize(row['title'])), 1 + row['review_count'], (row['id'], row['title'], row['author'])
+
+_BOOK_SELECT = "SELECT id, title, author, review_count FROM books"
+
+def _load_snapshot():
+    conn = DatabaseManager.get_db_connection()
+    try:
+        cursor = conn.cursor()
+        # Read before the rows: later changes are replayed, which is harmless
+        cursor.execute("SELECT COALESCE(MAX(version), 0) FROM book_changes")
+        version = cursor.fetchone()[0]
+        cursor.execute(_BOOK_SELECT)
+        titles = RangeTopK(_expand(_book_entry(row) for row in cursor))
+        facets = {}
+        for facet in ('author', 'category'):
+            cursor.execute("SELECT value, count FROM book_facets WHERE facet = ?", (facet,))
+            facets[facet] = RangeTopK(_expand(
+                (word_starts(normalize(row['value'])), row['count'], row['value']) for row in cursor
+            ))
+    finally:
+        conn.close()
+    return Snapshot(version, titles, facets['author'], facets['category'])
+
+def _load_books(book_ids):
+    conn = DatabaseManager.get_db_connection()
+    try:
+        placeholders = ','.join('?' * len(book_ids))
+        cursor = conn.cursor()
+        cursor.execute(f"{_BOOK_SELECT} WHERE id IN ({placeholders})", tuple(book_ids))
+        return {row['id']: _book_entry(row) for row in cursor}
+    finally:
+        conn.close()
+
+class SuggestIndex:
+    def __init__(self):
+        self._snapshot = None
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+        self._building = False
+        self._built_at = 0.0
+        self._synced_at = 0.0
+        self._syncing = False
+        self._changed_during_build = set()
+        self._tickets = itertools.count()
+        self._pid = None
+
+    def start(self):
+        # Builds the first snapshot in the background. Safe to call again
+        # after fork: the parent's build thread and lock do not survive it,
+        # its snapshot is kept and served until the rebuild lands.
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._building = self._syncing = False
+        self._schedule_rebuild()
+
+    def _schedule_rebuild(self):
+        with self._lock:
+            if self._building:
+                return
+            self._building = True
+            self._changed_during_build = set()
+        threading.Thread(target=self._rebuild, name='suggest-index', daemon=True).start()
+
+    def _rebuild(self):
+        try:
+            start = time.perf_counter()
+            snapshot = _load_snapshot()
+            # Replay writes that landed while the snapshot was loading, until
+            # none are left to swap in atomically
+            while True:
+                with self._lock:
+                    changed, self._changed_during_build = self._changed_during_build, set()
+                    if not changed:
+                        self._snapshot = snapshot
+                        self._built_at = self._synced_at = time.monotonic()
+                        self._building = False
+                        break
+                self._apply_changes(snapshot, changed, building=True)
+            self._ready.set()
+            logger.info("Suggest index built: %s titles, %s authors in %.2fs",
+                        snapshot.titles.size, snapshot.authors.size, time.perf_counter() - start)
+        except Exception as e:
+            logger.error("Error building suggest index: %s", e)
+            logger.error(traceback.format_exc())
+            with self._lock:
+                self._building = False
+
+    def _apply_changes(self, snapshot, book_ids, building=False):
+        # Rows are loaded outside the lock and merged under it, so concurrent
+        # writers keep each other's changes. A load that started earlier
+        # never replaces a book's row from one that started later. Copy-on-write
+        # so readers never see a half-applied overlay.
+        ticket = next(self._tickets)
+        rows = _load_books(sorted(book_ids))
+        with self._lock:
+            if not building and snapshot is not self._snapshot:
+                # Replaced by a rebuild, which loaded or replays these books
+                return
+            hidden = snapshot.hidden | set(book_ids)
+            overlay, loaded_by = dict(snapshot.overlay), dict(snapshot.loaded_by)
+            for book_id in book_ids:
+                if loaded_by.get(book_id, -1) > ticket:
+                    continue
+                loaded_by[book_id] = ticket
+                overlay.pop(book_id, None)
+                if book_id in rows:
+                    overlay[book_id] = rows[book_id]
+            snapshot.hidden, snapshot.overlay, snapshot.loaded_by = hidden, overlay, loaded_by
+
+    def on_catalog_change(self, book_ids=None):
+        if self._snapshot is None:
+            return
+        if book_ids is None:
+            self._schedule_rebuild()
+            return
+
+        with self._lock:
+            snapshot = self._snapshot
+            if self._building:
+                # Also replayed onto the snapshot being built
+                self._changed_during_build.update(book_ids)
+        self._apply_changes(snapshot, book_ids)
+        if len(snapshot.hidden) > SUGGEST_OVERLAY_MAX:
+            self._schedule_rebuild()
+
+    def _schedule_sync(self):
+        with self._lock:
+            if self._syncing or self._building:
+                return
+            self._syncing = True
+        threading.Thread(target=self._sync, name='suggest-sync', daemon=True).start()
+
+    def _sync(self):
+        # Applies changes committed by any process since the snapshot version
+        try:
+            snapshot = self._snapshot
+            conn = DatabaseManager.get_db_connection()
+            try:
+                rows = conn.execute(
+                    "SELECT book_id, version FROM book_changes WHERE version > ? ORDER BY version LIMIT ?",
+                    (snapshot.version, SUGGEST_OVERLAY_MAX + 1)
+                ).fetchall()
+            finally:
+                conn.close()
+
+            if len(rows) > SUGGEST_OVERLAY_MAX:
+                self._schedule_rebuild()
+                return
+            if rows:
+                self.on_catalog_change([row['book_id'] for row in rows])
+                snapshot.version = rows[-1]['version']
+            if (snapshot.version > snapshot.loaded_version
+                    and time.monotonic() - self._built_at > SUGGEST_REFRESH_SECONDS):
+                # Refreshes the facet counts; an unchanged catalog keeps its snapshot
+                self._schedule_rebuild()
+        except Exception as e:
+            logger.error("Error syncing suggest index: %s", e)
+            logger.error(traceback.format_exc())
+        finally:
+            self._synced_at = time.monotonic()
+            with self._lock:
+                self._syncing = False
+
+    def get(self, timeout):
+        if self._pid != os.getpid():
+            self.start()
+        if not self._ready.wait(timeout):
+            return None
+        if time.monotonic() - self._synced_at > SUGGEST_SYNC_SECONDS:
+            self._schedule_sync()
+        return self._snapshot
+
+    def suggest(self, prefix, limit=8, timeout=5.0):
+        # Returns None while the first snapshot is still being built
+        snapshot = self.get(timeout)
+        if snapshot is None:
+            return None
+
+        key = normalize(prefix)
+        hidden, overlay = snapshot.hidden, snapshot.overlay
+        titles, seen = [], set()
+        skip = lambda payload: payload[0] in seen or payload[0] in hidden
+        for score, payload in snapshot.titles.top(key, limit, skip=skip):
+            seen.add(payload[0])
+            titles.append((score, payload))
+        if overlay:
+            titles.extend((score, payload) for entry_keys, score, payload in overlay.values()
+                          if any(entry_key.startswith(key) for entry_key in entry_keys))
+            titles.sort(key=lambda item: (-item[0], item[1][0]))
+            del titles[limit:]
+
+        return {
+            'prefix': prefix,
+            'titles': [
+                {'id': book_id, 'title': title, 'author': author, 'score': score}
+                for score, (book_id, title, author) in titles
+            ],
+            'authors': _facet_top(snapshot.authors, key, limit),
+            'categories': _facet_top(snapshot.categories, key, limit),
+        }
+
+def _facet_top(facet, key, limit):
+    # An author matched through two of their words is listed once
+    values, seen = [], set()
+    for count, value in facet.top(key, limit, skip=lambda value: value in seen):
+        seen.add(value)
+        values.append({'value': value, 'count': count})
+    return values
+
+index = SuggestIndex()
+DatabaseManager.register_cache_invalidation_hook(index.on_catalog_change)
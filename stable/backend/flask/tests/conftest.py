@@ -0,0 +1,121 @@
+# tests/conftest.py
+# Every setting is read from the environment when config.py is imported, so
+# the test environment is fixed here, before any service module is loaded:
+# one scratch directory per run holds the database, stores, covers and logs,
+# admin tokens are checked against a key set generated for the run, and
+# query budgets are strict so a route over budget fails its test.
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+
+import jwt
+import pytest
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVICE_DIR)
+
+SCRATCH = tempfile.mkdtemp(prefix='books-tests-')
+SIGNING_KEY = Ed25519PrivateKey.generate()
+KEY_ID = 'test-key'
+
+def _write_jwks(path):
+    jwk = json.loads(jwt.algorithms.OKPAlgorithm.to_jwk(SIGNING_KEY.public_key()))
+    jwk.update({'kid': KEY_ID, 'alg': 'EdDSA', 'use': 'sig'})
+    with open(path, 'w') as f:
+        json.dump({'keys': [jwk]}, f)
+    return path
+
+os.environ.update({
+    'BOOKS_DB_PATH': os.path.join(SCRATCH, 'books.db'),
+    'BOOKS_PDF_STORE_DIR': os.path.join(SCRATCH, 'pdf_store'),
+    'BOOKS_STORAGE_CACHE_DIR': os.path.join(SCRATCH, 'pdf_cache'),
+    'BOOKS_COVER_DIR': os.path.join(SCRATCH, 'covers'),
+    'BOOKS_LIBRARY_DIR': os.path.join(SCRATCH, 'library'),
+    'BOOKS_LOG_FILE': os.path.join(SCRATCH, 'logs', 'app.log'),
+    'BOOKS_PROFILE_DIR': os.path.join(SCRATCH, 'profiles'),
+    'BOOKS_JWKS_FILE': _write_jwks(os.path.join(SCRATCH, 'jwks.json')),
+    'BOOKS_RATE_LIMIT': '0',
+    'BOOKS_QUERY_TRACE': '1',
+    'BOOKS_QUERY_BUDGET_STRICT': '1',
+    'BOOKS_WRITE_GROUP_COMMIT_MS': '1',
+})
+
+def admin_token(email='admin@example.com', expires_in=300):
+    claims = {'email': email, 'exp': int(time.time()) + expires_in}
+    return jwt.encode(claims, SIGNING_KEY, algorithm='EdDSA', headers={'kid': KEY_ID})
+
+@pytest.fixture(scope='session')
+def service():
+    import main
+    main.initialize_app()
+    main.initialize_worker()
+    main.app.testing = True
+    yield main
+    # Stop the writer and flush logging while pytest's streams are still open
+    from main_2 import write_queue
+    from log_config import stop_logging
+    write_queue.close()
+    stop_logging()
+    shutil.rmtree(SCRATCH, ignore_errors=True)
+
+@pytest.fixture
+def client(service):
+    return service.app.test_client()
+
+@pytest.fixture
+def admin_headers():
+    return {'Authorization': f'Bearer {admin_token()}'}
+
+def _clear_catalog(cursor):
+    for table in ('reviews', 'books', 'book_changes', 'book_facets', 'pdf_files', 'pdf_page_sizes'):
+        cursor.execute(f"DELETE FROM {table}")
+    cursor.execute("DELETE FROM sqlite_sequence WHERE name IN ('books', 'reviews')")
+
+def _insert_books(cursor, books):
+    ids = []
+    for book in books:
+        columns = ', '.join(book)
+        placeholders = ', '.join('?' for _ in book)
+        cursor.execute(f"INSERT INTO books ({columns}) VALUES ({placeholders})", tuple(book.values()))
+        ids.append(cursor.lastrowid)
+    return ids
+
+def _insert_reviews(cursor, reviews):
+    cursor.executemany("INSERT INTO reviews (book_id, text, author) VALUES (?, ?, ?)", reviews)
+
+class Catalog:
+    # Writes test data through the service's own writer thread
+    def __init__(self):
+        from main_2 import write_queue, DatabaseManager
+        self.write_queue = write_queue
+        self.db = DatabaseManager
+
+    def add_books(self, count=1, **fields):
+        books = []
+        for n in range(count):
+            book = {
+                'title': f'Book {n}', 'author': f'Author {n % 3}', 'category': ('Fiction', 'History')[n % 2],
+                'publication_year': 2000 + n, 'isbn': f'isbn-{n}', 'pdf_path': None,
+            }
+            book.update({key: value(n) if callable(value) else value for key, value in fields.items()})
+            books.append(book)
+        ids = self.write_queue.execute(_insert_books, books)
+        self.db.invalidate_caches(ids)
+        return ids
+
+    def add_reviews(self, book_id, count):
+        self.write_queue.execute(
+            _insert_reviews, [(book_id, f'Review {n}', f'Reader {n}') for n in range(count)]
+        )
+        self.db.invalidate_caches([book_id])
+
+@pytest.fixture
+def catalog(service):
+    from main_2 import write_queue, DatabaseManager
+    write_queue.execute(_clear_catalog)
+    DatabaseManager.invalidate_caches()
+    return Catalog()
@@ -0,0 +1,79 @@
+# tests/test_auth.py
+import json
+import time
+import jwt
+import pytest
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+
+import auth
+from conftest import admin_token, KEY_ID
+
+def _jwks(path, keys):
+    documents = []
+    for kid, key in keys.items():
+        jwk = json.loads(jwt.algorithms.OKPAlgorithm.to_jwk(key.public_key()))
+        jwk.update({'kid': kid, 'alg': 'EdDSA', 'use': 'sig'})
+        documents.append(jwk)
+    path.write_text(json.dumps({'keys': documents}))
+
+def _sign(key, kid, expires_in=300):
+    return jwt.encode({'email': 'admin@example.com', 'exp': int(time.time()) + expires_in},
+                      key, algorithm='EdDSA', headers={'kid': kid})
+
+@pytest.fixture
+def key_set(tmp_path, monkeypatch):
+    key = Ed25519PrivateKey.generate()
+    path = tmp_path / 'jwks.json'
+    _jwks(path, {'first': key})
+    keys = auth.KeySet(path=str(path), refresh_seconds=3600, min_refresh_seconds=30)
+    keys.start()
+    monkeypatch.setattr(auth, 'key_set', keys)
+    keys.key, keys.file = key, path
+    yield keys
+    keys._stop.set()
+
+def test_tokens_verify_locally(key_set):
+    assert auth.decode_admin_token(_sign(key_set.key, 'first'))['email'] == 'admin@example.com'
+
+def test_a_rotated_key_is_fetched_once_when_first_seen(key_set):
+    rotated = Ed25519PrivateKey.generate()
+    _jwks(key_set.file, {'first': key_set.key, 'second': rotated})
+    key_set._attempted_at -= key_set.min_refresh_seconds
+    assert auth.decode_admin_token(_sign(rotated, 'second'))['email'] == 'admin@example.com'
+
+def test_unknown_key_refreshes_are_rate_limited(key_set, monkeypatch):
+    refreshes = []
+    refresh = key_set.refresh
+    monkeypatch.setattr(key_set, 'refresh', lambda: refreshes.append(1) or refresh())
+    key_set._attempted_at -= key_set.min_refresh_seconds
+    stranger = Ed25519PrivateKey.generate()
+    for _ in range(5):
+        with pytest.raises(jwt.InvalidTokenError):
+            auth.decode_admin_token(_sign(stranger, 'unknown'))
+    assert len(refreshes) == 1
+
+def test_a_failed_refresh_keeps_the_last_good_keys(key_set):
+    key_set.file.write_text('not json')
+    assert key_set.refresh() is False
+    assert auth.decode_admin_token(_sign(key_set.key, 'first'))['email'] == 'admin@example.com'
+
+def test_tokens_signed_by_another_key_are_rejected(key_set):
+    forged = _sign(Ed25519PrivateKey.generate(), 'first')
+    with pytest.raises(jwt.InvalidSignatureError):
+        auth.decode_admin_token(forged)
+
+@pytest.mark.parametrize('token, message', [
+    (None, 'Authentication required'),
+    ('garbage', 'Invalid token'),
+    (admin_token(expires_in=-10), 'Token has expired'),
+])
+def test_admin_routes_reject_bad_tokens(client, catalog, token, message):
+    headers = {'Authorization': f'Bearer {token}'} if token else {}
+    response = client.post('/api/v1/books/batch/delete', headers=headers, json={'ids': [1]})
+    assert response.status_code == 401
+    assert response.json['message'] == message
+
+def test_admin_routes_accept_service_tokens(client, catalog, admin_headers):
+    assert jwt.get_unverified_header(admin_headers['Authorization'].split()[1])['kid'] == KEY_ID
+    response = client.post('/api/v1/books/batch/delete', headers=admin_headers, json={'ids': [1]})
+    assert response.status_code == 200
@@ -0,0 +1,73 @@
+# tests/test_bench.py
+import os
+import sqlite3
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import pytest
+from bench import corpus
+from bench.load import Scenario, mixed_scenario, run_scenario
+from bench.report import percentile, summarize_latencies
+from bench.compare import compare
+from migrations import migrate, SCHEMA_VERSION
+
+def test_generated_pdfs_have_the_requested_pages(tmp_path):
+    from PyPDF2 import PdfReader
+    paths = corpus.generate_pdfs(str(tmp_path), text_pages=(3,), image_pages=(2,))
+    assert [os.path.basename(path) for path in paths] == ['text-3.pdf', 'image-2.pdf']
+    assert [len(PdfReader(path).pages) for path in paths] == [3, 2]
+
+def test_generated_catalog_migrates_to_the_current_schema(tmp_path):
+    db_path, pdf_paths = corpus.generate(str(tmp_path), 50, text_pages=(1,), image_pages=())
+    conn = sqlite3.connect(db_path)
+    try:
+        assert conn.execute("SELECT COUNT(*) FROM books").fetchone()[0] == 50
+        assert {row[0] for row in conn.execute("SELECT DISTINCT pdf_path FROM books")} == set(pdf_paths)
+        migrate(conn)
+        assert conn.execute("SELECT MAX(version) FROM schema_version").fetchone()[0] == SCHEMA_VERSION
+    finally:
+        conn.close()
+
+def test_percentiles_use_nearest_rank():
+    values = list(range(1, 101))
+    assert percentile(values, 0.5) == 50
+    assert percentile(values, 0.95) == 95
+    assert percentile([], 0.5) is None
+    summary = summarize_latencies([0.001, 0.003, 0.002], elapsed=1.0, errors=1)
+    assert summary['requests'] == 4 and summary['errors'] == 1
+    assert summary['p50_ms'] == 2.0 and summary['max_ms'] == 3.0
+
+def test_compare_flags_regressions_past_the_threshold():
+    before = {'results': {'get_books': {'throughput_rps': 100, 'p95_ms': 10}}}
+    after = {'results': {'get_books': {'throughput_rps': 95, 'p95_ms': 15}}}
+    _, regressions = compare(before, after, threshold=10)
+    assert [(name, metric) for name, metric, _ in regressions] == [('get_books', 'p95_ms')]
+
+@pytest.fixture
+def http_server():
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            status = 404 if self.path == '/missing' else 200
+            self.send_response(status)
+            self.send_header('Content-Length', '2')
+            self.end_headers()
+            self.wfile.write(b'ok')
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_port}'
+    server.shutdown()
+    server.server_close()
+
+def test_load_harness_counts_successes_and_errors(http_server):
+    scenario = mixed_scenario('mix', [Scenario('ok', lambda rng: '/ok'), Scenario('missing', lambda rng: '/missing')],
+                              [3, 1])
+    result = run_scenario(http_server, scenario, concurrency=2, duration=0.3)
+    assert result['requests'] > 0
+    assert 0 < result['errors'] < result['requests']
+    assert result['concurrency'] == 2 and result['p50_ms'] is not None
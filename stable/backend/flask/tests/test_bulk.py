@@ -0,0 +1,93 @@
+# tests/test_bulk.py
+import pytest
+from main_2 import DatabaseManager
+
+@pytest.fixture
+def invalidations():
+    calls = []
+    hook = DatabaseManager.register_cache_invalidation_hook(lambda book_ids: calls.append(book_ids))
+    yield calls
+    from main_2 import _cache_invalidation_hooks
+    _cache_invalidation_hooks.remove(hook)
+
+def test_batch_update_applies_every_item(client, catalog, admin_headers):
+    ids = catalog.add_books(3)
+    response = client.patch('/api/v1/books/batch', headers=admin_headers, json={'updates': [
+        {'id': ids[0], 'title': 'First'},
+        {'id': ids[1], 'title': 'Second', 'publication_year': 1999},
+        {'id': ids[2], 'category': 'Poetry'},
+    ]})
+    assert response.status_code == 200
+    assert response.json == {'updated': 3}
+    assert DatabaseManager.get_book_by_id(ids[0]).title == 'First'
+    assert DatabaseManager.get_book_by_id(ids[1]).publication_year == 1999
+    assert DatabaseManager.get_book_by_id(ids[2]).category == 'Poetry'
+
+@pytest.mark.parametrize('item, message', [
+    ({'title': None}, "'title' cannot be null"),
+    ({'author': 7}, "'author' must be a string"),
+    ({'publication_year': '1999'}, "'publication_year' must be an integer"),
+    ({'publication_year': True}, "'publication_year' must be an integer"),
+    ({'shelf': 'A3'}, "unknown book fields: shelf"),
+])
+def test_batch_update_rejects_the_whole_batch_for_one_bad_item(client, catalog, admin_headers, item, message):
+    ids = catalog.add_books(2)
+    response = client.patch('/api/v1/books/batch', headers=admin_headers, json={'updates': [
+        {'id': ids[0], 'title': 'Changed'},
+        {'id': ids[1], **item},
+    ]})
+    assert response.status_code == 400
+    assert 'Update 1' in response.json['message']
+    assert message in response.json['message']
+    # Validated before queueing: the good item was not applied either
+    assert DatabaseManager.get_book_by_id(ids[0]).title == 'Book 0'
+
+def test_batch_update_counts_only_existing_books(client, catalog, admin_headers):
+    ids = catalog.add_books(1)
+    response = client.patch('/api/v1/books/batch', headers=admin_headers, json={'updates': [
+        {'id': ids[0], 'title': 'Kept'},
+        {'id': 999999, 'title': 'Nobody'},
+    ]})
+    assert response.status_code == 200
+    assert response.json == {'updated': 1}
+
+def test_batch_update_invalidates_caches_once(client, catalog, admin_headers, invalidations):
+    ids = catalog.add_books(3)
+    invalidations.clear()
+    client.patch('/api/v1/books/batch', headers=admin_headers,
+                 json={'updates': [{'id': book_id, 'isbn': 'x'} for book_id in ids]})
+    assert invalidations == [ids]
+
+def test_batch_update_requires_admin(client, catalog):
+    ids = catalog.add_books(1)
+    response = client.patch('/api/v1/books/batch', json={'updates': [{'id': ids[0], 'title': 'x'}]})
+    assert response.status_code == 401
+
+def test_batch_delete_removes_books_and_their_reviews(client, catalog, admin_headers, invalidations):
+    ids = catalog.add_books(3)
+    catalog.add_reviews(ids[0], 2)
+    invalidations.clear()
+    response = client.post('/api/v1/books/batch/delete', headers=admin_headers,
+                           json={'ids': [ids[0], ids[1], 424242]})
+    assert response.status_code == 200
+    assert DatabaseManager.get_book_by_id(ids[0]) is None
+    assert DatabaseManager.get_book_by_id(ids[1]) is None
+    assert DatabaseManager.get_book_by_id(ids[2]) is not None
+    assert DatabaseManager.get_book_reviews(ids[0]) == []
+    assert invalidations == [[ids[0], ids[1], 424242]]
+
+@pytest.mark.parametrize('payload', [{'ids': [1, 'two']}, {'ids': [True]}, {'ids': 3}, {}])
+def test_batch_delete_rejects_bad_ids(client, catalog, admin_headers, payload):
+    ids = catalog.add_books(1)
+    response = client.post('/api/v1/books/batch/delete', headers=admin_headers, json=payload)
+    assert response.status_code == 400
+    assert DatabaseManager.get_book_by_id(ids[0]) is not None
+
+def test_single_deletes_are_observed_once(catalog):
+    from metrics import DB_QUERIES
+    book_id, = catalog.add_books(1)
+    before = DB_QUERIES.value(method='bulk_delete_books', outcome='ok')
+    assert DatabaseManager.delete_book(book_id)
+    assert DB_QUERIES.value(method='bulk_delete_books', outcome='ok') == before + 1
+    assert DB_QUERIES.value(method='delete_book', outcome='ok') == 0
+    assert DatabaseManager.get_book_by_id(book_id) is None
@@ -0,0 +1,65 @@
+# tests/test_catalog.py
+import sqlite3
+import pytest
+from config import DATABASE_PATH
+from main_2 import DatabaseManager
+
+@pytest.fixture
+def books(catalog):
+    return catalog.add_books(
+        6,
+        title=lambda n: f'Title {"FEDCBA"[n]}',
+        author=lambda n: ('Ann', 'Bob')[n % 2],
+        category=lambda n: ('Fiction', 'History', 'Science')[n % 3],
+        publication_year=lambda n: 1990 + n,
+    )
+
+def _titles(response):
+    assert response.status_code == 200
+    return [book['title'] for book in response.json]
+
+def test_filters_combine(client, books):
+    assert _titles(client.get('/api/v1/books/?category=Fiction')) == ['Title F', 'Title C']
+    assert _titles(client.get('/api/v1/books/?author=Ann&year_from=1992&year_to=1994')) == ['Title D', 'Title B']
+
+@pytest.mark.parametrize('sort, expected', [
+    ('title', ['Title A', 'Title B', 'Title C', 'Title D', 'Title E', 'Title F']),
+    ('-year', ['Title A', 'Title B', 'Title C', 'Title D', 'Title E', 'Title F']),
+    ('year', ['Title F', 'Title E', 'Title D', 'Title C', 'Title B', 'Title A']),
+])
+def test_sort_orders(client, books, sort, expected):
+    assert _titles(client.get(f'/api/v1/books/?sort={sort}')) == expected
+
+def test_pages_are_stable(client, books):
+    first = _titles(client.get('/api/v1/books/?sort=author&limit=4'))
+    second = _titles(client.get('/api/v1/books/?sort=author&limit=4&offset=4'))
+    assert first + second == _titles(client.get('/api/v1/books/?sort=author'))
+    assert len(first) == 4 and len(second) == 2
+
+@pytest.mark.parametrize('query', ['sort=price', 'limit=ten', 'year_from=old'])
+def test_bad_parameters_are_rejected(client, books, query):
+    assert client.get(f'/api/v1/books/?{query}').status_code == 400
+
+def test_facet_counts_follow_inserts_updates_and_deletes(client, books):
+    facets = client.get('/api/v1/facets').json
+    assert {f['value']: f['count'] for f in facets['category']} == {'Fiction': 2, 'History': 2, 'Science': 2}
+    assert {f['value']: f['count'] for f in facets['author']} == {'Ann': 3, 'Bob': 3}
+
+    DatabaseManager.bulk_update_books([{'id': books[0], 'category': 'History', 'author': 'Cy'}])
+    DatabaseManager.bulk_delete_books([books[3]])
+    facets = client.get('/api/v1/facets?limit=1').json
+    assert facets['category'] == [{'value': 'History', 'count': 3}]
+    assert facets['author'] == [{'value': 'Ann', 'count': 2}]
+    counts = {f['value']: f['count'] for f in client.get('/api/v1/facets').json['category']}
+    assert counts == {'History': 3, 'Science': 2}
+
+@pytest.mark.parametrize('where, index', [
+    ("category = 'Fiction' ORDER BY title", 'idx_books_category_title'),
+    ("category = 'Fiction' AND publication_year >= 1990", 'idx_books_category_year'),
+    ("author = 'Ann' ORDER BY publication_year", 'idx_books_author_year'),
+])
+def test_filters_are_served_by_indexes(service, where, index):
+    with sqlite3.connect(DATABASE_PATH) as conn:
+        plan = ' '.join(row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN SELECT * FROM books WHERE {where}"))
+    assert index in plan
+    assert 'TEMP B-TREE' not in plan
@@ -0,0 +1,118 @@
+# tests/test_changes.py
+import pytest
+import changes
+from main_2 import DatabaseManager, write_queue
+
+def _changes(client, since=0, limit=500):
+    response = client.get(f'/api/v1/books/changes?since={since}&limit={limit}')
+    assert response.status_code == 200
+    return response.json
+
+def _ops(feed):
+    return [(change['id'], change['op']) for change in feed['changes']]
+
+def _delete_reviews(cursor, book_id):
+    cursor.execute("DELETE FROM reviews WHERE book_id = ?", (book_id,))
+
+def test_inserts_updates_and_deletes_are_logged_once_per_book(client, catalog):
+    first, second, third = catalog.add_books(3)
+    feed = _changes(client)
+    assert _ops(feed) == [(first, 'upsert'), (second, 'upsert'), (third, 'upsert')]
+    assert feed['changes'][0]['book']['title'] == 'Book 0'
+    version = feed['version']
+
+    DatabaseManager.bulk_update_books([{'id': first, 'title': 'Renamed'}])
+    DatabaseManager.bulk_delete_books([second])
+    DatabaseManager.bulk_update_books([{'id': first, 'title': 'Renamed again'}])
+    feed = _changes(client, version)
+    # Only the latest change of each book, in version order; deletes stay as tombstones
+    assert _ops(feed) == [(second, 'delete'), (first, 'upsert')]
+    assert feed['changes'][0]['book'] is None
+    assert feed['changes'][1]['book']['title'] == 'Renamed again'
+    assert _changes(client, feed['version']) == {'version': feed['version'], 'has_more': False, 'changes': []}
+
+def test_reviews_bump_their_book(client, catalog):
+    book_id, other = catalog.add_books(2)
+    version = _changes(client)['version']
+    catalog.add_reviews(book_id, 2)
+    feed = _changes(client, version)
+    assert _ops(feed) == [(book_id, 'upsert')]
+    assert feed['changes'][0]['book']['review_count'] == 2
+
+    write_queue.execute(_delete_reviews, book_id)
+    DatabaseManager.invalidate_caches([book_id])
+    feed = _changes(client, feed['version'])
+    assert _ops(feed) == [(book_id, 'upsert')]
+    assert feed['changes'][0]['book']['review_count'] == 0
+
+def test_changes_page_with_has_more(client, catalog):
+    ids = catalog.add_books(5)
+    seen, version = [], 0
+    while True:
+        feed = _changes(client, version, limit=2)
+        seen.extend(change['id'] for change in feed['changes'])
+        version = feed['version']
+        if not feed['has_more']:
+            break
+    assert seen == ids
+
+@pytest.mark.parametrize('query', ['since=-1', 'limit=0', 'limit=1001', 'since=999999'])
+def test_bad_change_requests_are_rejected(client, catalog, query):
+    assert client.get(f'/api/v1/books/changes?{query}').status_code == 400
+
+def _text(chunk):
+    return chunk.decode() if isinstance(chunk, bytes) else chunk
+
+def test_stream_sends_the_current_version_first(client, catalog):
+    catalog.add_books(2)
+    version = DatabaseManager.get_catalog_version()
+    response = client.get('/api/v1/books/changes/stream', buffered=False)
+    try:
+        assert response.mimetype == 'text/event-stream'
+        chunks = iter(response.response)
+        assert _text(next(chunks)) == f'event: version\nid: {version}\ndata: {{"version": {version}}}\n\n'
+        assert _text(next(chunks)).startswith('retry: ')
+    finally:
+        response.close()
+
+def test_stream_skips_a_version_the_client_already_has(client, catalog):
+    catalog.add_books(1)
+    version = DatabaseManager.get_catalog_version()
+    response = client.get('/api/v1/books/changes/stream', headers={'Last-Event-ID': str(version)}, buffered=False)
+    try:
+        assert _text(next(iter(response.response))).startswith('retry: ')
+    finally:
+        response.close()
+
+def test_streams_are_capped_per_worker(client, catalog, monkeypatch):
+    monkeypatch.setattr(changes, 'CHANGES_MAX_STREAMS', 2)
+    assert changes.open_streams() == 0
+    first = client.get('/api/v1/books/changes/stream', buffered=False)
+    second = client.get('/api/v1/books/changes/stream', buffered=False)
+    assert changes.open_streams() == 2
+
+    refused = client.get('/api/v1/books/changes/stream')
+    assert refused.status_code == 503
+    assert refused.headers['Retry-After'] == '5'
+    assert '/api/v1/books/changes' in refused.json['message']
+
+    # A stream that never sent anything still gives its slot back on close
+    first.close()
+    assert changes.open_streams() == 1
+    third = client.get('/api/v1/books/changes/stream', buffered=False)
+    assert third.status_code == 200
+    second.close()
+    third.close()
+    assert changes.open_streams() == 0
+
+def test_local_writes_wake_open_streams(client, catalog):
+    catalog.add_books(1)
+    response = client.get('/api/v1/books/changes/stream', buffered=False)
+    try:
+        chunks = iter(response.response)
+        next(chunks), next(chunks)
+        catalog.add_books(1)
+        version = DatabaseManager.get_catalog_version()
+        assert _text(next(chunks)).startswith(f'event: version\nid: {version}\n')
+    finally:
+        response.close()
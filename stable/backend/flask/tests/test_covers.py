@@ -0,0 +1,105 @@
+# tests/test_covers.py
+import io
+import os
+import pytest
+import pdf2image
+from PIL import Image
+
+import covers
+from config import COVER_WIDTHS
+from metrics import RENDER_SECONDS, COVER_RENDER_SECONDS
+from main_2 import DatabaseManager, write_queue
+
+@pytest.fixture
+def rasterize(monkeypatch):
+    # Stands in for poppler: one page at the requested width, twice as tall
+    calls = []
+
+    def convert_from_path(pdf_path, first_page, last_page, size, timeout):
+        calls.append((pdf_path, first_page, last_page, size))
+        width = size[0]
+        return [Image.new('RGB', (width, 2 * width), (200, 40, 40))]
+
+    monkeypatch.setattr(pdf2image, 'convert_from_path', convert_from_path)
+    return calls
+
+@pytest.mark.parametrize('requested, width', [(1, 160), (160, 160), (161, 320), (640, 640), (5000, 640)])
+def test_pick_width_covers_the_request(requested, width):
+    assert covers.pick_width(requested) == width
+
+def test_covers_rasterize_the_first_page_once_at_the_largest_width(rasterize):
+    rendered, placeholder, version = covers.render_covers('book.pdf')
+    assert rasterize == [('book.pdf', 1, 1, (COVER_WIDTHS[-1], None))]
+    assert sorted(rendered) == list(COVER_WIDTHS)
+    for width, data in rendered.items():
+        with Image.open(io.BytesIO(data)) as image:
+            assert image.format == 'WEBP'
+            assert image.size == (width, 2 * width)
+    assert placeholder.startswith('data:image/webp;base64,')
+    assert len(placeholder) < 1000
+    assert len(version) == 16
+
+def _observations(histogram, stage):
+    state = histogram._values.get((stage,))
+    return state[1] if state else 0
+
+def test_cover_timings_stay_out_of_the_preview_series(rasterize):
+    before = {stage: _observations(RENDER_SECONDS, stage) for stage in ('rasterize', 'resize', 'encode')}
+    resized = _observations(COVER_RENDER_SECONDS, 'resize')
+    covers.render_covers('book.pdf')
+    assert {stage: _observations(RENDER_SECONDS, stage) for stage in before} == before
+    assert _observations(COVER_RENDER_SECONDS, 'resize') == resized + len(COVER_WIDTHS)
+
+def test_generate_covers_writes_files_and_stores_the_placeholder(catalog, rasterize):
+    book_id, = catalog.add_books(1, pdf_path='book.pdf')
+    version = covers.generate_covers(DatabaseManager.get_book_by_id(book_id))
+    for width in COVER_WIDTHS:
+        assert os.path.exists(covers.cover_path(book_id, width))
+    book = DatabaseManager.get_book_by_id(book_id)
+    assert book.cover_version == version
+    assert book.cover_placeholder.startswith('data:image/webp;base64,')
+    assert book.cover_urls()[320] == f'/api/v1/books/{book_id}/cover?w=320&v={version}'
+
+def test_changing_the_pdf_resets_the_cover(catalog, rasterize):
+    book_id, = catalog.add_books(1, pdf_path='book.pdf')
+    covers.generate_covers(DatabaseManager.get_book_by_id(book_id))
+    write_queue.execute(lambda cursor: cursor.execute("UPDATE books SET pdf_path = 'other.pdf' WHERE id = ?", (book_id,)))
+    DatabaseManager.invalidate_caches([book_id])
+    book = DatabaseManager.get_book_by_id(book_id)
+    assert book.cover_version is None and book.cover_placeholder is None
+
+def test_cover_route_renders_on_first_request_then_serves_the_file(client, catalog, rasterize):
+    book_id, = catalog.add_books(1, pdf_path='book.pdf')
+    first = client.get(f'/api/v1/books/{book_id}/cover?w=200')
+    assert first.status_code == 200
+    assert first.mimetype == 'image/webp'
+    assert len(rasterize) == 1
+
+    version = DatabaseManager.get_book_by_id(book_id).cover_version
+    again = client.get(f'/api/v1/books/{book_id}/cover?w=200')
+    assert again.status_code == 200
+    assert again.headers['ETag'] == f'"{version}"'
+    assert len(rasterize) == 1
+
+def test_versioned_cover_urls_are_immutable(client, catalog, rasterize):
+    book_id, = catalog.add_books(1, pdf_path='book.pdf')
+    client.get(f'/api/v1/books/{book_id}/cover')
+    version = DatabaseManager.get_book_by_id(book_id).cover_version
+
+    versioned = client.get(f'/api/v1/books/{book_id}/cover?w=640&v={version}')
+    assert versioned.cache_control.max_age == 31536000
+    assert versioned.cache_control.immutable
+
+    unversioned = client.get(f'/api/v1/books/{book_id}/cover?w=640')
+    assert not unversioned.cache_control.immutable
+    revalidated = client.get(f'/api/v1/books/{book_id}/cover?w=640', headers={'If-None-Match': f'"{version}"'})
+    assert revalidated.status_code == 304
+
+def test_cover_route_404s_when_rendering_fails(client, catalog, monkeypatch):
+    def convert_from_path(*args, **kwargs):
+        raise OSError('unreadable')
+
+    monkeypatch.setattr(pdf2image, 'convert_from_path', convert_from_path)
+    book_id, = catalog.add_books(1, pdf_path='missing.pdf')
+    assert client.get(f'/api/v1/books/{book_id}/cover').status_code == 404
+    assert client.get('/api/v1/books/999999/cover').status_code == 404
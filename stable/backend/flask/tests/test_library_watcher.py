@@ -0,0 +1,225 @@
+# tests/test_library_watcher.py
+import os
+import sys
+import time
+import types
+import pytest
+from PyPDF2 import PdfWriter
+
+import covers
+import pdf_store
+import library_watcher
+from library_watcher import LibraryWatcher, Inotify, IN_CLOSE_WRITE, IN_DELETE
+from main_2 import DatabaseManager
+from config import COVER_WIDTHS
+
+class Stop(Exception):
+    pass
+
+def _write_pdf(path, pages, width=612, height=792):
+    writer = PdfWriter()
+    for _ in range(pages):
+        writer.add_blank_page(width=width, height=height)
+    with open(path, 'wb') as f:
+        writer.write(f)
+
+def _add_covers(book_id):
+    for width in COVER_WIDTHS:
+        path = covers.cover_path(book_id, width)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(b'webp')
+
+def _has_covers(book_id):
+    return all(os.path.exists(covers.cover_path(book_id, width)) for width in COVER_WIDTHS)
+
+@pytest.fixture
+def library(tmp_path):
+    root = tmp_path / 'library'
+    root.mkdir()
+    return root
+
+@pytest.fixture
+def hashes(monkeypatch):
+    # Paths hashed, to check unchanged files are only stat'ed
+    hashed = []
+    hash_file = pdf_store.hash_file
+
+    def counting(path):
+        hashed.append(os.path.basename(path))
+        return hash_file(path)
+
+    monkeypatch.setattr(pdf_store, 'hash_file', counting)
+    return hashed
+
+def test_new_pdfs_update_the_books_that_point_at_them(catalog, library):
+    _write_pdf(library / 'a.pdf', 2)
+    (library / 'nested').mkdir()
+    _write_pdf(library / 'nested' / 'b.pdf', 3, width=300)
+    (library / 'notes.txt').write_text('not a pdf')
+    first, second, other = catalog.add_books(3, pdf_path=lambda n: (
+        str(library / 'a.pdf'), str(library / 'nested' / 'b.pdf'), None)[n])
+
+    assert LibraryWatcher(str(library)).scan() == (2, 0, 2)
+    book = DatabaseManager.get_book_by_id(first)
+    assert book.page_count == 2
+    assert book.pdf_sha256 == pdf_store.hash_file(str(library / 'a.pdf'))
+    assert pdf_store.exists(book.pdf_sha256)
+    assert DatabaseManager.get_page_sizes(book.pdf_sha256) == [[2, 612, 792]]
+    assert DatabaseManager.get_book_by_id(second).page_count == 3
+    assert DatabaseManager.get_book_by_id(other).pdf_sha256 is None
+
+def test_an_unchanged_library_costs_no_hashing(catalog, library, hashes):
+    _write_pdf(library / 'a.pdf', 1)
+    catalog.add_books(1, pdf_path=str(library / 'a.pdf'))
+    watcher = LibraryWatcher(str(library))
+    watcher.scan()
+    assert hashes == ['a.pdf']
+    assert watcher.scan() == (0, 0, 0)
+    assert hashes == ['a.pdf']
+
+def test_state_survives_a_restart(catalog, library, hashes):
+    _write_pdf(library / 'a.pdf', 1)
+    catalog.add_books(1, pdf_path=str(library / 'a.pdf'))
+    LibraryWatcher(str(library)).scan()
+    restarted = LibraryWatcher(str(library))
+    assert set(restarted.state) == {'a.pdf'}
+    assert restarted.scan() == (0, 0, 0)
+    assert hashes == ['a.pdf']
+
+def test_a_touched_file_is_hashed_but_changes_nothing(catalog, library, hashes):
+    _write_pdf(library / 'a.pdf', 1)
+    book_id, = catalog.add_books(1, pdf_path=str(library / 'a.pdf'))
+    watcher = LibraryWatcher(str(library))
+    watcher.scan()
+    _add_covers(book_id)
+    version = DatabaseManager.get_catalog_version()
+
+    later = time.time() + 10
+    os.utime(library / 'a.pdf', (later, later))
+    assert watcher.scan() == (0, 0, 0)
+    assert hashes == ['a.pdf', 'a.pdf']
+    assert _has_covers(book_id)
+    assert DatabaseManager.get_catalog_version() == version
+    # The new stat is recorded, so the next scan does not hash again
+    assert watcher.state['a.pdf'][1] == os.stat(library / 'a.pdf').st_mtime_ns
+    assert LibraryWatcher(str(library)).scan() == (0, 0, 0)
+    assert len(hashes) == 2
+
+def test_books_added_after_their_pdf_was_indexed_are_linked(catalog, library, hashes):
+    _write_pdf(library / 'a.pdf', 2)
+    watcher = LibraryWatcher(str(library))
+    assert watcher.scan() == (1, 0, 0)
+    digest = watcher.state['a.pdf'][2]
+
+    book_id, = catalog.add_books(1, pdf_path=str(library / 'a.pdf'))
+    assert watcher.scan() == (0, 0, 1)
+    book = DatabaseManager.get_book_by_id(book_id)
+    assert (book.pdf_sha256, book.page_count) == (digest, 2)
+    assert pdf_store.exists(digest)
+    # Linked from the recorded state, without hashing the file again
+    assert hashes == ['a.pdf']
+    assert watcher.scan() == (0, 0, 0)
+
+def test_a_touched_file_links_books_added_since(catalog, library):
+    _write_pdf(library / 'a.pdf', 1)
+    watcher = LibraryWatcher(str(library))
+    watcher.scan()
+    book_id, = catalog.add_books(1, pdf_path=str(library / 'a.pdf'))
+    later = time.time() + 10
+    os.utime(library / 'a.pdf', (later, later))
+    assert watcher.check(['a.pdf']) == (0, 0, 1)
+    assert DatabaseManager.get_book_by_id(book_id).pdf_sha256 == watcher.state['a.pdf'][2]
+
+def test_replaced_content_drops_only_the_affected_covers(catalog, library):
+    _write_pdf(library / 'a.pdf', 1)
+    _write_pdf(library / 'b.pdf', 1)
+    changed, unchanged = catalog.add_books(2, pdf_path=lambda n: str(library / ('a.pdf', 'b.pdf')[n]))
+    watcher = LibraryWatcher(str(library))
+    watcher.scan()
+    before = DatabaseManager.get_book_by_id(changed).pdf_sha256
+    _add_covers(changed)
+    _add_covers(unchanged)
+
+    _write_pdf(library / 'a.pdf', 4)
+    assert watcher.check(['a.pdf', 'b.pdf']) == (1, 0, 1)
+    book = DatabaseManager.get_book_by_id(changed)
+    assert book.pdf_sha256 != before and book.page_count == 4
+    assert not _has_covers(changed)
+    assert _has_covers(unchanged)
+    # The old content is still stored for anything holding its digest
+    assert pdf_store.exists(before)
+
+def test_removed_files_keep_their_stored_copy(catalog, library):
+    _write_pdf(library / 'a.pdf', 1)
+    book_id, = catalog.add_books(1, pdf_path=str(library / 'a.pdf'))
+    watcher = LibraryWatcher(str(library))
+    watcher.scan()
+    digest = DatabaseManager.get_book_by_id(book_id).pdf_sha256
+
+    os.remove(library / 'a.pdf')
+    assert watcher.scan() == (0, 1, 0)
+    assert watcher.state == {}
+    assert DatabaseManager.get_pdf_files() == {}
+    assert DatabaseManager.get_book_by_id(book_id).pdf_sha256 == digest
+
+def test_a_file_still_being_written_waits_for_the_next_pass(catalog, library, monkeypatch):
+    _write_pdf(library / 'a.pdf', 1)
+    book_id, = catalog.add_books(1, pdf_path=str(library / 'a.pdf'))
+    hash_file = pdf_store.hash_file
+
+    def appending(path):
+        digest = hash_file(path)
+        with open(path, 'ab') as f:
+            f.write(b'\n')
+        return digest
+
+    monkeypatch.setattr(pdf_store, 'hash_file', appending)
+    watcher = LibraryWatcher(str(library))
+    assert watcher.scan() == (0, 0, 0)
+    assert watcher.state == {}
+    assert DatabaseManager.get_book_by_id(book_id).pdf_sha256 is None
+
+    monkeypatch.setattr(pdf_store, 'hash_file', hash_file)
+    assert watcher.scan() == (1, 0, 1)
+
+def test_a_missing_root_is_an_error_not_a_mass_removal(catalog, library):
+    _write_pdf(library / 'a.pdf', 1)
+    catalog.add_books(1, pdf_path=str(library / 'a.pdf'))
+    LibraryWatcher(str(library)).scan()
+    os.rename(library, str(library) + '-unmounted')
+    with pytest.raises(FileNotFoundError):
+        LibraryWatcher(str(library)).scan()
+    assert set(DatabaseManager.get_pdf_files()) == {'a.pdf'}
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason="inotify is Linux only")
+def test_inotify_reports_writes_and_deletes(library):
+    (library / 'nested').mkdir()
+    notifier = Inotify()
+    try:
+        notifier.watch_tree(str(library))
+        _write_pdf(library / 'nested' / 'a.pdf', 1)
+        os.remove(library / 'nested' / 'a.pdf')
+        events, deadline = [], time.monotonic() + 5
+        while len(events) < 2 and time.monotonic() < deadline:
+            events.extend((path, mask) for path, mask in notifier.read(0.5)
+                          if mask & (IN_CLOSE_WRITE | IN_DELETE))
+    finally:
+        notifier.close()
+    path = str(library / 'nested' / 'a.pdf')
+    assert [(p, bool(mask & IN_CLOSE_WRITE)) for p, mask in events] == [(path, True), (path, False)]
+
+def test_a_failing_first_scan_does_not_stop_the_watcher(service, tmp_path, monkeypatch):
+    def no_inotify():
+        raise OSError('unavailable')
+
+    def sleep(seconds):
+        raise Stop()
+
+    monkeypatch.setattr(library_watcher, 'Inotify', no_inotify)
+    monkeypatch.setattr(library_watcher, 'time', types.SimpleNamespace(
+        sleep=sleep, monotonic=time.monotonic, perf_counter=time.perf_counter))
+    watcher = LibraryWatcher(str(tmp_path / 'not-mounted'))
+    # The missing root is logged and the watcher carries on to its poll loop
+    with pytest.raises(Stop):
+        watcher.run()
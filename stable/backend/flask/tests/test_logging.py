@@ -0,0 +1,46 @@
+# tests/test_logging.py
+import json
+import time
+import logging
+from config import LOG_FILE
+from log_config import JsonFormatter, SamplingFilter, SAMPLED, _RequestQueueHandler
+
+def _record(level=logging.INFO, msg='hello %s', args=('world',), **extra):
+    record = logging.makeLogRecord({'name': 'test', 'levelno': level, 'levelname': logging.getLevelName(level),
+                                    'msg': msg, 'args': args})
+    for key, value in extra.items():
+        setattr(record, key, value)
+    return record
+
+def test_sampling_drops_only_sampled_info_lines():
+    never = SamplingFilter(0.0)
+    assert not never.filter(_record(**SAMPLED))
+    assert never.filter(_record())
+    assert never.filter(_record(level=logging.WARNING, **SAMPLED))
+    assert SamplingFilter(1.0).filter(_record(**SAMPLED))
+
+def test_json_output_carries_extra_fields():
+    entry = json.loads(JsonFormatter().format(_record(book_id=7)))
+    assert entry['message'] == 'hello world'
+    assert entry['level'] == 'INFO'
+    assert entry['book_id'] == 7
+    assert 'sampled' not in entry
+
+def test_queue_handler_only_merges_arguments():
+    args = ['before']
+    record = _RequestQueueHandler(None).prepare(_record(args=(args,)))
+    args[0] = 'after'
+    assert record.msg == "hello ['before']"
+    assert record.args is None
+
+def test_records_reach_the_file_through_the_listener(service):
+    marker = f'listener-check-{time.time_ns()}'
+    logging.getLogger('tests').warning(marker)
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        with open(LOG_FILE) as f:
+            if marker in f.read():
+                break
+        time.sleep(0.05)
+    else:
+        raise AssertionError("record never written")
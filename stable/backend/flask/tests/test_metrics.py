@@ -0,0 +1,73 @@
+# tests/test_metrics.py
+import os
+import pytest
+import metrics
+from metrics import Counter, Gauge, Histogram, observe_db
+
+@pytest.fixture
+def registry():
+    # Metrics made by a test are dropped from the scrape output afterwards
+    before = list(metrics._registry)
+    yield
+    metrics._registry[:] = before
+
+def _samples(text, name):
+    return [line for line in text.splitlines() if line.startswith(name)]
+
+def test_histogram_buckets_are_cumulative(registry):
+    histogram = Histogram('test_latency_seconds', 'Test', ('route',), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 5.0):
+        histogram.observe(value, route='/x')
+    lines = histogram.render()
+    pid = os.getpid()
+    assert f'test_latency_seconds_bucket{{route="/x",le="0.1",pid="{pid}"}} 1' in lines
+    assert f'test_latency_seconds_bucket{{route="/x",le="1.0",pid="{pid}"}} 2' in lines
+    assert f'test_latency_seconds_bucket{{route="/x",le="+Inf",pid="{pid}"}} 3' in lines
+    assert f'test_latency_seconds_count{{route="/x",pid="{pid}"}} 3' in lines
+    assert f'test_latency_seconds_sum{{route="/x",pid="{pid}"}} 5.55' in lines
+
+def test_counter_and_callback_gauge(registry):
+    counter = Counter('test_events_total', 'Test', ('kind',))
+    counter.inc(kind='a')
+    counter.inc(2, kind='a')
+    assert counter.value(kind='a') == 3
+    gauge = Gauge('test_depth', 'Test', ('queue',), callback=lambda: {('q',): 4})
+    assert gauge.render()[-1] == f'test_depth{{queue="q",pid="{os.getpid()}"}} 4'
+
+def test_label_values_are_escaped(registry):
+    counter = Counter('test_escape_total', 'Test', ('value',))
+    counter.inc(value='a"b\\c\nd')
+    assert counter.render()[-1].startswith('test_escape_total{value="a\\"b\\\\c\\nd"')
+
+def test_observe_db_counts_calls_and_errors():
+    @observe_db('test_method')
+    def method(fail):
+        if fail:
+            raise RuntimeError('boom')
+
+    ok, errors = metrics.DB_QUERIES.value(method='test_method', outcome='ok'), \
+        metrics.DB_QUERIES.value(method='test_method', outcome='error')
+    method(False)
+    with pytest.raises(RuntimeError):
+        method(True)
+    assert metrics.DB_QUERIES.value(method='test_method', outcome='ok') == ok + 1
+    assert metrics.DB_QUERIES.value(method='test_method', outcome='error') == errors + 1
+
+def test_requests_are_labelled_by_url_rule(client, catalog):
+    ids = catalog.add_books(2)
+    client.get(f'/api/v1/books/{ids[0]}/reviews')
+    client.get(f'/api/v1/books/{ids[1]}/reviews')
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    counts = _samples(response.get_data(as_text=True), 'books_http_requests_total{')
+    route = [line for line in counts if 'route="/api/v1/books/<int:book_id>/reviews"' in line]
+    assert route and int(route[0].rsplit(' ', 1)[1]) >= 2
+    assert not any(f'/api/v1/books/{ids[0]}/' in line for line in counts)
+
+def test_cover_and_preview_renders_are_separate_series(client):
+    metrics.COVER_RENDER_SECONDS.observe(0.01, stage='resize')
+    text = client.get('/metrics').get_data(as_text=True)
+    assert '# TYPE books_cover_render_seconds histogram' in text
+    assert 'books_cover_render_seconds_count{stage="resize"' in text
+    assert 'books_render_stage_duration_seconds_count{stage="resize"' not in text
@@ -0,0 +1,194 @@
+# tests/test_migrations.py
+import os
+import sys
+import sqlite3
+import logging
+import threading
+import subprocess
+import pytest
+import migrations
+from migrations import migrate, current_version, SCHEMA_VERSION
+
+# books.db as the service created it before the schema was versioned
+LEGACY_SCHEMA = '''
+CREATE TABLE books (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    title TEXT NOT NULL,
+    author TEXT NOT NULL,
+    category TEXT NOT NULL,
+    description TEXT,
+    cover_image TEXT,
+    publication_year INTEGER,
+    isbn TEXT,
+    pdf_path TEXT
+);
+CREATE TABLE reviews (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    book_id INTEGER,
+    text TEXT NOT NULL,
+    author TEXT NOT NULL,
+    FOREIGN KEY(book_id) REFERENCES books(id)
+);
+INSERT INTO books (title, author, category, publication_year, pdf_path) VALUES
+    ('The Sealed Nectar', 'Safiur Rahman', 'History', 1979, 'pdfs/nectar.pdf'),
+    ('Clean Code', 'Robert Martin', 'Programming', 2008, NULL),
+    ('Clean Architecture', 'Robert Martin', 'Programming', 2017, NULL);
+INSERT INTO reviews (book_id, text, author) VALUES
+    (1, 'Moving', 'A'), (2, 'Useful', 'B'), (2, 'Dated', 'C');
+'''
+
+def _connect(path):
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+@pytest.fixture
+def legacy(tmp_path):
+    path = str(tmp_path / 'legacy.db')
+    with _connect(path) as conn:
+        conn.executescript(LEGACY_SCHEMA)
+    return path
+
+def _columns(conn, table):
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+def _names(conn, kind):
+    return {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = ?", (kind,))}
+
+def test_a_pre_versioning_database_is_brought_to_the_current_schema(legacy):
+    conn = _connect(legacy)
+    try:
+        assert current_version(conn) == 0
+        assert migrate(conn) == list(range(1, SCHEMA_VERSION + 1))
+        assert current_version(conn) == SCHEMA_VERSION
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+
+        assert {'cover_placeholder', 'cover_version', 'pdf_sha256', 'review_count', 'latest_review_id',
+                'page_count'} <= _columns(conn, 'books')
+        assert {'book_facets', 'book_changes', 'pdf_files', 'pdf_page_sizes', 'schema_version'} <= _names(conn, 'table')
+        assert {'idx_books_category_title', 'idx_reviews_book_id', 'idx_books_pdf_path'} <= _names(conn, 'index')
+
+        # Existing rows are backfilled
+        facets = {(row['facet'], row['value']): row['count'] for row in conn.execute("SELECT * FROM book_facets")}
+        assert facets[('author', 'Robert Martin')] == 2
+        assert facets[('category', 'History')] == 1
+        assert sorted(row[0] for row in conn.execute("SELECT book_id FROM book_changes")) == [1, 2, 3]
+        aggregates = conn.execute("SELECT id, review_count, latest_review_id FROM books ORDER BY id").fetchall()
+        assert [tuple(row) for row in aggregates] == [(1, 1, 1), (2, 2, 3), (3, 0, None)]
+    finally:
+        conn.close()
+
+def test_triggers_work_on_a_migrated_database(legacy):
+    conn = _connect(legacy)
+    try:
+        migrate(conn)
+        with conn:
+            conn.execute("INSERT INTO reviews (book_id, text, author) VALUES (3, 'Clear', 'D')")
+            conn.execute("UPDATE books SET category = 'Software' WHERE id = 2")
+        assert conn.execute("SELECT review_count FROM books WHERE id = 3").fetchone()[0] == 1
+        counts = dict(conn.execute("SELECT value, count FROM book_facets WHERE facet = 'category'").fetchall())
+        assert counts['Programming'] == 1 and counts['Software'] == 1
+        latest = conn.execute("SELECT book_id FROM book_changes ORDER BY version DESC LIMIT 1").fetchone()[0]
+        assert latest == 2
+    finally:
+        conn.close()
+
+def test_a_current_database_costs_one_select(legacy):
+    conn = _connect(legacy)
+    try:
+        migrate(conn)
+        statements = []
+        conn.set_trace_callback(statements.append)
+        assert migrate(conn) == []
+        assert statements == ["SELECT MAX(version) FROM schema_version"]
+    finally:
+        conn.close()
+
+def test_objects_created_before_versioning_are_kept(legacy):
+    # A database from a build that already had some of these objects
+    conn = _connect(legacy)
+    try:
+        with conn:
+            conn.execute("ALTER TABLE books ADD COLUMN cover_version TEXT")
+            conn.execute("CREATE INDEX idx_books_title ON books(title)")
+            conn.execute("CREATE TABLE book_facets (facet TEXT NOT NULL, value TEXT NOT NULL, "
+                         "count INTEGER NOT NULL, PRIMARY KEY (facet, value))")
+            conn.execute("INSERT INTO book_facets VALUES ('category', 'History', 1)")
+        assert migrate(conn) == list(range(1, SCHEMA_VERSION + 1))
+        # Facets already present are not counted twice
+        assert conn.execute("SELECT COUNT(*) FROM book_facets").fetchone()[0] == 1
+    finally:
+        conn.close()
+
+def test_only_missing_migrations_run(legacy, monkeypatch):
+    conn = _connect(legacy)
+    try:
+        monkeypatch.setattr(migrations, 'SCHEMA_VERSION', 5)
+        monkeypatch.setattr(migrations, 'SCHEMA_MIGRATIONS', migrations.SCHEMA_MIGRATIONS[:5])
+        assert migrations.migrate(conn) == [1, 2, 3, 4, 5]
+        monkeypatch.undo()
+        assert migrate(conn) == list(range(6, SCHEMA_VERSION + 1))
+    finally:
+        conn.close()
+
+def test_a_failing_migration_rolls_back_the_whole_run(legacy, monkeypatch):
+    def broken(cursor):
+        raise sqlite3.OperationalError('boom')
+
+    monkeypatch.setattr(migrations, 'SCHEMA_MIGRATIONS', migrations.SCHEMA_MIGRATIONS + ((99, 'broken', broken),))
+    monkeypatch.setattr(migrations, 'SCHEMA_VERSION', 99)
+    conn = _connect(legacy)
+    try:
+        with pytest.raises(sqlite3.OperationalError):
+            migrations.migrate(conn)
+        assert current_version(conn) == 0
+        assert 'review_count' not in _columns(conn, 'books')
+    finally:
+        conn.close()
+
+def test_a_newer_database_is_left_alone(legacy, caplog):
+    conn = _connect(legacy)
+    try:
+        migrate(conn)
+        with conn:
+            conn.execute("INSERT INTO schema_version (version, description) VALUES (?, 'future')",
+                         (SCHEMA_VERSION + 1,))
+        with caplog.at_level(logging.WARNING, logger='migrations'):
+            assert migrate(conn) == []
+        assert 'newer than this code' in caplog.text
+    finally:
+        conn.close()
+
+def test_concurrent_starts_apply_each_migration_once(legacy):
+    barrier = threading.Barrier(4)
+    results, errors = [], []
+
+    def start():
+        conn = sqlite3.connect(legacy, timeout=10)
+        try:
+            barrier.wait()
+            results.append(migrate(conn))
+        except Exception as e:
+            errors.append(e)
+        finally:
+            conn.close()
+
+    threads = [threading.Thread(target=start) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert sorted(number for applied in results for number in applied) == list(range(1, SCHEMA_VERSION + 1))
+    with _connect(legacy) as conn:
+        assert [row[0] for row in conn.execute("SELECT version FROM schema_version")] == \
+            list(range(1, SCHEMA_VERSION + 1))
+
+def test_importing_the_app_does_not_load_the_rendering_stack(service):
+    # A fresh interpreter, with the test environment conftest set up
+    code = ("import sys, main; "
+            "print(' '.join(m for m in ('pdf2image', 'PIL', 'PyPDF2', 'fitz') if m in sys.modules))")
+    result = subprocess.run([sys.executable, '-c', code], cwd=os.path.dirname(migrations.__file__),
+                            capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == ''
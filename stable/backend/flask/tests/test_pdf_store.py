@@ -0,0 +1,112 @@
+# tests/test_pdf_store.py
+import io
+import hashlib
+import pytest
+
+import pdf_store
+from storage import LocalStorage
+from main_2 import DatabaseManager
+
+CONTENT = b'%PDF-1.4\n' + bytes(range(256)) * 40
+
+class StreamingStorage(LocalStorage):
+    # Nothing is ever on local disk, so responses take the streamed path
+    def cached_path(self, key):
+        return None
+
+@pytest.fixture(params=['local', 'streamed'])
+def stored(request, tmp_path, monkeypatch):
+    backend = LocalStorage if request.param == 'local' else StreamingStorage
+    monkeypatch.setattr(pdf_store, 'storage', backend(str(tmp_path / 'store')))
+    digest, new = pdf_store.put_stream(io.BytesIO(CONTENT))
+    assert new
+    return digest
+
+def _upload(client, headers, book_id, data=CONTENT):
+    return client.post(f'/api/v1/books/{book_id}/pdf', headers=headers,
+                       data={'file': (io.BytesIO(data), 'book.pdf')}, content_type='multipart/form-data')
+
+def test_identical_uploads_are_stored_once(client, catalog, admin_headers, tmp_path, monkeypatch):
+    monkeypatch.setattr(pdf_store, 'storage', LocalStorage(str(tmp_path / 'store')))
+    first, second = catalog.add_books(2)
+    digest = hashlib.sha256(CONTENT).hexdigest()
+
+    response = _upload(client, admin_headers, first)
+    assert response.status_code == 200
+    assert response.json == {'sha256': digest, 'deduplicated': False, 'pdf_url': f'/api/v1/pdfs/{digest}'}
+    response = _upload(client, admin_headers, second)
+    assert response.json['deduplicated'] is True
+
+    assert DatabaseManager.get_book_by_id(first).pdf_sha256 == digest
+    assert DatabaseManager.get_book_by_id(second).pdf_sha256 == digest
+    files = [path for path in (tmp_path / 'store').rglob('*') if path.is_file()]
+    assert [path.name for path in files] == [f'{digest}.pdf']
+    assert str(files[0].relative_to(tmp_path / 'store')) == pdf_store.key_for(digest)
+
+def test_upload_requires_a_file_and_a_book(client, catalog, admin_headers):
+    book_id, = catalog.add_books(1)
+    assert client.post(f'/api/v1/books/{book_id}/pdf', headers=admin_headers).status_code == 400
+    assert _upload(client, admin_headers, 999999).status_code == 404
+    assert _upload(client, {}, book_id).status_code == 401
+
+def test_digest_urls_are_immutable(client, stored):
+    response = client.get(f'/api/v1/pdfs/{stored}')
+    assert response.status_code == 200
+    assert response.data == CONTENT
+    assert response.headers['ETag'] == f'"{stored}"'
+    assert response.cache_control.max_age == 31536000
+    assert response.cache_control.immutable
+    assert client.get(f'/api/v1/pdfs/{stored}', headers={'If-None-Match': f'"{stored}"'}).status_code == 304
+
+@pytest.mark.parametrize('digest', ['0' * 64, 'not-a-digest', '../../etc/passwd'])
+def test_unknown_digests_404(client, stored, digest):
+    assert client.get(f'/api/v1/pdfs/{digest}').status_code == 404
+
+def test_range_requests_return_partial_content(client, stored):
+    response = client.get(f'/api/v1/pdfs/{stored}', headers={'Range': 'bytes=100-199'})
+    assert response.status_code == 206
+    assert response.data == CONTENT[100:200]
+    assert response.headers['Content-Range'] == f'bytes 100-199/{len(CONTENT)}'
+    assert response.headers['Accept-Ranges'] == 'bytes'
+
+    tail = client.get(f'/api/v1/pdfs/{stored}', headers={'Range': 'bytes=-10'})
+    assert tail.status_code == 206
+    assert tail.data == CONTENT[-10:]
+
+def test_unsatisfiable_ranges_return_416(client, stored):
+    response = client.get(f'/api/v1/pdfs/{stored}', headers={'Range': f'bytes={len(CONTENT)}-'})
+    assert response.status_code == 416
+    assert response.headers['Content-Range'] == f'bytes */{len(CONTENT)}'
+
+def test_if_range_honours_only_the_current_etag(client, stored):
+    fresh = client.get(f'/api/v1/pdfs/{stored}', headers={'Range': 'bytes=0-9', 'If-Range': f'"{stored}"'})
+    assert fresh.status_code == 206
+    assert fresh.data == CONTENT[:10]
+
+    stale = client.get(f'/api/v1/pdfs/{stored}', headers={'Range': 'bytes=0-9', 'If-Range': '"something-else"'})
+    assert stale.status_code == 200
+    assert stale.data == CONTENT
+
+def test_book_download_serves_stored_content_as_an_attachment(client, catalog, stored):
+    book_id, = catalog.add_books(1, pdf_sha256=stored, pdf_path='/library/original.pdf')
+    response = client.get(f'/api/v1/books/{book_id}/download', headers={'Range': 'bytes=0-3'})
+    assert response.status_code == 206
+    assert response.data == b'%PDF'
+    assert 'attachment' in response.headers['Content-Disposition']
+    assert 'original.pdf' in response.headers['Content-Disposition']
+
+def test_import_links_existing_files_by_digest(catalog, tmp_path, monkeypatch):
+    monkeypatch.setattr(pdf_store, 'storage', LocalStorage(str(tmp_path / 'store')))
+    original, copy, other = tmp_path / 'a.pdf', tmp_path / 'b.pdf', tmp_path / 'c.pdf'
+    original.write_bytes(CONTENT)
+    copy.write_bytes(CONTENT)
+    other.write_bytes(CONTENT + b'%%EOF')
+    paths = [str(original), str(copy), str(other), str(tmp_path / 'gone.pdf')]
+    ids = catalog.add_books(4, pdf_path=lambda n: paths[n])
+
+    assert pdf_store.import_books() == (3, 2, 1)
+    digests = [DatabaseManager.get_book_by_id(book_id).pdf_sha256 for book_id in ids]
+    assert digests[0] == digests[1] == hashlib.sha256(CONTENT).hexdigest()
+    assert digests[2] != digests[0] and digests[3] is None
+    # Already linked books are skipped on the next run
+    assert pdf_store.import_books() == (0, 0, 1)
@@ -0,0 +1,59 @@
+# tests/test_profiling.py
+import os
+import time
+import pytest
+from flask import Flask
+import profiling
+
+@pytest.fixture
+def profiled_app(service, monkeypatch, tmp_path):
+    monkeypatch.setattr(profiling, 'PROFILING_ENABLED', True)
+    monkeypatch.setattr(profiling, 'PROFILE_DIR', str(tmp_path))
+    monkeypatch.setattr(profiling, 'TRACEMALLOC_FRAMES', 0)
+    app = Flask('profiled')
+
+    @app.route('/work')
+    def work():
+        return str(sum(range(10000)))
+
+    profiling.init_app(app)
+    app.profile_dir = str(tmp_path)
+    return app
+
+def test_profiling_is_not_installed_by_default(client):
+    response = client.get('/api/v1/admin/profiling/tracemalloc')
+    assert response.status_code == 404
+
+@pytest.mark.parametrize('mode, suffix', [('cpu', '.prof'), ('sample', '.folded')])
+def test_admin_can_profile_one_request(profiled_app, admin_headers, mode, suffix):
+    response = profiled_app.test_client().get('/work', headers={**admin_headers, 'X-Profile': mode})
+    assert response.status_code == 200
+    output = response.headers['X-Profile-Output']
+    assert output.endswith(suffix) and '-work.' in output
+    assert os.path.exists(os.path.join(profiled_app.profile_dir, output))
+
+def test_profile_header_needs_an_admin_token(profiled_app):
+    response = profiled_app.test_client().get('/work', headers={'X-Profile': 'cpu'})
+    assert response.status_code == 200
+    assert 'X-Profile-Output' not in response.headers
+    assert os.listdir(profiled_app.profile_dir) == []
+
+def test_stack_sampler_records_the_target_thread(tmp_path):
+    import threading
+    stop = threading.Event()
+
+    def spin():
+        while not stop.is_set():
+            sum(range(1000))
+
+    thread = threading.Thread(target=spin)
+    thread.start()
+    sampler = profiling.StackSampler(thread.ident, 0.001)
+    sampler.start()
+    time.sleep(0.1)
+    sampler.stop()
+    stop.set()
+    thread.join()
+    assert any('spin' in stack for stack in sampler.stacks)
+    sampler.write_folded(tmp_path / 'out.folded')
+    assert (tmp_path / 'out.folded').read_text().strip()
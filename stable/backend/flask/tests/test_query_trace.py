@@ -0,0 +1,146 @@
+# tests/test_query_trace.py
+import gc
+import os
+import sys
+import logging
+import threading
+import subprocess
+import pytest
+
+import main_2
+import query_trace
+from query_trace import query_budget, count_queries, QueryBudgetExceeded, TracedCursor, QUERY_COUNT_HEADER
+from main_2 import DatabaseManager
+
+@pytest.fixture
+def seeded(catalog):
+    ids = catalog.add_books(40, title=lambda n: f'Nectar {n}')
+    for book_id in ids[:10]:
+        catalog.add_reviews(book_id, 6)
+    return ids
+
+def test_the_suite_runs_with_strict_budgets():
+    assert query_trace.QUERY_BUDGET_STRICT
+    assert DatabaseManager.get_db_connection().__class__ is query_trace.TracedConnection
+
+@pytest.mark.parametrize('url', [
+    '/api/v1/books/',
+    '/api/v1/books/?category=Fiction&sort=title&limit=20',
+    '/api/v1/books/?author=Author%201',
+    '/api/v1/books/{book}/reviews',
+    '/api/v1/books/{book}/reviews?limit=5&before=999999',
+    '/api/v1/facets',
+    '/api/v1/facets?limit=2',
+    '/api/v1/books/suggest?prefix=nec',
+    '/api/v1/books/changes',
+])
+def test_read_routes_stay_within_their_budgets(client, seeded, url):
+    # Over budget, QueryBudgetExceeded turns the response into a 500
+    response = client.get(url.format(book=seeded[0]))
+    assert response.status_code == 200
+    assert QUERY_COUNT_HEADER in response.headers
+
+def test_listings_with_review_previews_do_not_query_per_book(client, seeded, monkeypatch):
+    monkeypatch.setattr(main_2, 'REVIEW_PREVIEW_COUNT', 3)
+    small = client.get('/api/v1/books/?limit=2')
+    large = client.get('/api/v1/books/?limit=40')
+    assert len(large.json) == 40
+    assert sum(1 for book in large.json if book['reviews']) == 10
+    assert large.headers[QUERY_COUNT_HEADER] == small.headers[QUERY_COUNT_HEADER]
+
+def _three_queries():
+    conn = DatabaseManager.get_db_connection()
+    try:
+        for _ in range(3):
+            conn.execute("SELECT COUNT(*) FROM books").fetchone()
+    finally:
+        conn.close()
+    return 'ok'
+
+def test_going_over_budget_fails_when_strict(service):
+    with pytest.raises(QueryBudgetExceeded, match='issued 3 queries'):
+        query_budget(2)(_three_queries)()
+    assert query_budget(3)(_three_queries)() == 'ok'
+
+def test_going_over_budget_warns_otherwise(service, monkeypatch, caplog):
+    monkeypatch.setattr(query_trace, 'QUERY_BUDGET_STRICT', False)
+    with caplog.at_level(logging.WARNING, logger='query_trace'):
+        assert query_budget(2)(_three_queries)() == 'ok'
+    assert 'budget 2' in caplog.text
+
+@pytest.fixture
+def conn(service):
+    query_trace.reset()
+    conn = DatabaseManager.get_db_connection()
+    yield conn
+    conn.close()
+
+def _statement(sql):
+    return next(s for s in query_trace.top_statements(1000) if s['sql'] == sql)
+
+def test_statements_count_when_executed_however_they_are_read(conn, seeded):
+    with count_queries() as counter:
+        conn.execute("SELECT id FROM books").fetchall()
+        for _ in conn.execute("SELECT id FROM books WHERE id > ?", (0,)):
+            pass
+        # Never read at all
+        conn.execute("SELECT id FROM books WHERE id < ?", (10,))
+    assert counter.count == 3
+    assert _statement("SELECT id FROM books")['rows'] == 40
+    # Rows read by iteration are not counted
+    iterated = _statement("SELECT id FROM books WHERE id > ?")
+    assert (iterated['calls'], iterated['rows']) == (1, 0)
+
+def test_fetches_add_to_their_statement(conn, seeded):
+    cursor = conn.execute("SELECT id FROM books ORDER BY id")
+    assert cursor.fetchone() is not None
+    assert len(cursor.fetchmany(9)) == 9
+    assert len(cursor.fetchall()) == 30
+    statement = _statement("SELECT id FROM books ORDER BY id")
+    assert (statement['calls'], statement['rows']) == (1, 40)
+    assert statement['total_seconds'] >= statement['max_seconds'] > 0
+
+def test_writes_count_the_rows_they_change(conn, seeded):
+    with conn:
+        conn.executemany("UPDATE books SET isbn = ? WHERE id = ?", [('x', seeded[0]), ('y', seeded[1])])
+    statement = _statement("UPDATE books SET isbn = ? WHERE id = ?")
+    assert (statement['calls'], statement['rows']) == (1, 2)
+
+def test_collected_cursors_record_nothing(service):
+    # Collecting a cursor while the statement table is locked, as a garbage
+    # collection pass triggered inside _record would, must not deadlock
+    assert '__del__' not in TracedCursor.__dict__
+
+    def collect():
+        conn = DatabaseManager.get_db_connection()
+        try:
+            cursor = conn.execute("SELECT id FROM books")
+            with query_trace._statements_lock:
+                del cursor
+                gc.collect()
+        finally:
+            conn.close()
+
+    thread = threading.Thread(target=collect, daemon=True)
+    thread.start()
+    thread.join(5)
+    assert not thread.is_alive()
+
+def test_slow_statements_are_logged_once_with_their_plan(conn, seeded, monkeypatch, caplog):
+    monkeypatch.setattr(query_trace, 'QUERY_SLOW_MS', 0)
+    with caplog.at_level(logging.WARNING, logger='query_trace'):
+        cursor = conn.execute("SELECT id FROM books WHERE category = ?", ('Fiction',))
+        cursor.fetchmany(2)
+        cursor.fetchall()
+    slow = [record for record in caplog.records if record.getMessage().startswith('Slow query')]
+    assert len(slow) == 1
+    assert 'SCAN' in slow[0].getMessage() or 'SEARCH' in slow[0].getMessage()
+
+def test_tracing_is_off_by_default(service):
+    environ = {key: value for key, value in os.environ.items() if key != 'BOOKS_QUERY_TRACE'}
+    code = "import config, query_trace, sqlite3; print(config.QUERY_TRACE_ENABLED, " \
+           "query_trace.CONNECTION_FACTORY is sqlite3.Connection)"
+    result = subprocess.run([sys.executable, '-c', code], cwd=os.path.dirname(query_trace.__file__),
+                            env=environ, capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.split() == ['False', 'True']
@@ -0,0 +1,113 @@
+# tests/test_rate_limit.py
+import types
+import pytest
+from werkzeug.exceptions import TooManyRequests
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+import rate_limit
+from rate_limit import MemoryBuckets, SQLiteBuckets
+from config import RENDERS_PER_CLIENT
+
+@pytest.fixture
+def clock(monkeypatch):
+    # Drives both clocks the buckets use
+    now = [1000.0]
+    monkeypatch.setattr(rate_limit, 'time', types.SimpleNamespace(monotonic=lambda: now[0], time=lambda: now[0]))
+    return now
+
+@pytest.fixture
+def limited(monkeypatch):
+    monkeypatch.setattr(rate_limit, 'RATE_LIMIT_ENABLED', True)
+    monkeypatch.setattr(rate_limit, 'buckets', MemoryBuckets())
+    monkeypatch.setitem(rate_limit.RATE_LIMITS, 'suggest', (1.0, 2))
+
+@pytest.mark.parametrize('make', [lambda tmp_path: MemoryBuckets(),
+                                  lambda tmp_path: SQLiteBuckets(str(tmp_path / 'buckets.db'))])
+def test_buckets_allow_a_burst_then_refill_at_the_rate(tmp_path, clock, make):
+    buckets = make(tmp_path)
+    assert buckets.take('k', rate=2.0, burst=3) == (True, 0.0)
+    assert buckets.take('k', rate=2.0, burst=3)[0]
+    assert buckets.take('k', rate=2.0, burst=3)[0]
+    allowed, retry_after = buckets.take('k', rate=2.0, burst=3)
+    assert not allowed and retry_after == pytest.approx(0.5)
+    # Other clients have their own budget
+    assert buckets.take('other', rate=2.0, burst=3)[0]
+
+    clock[0] += 0.5
+    assert buckets.take('k', rate=2.0, burst=3)[0]
+    assert not buckets.take('k', rate=2.0, burst=3)[0]
+    # Refill stops at the burst size
+    clock[0] += 60
+    assert [buckets.take('k', rate=2.0, burst=3)[0] for _ in range(4)] == [True, True, True, False]
+
+def test_sqlite_buckets_are_shared_between_workers(tmp_path, clock):
+    path = str(tmp_path / 'buckets.db')
+    first, second = SQLiteBuckets(path), SQLiteBuckets(path)
+    assert first.take('k', rate=1.0, burst=2)[0]
+    assert second.take('k', rate=1.0, burst=2)[0]
+    assert not first.take('k', rate=1.0, burst=2)[0]
+
+def test_idle_full_buckets_are_pruned(clock):
+    buckets = MemoryBuckets(max_keys=2)
+    buckets.take('a', rate=1.0, burst=2)
+    buckets.take('b', rate=1.0, burst=2)
+    clock[0] += 10
+    buckets.take('c', rate=1.0, burst=2)
+    assert list(buckets._buckets) == ['c']
+
+def test_over_budget_requests_get_429_with_retry_after(client, catalog, limited):
+    for _ in range(2):
+        assert client.get('/api/v1/books/suggest?prefix=bo').status_code == 200
+    response = client.get('/api/v1/books/suggest?prefix=bo')
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) >= 1
+
+def test_clients_are_keyed_by_verified_token_then_address(service, admin_headers):
+    app = service.app
+    with app.test_request_context(environ_base={'REMOTE_ADDR': '10.0.0.7'}):
+        assert rate_limit.client_key() == 'ip:10.0.0.7'
+    with app.test_request_context(environ_base={'REMOTE_ADDR': '10.0.0.7'}, headers=admin_headers):
+        assert rate_limit.client_key() == 'user:admin@example.com'
+    with app.test_request_context(environ_base={'REMOTE_ADDR': '10.0.0.7'},
+                                  headers={'Authorization': 'Bearer made-up'}):
+        assert rate_limit.client_key() == 'ip:10.0.0.7'
+
+def test_forwarded_addresses_count_only_behind_trusted_proxies(service, catalog, limited, monkeypatch):
+    client = service.app.test_client()
+    proxy = {'REMOTE_ADDR': '10.0.0.1'}
+
+    # Without trusted proxies the header is ignored, so a client cannot
+    # choose a fresh bucket per request
+    for n in range(3):
+        response = client.get('/api/v1/books/suggest?prefix=bo', environ_base=proxy,
+                              headers={'X-Forwarded-For': f'203.0.113.{n}'})
+    assert response.status_code == 429
+
+    monkeypatch.setattr(rate_limit, 'buckets', MemoryBuckets())
+    monkeypatch.setattr(service.app, 'wsgi_app', ProxyFix(service.app.wsgi_app, x_for=1))
+    # One proxy: the right-most forwarded address is the client
+    statuses = [client.get('/api/v1/books/suggest?prefix=bo', environ_base=proxy,
+                           headers={'X-Forwarded-For': f'198.51.100.9, 203.0.113.{n % 2}'}).status_code
+                for n in range(4)]
+    assert statuses == [200, 200, 200, 200]
+    response = client.get('/api/v1/books/suggest?prefix=bo', environ_base=proxy,
+                          headers={'X-Forwarded-For': '203.0.113.0'})
+    assert response.status_code == 429
+
+def test_render_slots_cap_concurrent_renders_per_client(service, monkeypatch):
+    monkeypatch.setattr(rate_limit, 'RATE_LIMIT_ENABLED', True)
+    with service.app.test_request_context(environ_base={'REMOTE_ADDR': '10.0.0.8'}):
+        slots = [rate_limit.render_slot() for _ in range(RENDERS_PER_CLIENT)]
+        for slot in slots:
+            slot.__enter__()
+        with pytest.raises(TooManyRequests):
+            with rate_limit.render_slot():
+                pass
+        # Other groups are counted separately
+        with rate_limit.render_slot('tiles'):
+            pass
+        for slot in slots:
+            slot.__exit__(None, None, None)
+        assert rate_limit._renders == {}
+        with rate_limit.render_slot():
+            pass
@@ -0,0 +1,358 @@
+# tests/test_render_budget.py
+import io
+import time
+import threading
+from collections import deque
+import pytest
+from PyPDF2 import PdfWriter
+
+import main
+from preview import PDFPreview
+from render_budget import (
+    plan, pixels_for, estimate_bytes, oversized, tile_grid, tile_crop, MAX_JOB_BYTES, RenderScheduler, RenderBusy
+)
+from render_jobs import RenderJob
+from config import RENDER_TILE_SIZE, PREVIEW_DPI, RENDER_PRIORITY_WEIGHTS
+
+LETTER = (612, 792)
+# 1000pt square: about 93MB at scale 1, over RENDER_MAX_JOB_MB at scale 2
+POSTER = (1000, 1000)
+
+def test_pixels_follow_the_dpi():
+    assert pixels_for(LETTER, 72 / PREVIEW_DPI) == LETTER
+    assert pixels_for(LETTER, 1.0) == (1700, 2200)
+    # Partial pixels round up, as pdftoppm does
+    assert pixels_for((1, 1), 1.0) == (3, 3)
+
+def test_pages_that_fit_keep_their_scale():
+    scale, cost = plan(LETTER, 1.5)
+    assert scale == 1.5
+    assert cost == estimate_bytes(*pixels_for(LETTER, 1.5)) <= MAX_JOB_BYTES
+    assert not oversized(LETTER, 1.5)
+
+def test_oversized_pages_get_the_largest_scale_that_fits():
+    assert oversized(POSTER, 2.0)
+    scale, cost = plan(POSTER, 2.0)
+    assert 0 < scale < 2.0
+    assert cost == estimate_bytes(*pixels_for(POSTER, scale)) <= MAX_JOB_BYTES
+    # Two decimals, and the next step up would not fit
+    assert scale == round(scale, 2)
+    assert estimate_bytes(*pixels_for(POSTER, round(scale + 0.01, 2))) > MAX_JOB_BYTES
+
+def test_tiles_cover_the_page_and_clip_at_its_edges():
+    width, height, columns, rows = tile_grid(POSTER, 2.0)
+    assert (columns, rows) == (-(-width // RENDER_TILE_SIZE), -(-height // RENDER_TILE_SIZE))
+    assert tile_crop(POSTER, 2.0, 0, 0) == (0, 0, RENDER_TILE_SIZE, RENDER_TILE_SIZE)
+    last = tile_crop(POSTER, 2.0, columns - 1, rows - 1)
+    assert last[:2] == ((columns - 1) * RENDER_TILE_SIZE, (rows - 1) * RENDER_TILE_SIZE)
+    assert (last[0] + last[2], last[1] + last[3]) == (width, height)
+    crops = [tile_crop(POSTER, 2.0, column, row) for row in range(rows) for column in range(columns)]
+    assert sum(w * h for _, _, w, h in crops) == width * height
+    assert all(estimate_bytes(w, h) <= MAX_JOB_BYTES for _, _, w, h in crops)
+
+@pytest.mark.parametrize('column, row', [(-1, 0), (0, -1), (99, 0), (0, 99)])
+def test_tiles_outside_the_page_do_not_exist(column, row):
+    assert tile_crop(POSTER, 2.0, column, row) is None
+
+@pytest.fixture
+def poster(catalog, tmp_path):
+    path = tmp_path / 'poster.pdf'
+    writer = PdfWriter()
+    writer.add_blank_page(width=POSTER[0], height=POSTER[1])
+    with open(path, 'wb') as f:
+        writer.write(f)
+    book_id, = catalog.add_books(1, pdf_path=str(path))
+    return book_id
+
+@pytest.fixture
+def renders(monkeypatch):
+    # (scale, crop) of every render, which returns a stand-in image
+    calls = []
+
+    def generate_preview(pdf_path, page=0, scale=1.0, crop=None, job=None):
+        calls.append((scale, crop))
+        return io.BytesIO(b'png')
+
+    monkeypatch.setattr(PDFPreview, 'generate_preview', staticmethod(generate_preview))
+    return calls
+
+def test_previews_that_fit_render_as_asked(client, poster, renders):
+    response = client.get(f'/api/v1/books/{poster}/preview?scale=1')
+    assert response.status_code == 200
+    assert response.headers['X-Preview-Scale'] == '1'
+    assert renders == [(1.0, None)]
+
+def test_oversized_previews_are_downscaled(client, poster, renders):
+    response = client.get(f'/api/v1/books/{poster}/preview?scale=2')
+    assert response.status_code == 200
+    expected, _ = plan(POSTER, 2.0)
+    assert response.headers['X-Preview-Scale'] == f'{expected:g}'
+    assert renders == [(expected, None)]
+
+def test_oversized_previews_can_be_tiled_instead(client, poster, renders, monkeypatch):
+    monkeypatch.setattr(main, 'RENDER_OVERSIZE', 'tile')
+    response = client.get(f'/api/v1/books/{poster}/preview?scale=2')
+    assert response.status_code == 303
+    assert '/preview/tiles' in response.headers['Location']
+
+    manifest = client.get(response.headers['Location']).json
+    width, height, columns, rows = tile_grid(POSTER, 2.0)
+    assert (manifest['width'], manifest['height'], manifest['tile_size']) == (width, height, RENDER_TILE_SIZE)
+    assert len(manifest['tiles']) == columns * rows
+    last = manifest['tiles'][-1]
+    assert (last['column'], last['row']) == (columns - 1, rows - 1)
+
+    assert client.get(last['url']).status_code == 200
+    assert renders == [(2.0, tile_crop(POSTER, 2.0, columns - 1, rows - 1))]
+
+@pytest.mark.parametrize('tile, status', [('a,b', 400), ('1', 400), ('99,0', 404)])
+def test_bad_tiles_are_rejected(client, poster, renders, tile, status):
+    assert client.get(f'/api/v1/books/{poster}/preview?scale=2&tile={tile}').status_code == status
+    assert renders == []
+
+def test_a_missing_pdftoppm_is_reported_clearly(tmp_path, monkeypatch):
+    monkeypatch.setenv('PATH', str(tmp_path))
+    assert not PDFPreview.renderer_available()
+    with pytest.raises(RuntimeError, match='poppler-utils'):
+        PDFPreview.rasterize(str(tmp_path / 'book.pdf'), 0, 72)
+
+def _scheduler(memory_limit=1000, slots=1, p95_target=1.0):
+    return RenderScheduler(memory_limit, slots, RENDER_PRIORITY_WEIGHTS, p95_target, p95_window=60)
+
+def _hold(scheduler, cost=1, priority='batch', job=None):
+    # A render that runs until released
+    hold = scheduler.reserve(cost, priority, 'holder', job)
+    hold.__enter__()
+    return lambda: hold.__exit__(None, None, None)
+
+def _overload(scheduler):
+    now = time.monotonic()
+    scheduler._latencies.extend((now, 10.0) for _ in range(20))
+    scheduler._p95 = (0.0, 0.0)
+
+class Queue:
+    # Renders queued one at a time, in a known arrival order, each recording
+    # when it was admitted
+    def __init__(self, scheduler):
+        self.scheduler = scheduler
+        self.admitted, self.errors, self.threads = [], [], []
+
+    def add(self, name, priority='interactive', flow=None, cost=1, job=None, timeout=5):
+        def run():
+            try:
+                with self.scheduler.reserve(cost, priority, flow or name, job, timeout=timeout):
+                    self.admitted.append(name)
+            except Exception as e:
+                self.errors.append((name, e))
+
+        waiting = len(self.scheduler._waiting)
+        thread = threading.Thread(target=run)
+        thread.start()
+        self.threads.append(thread)
+        _until(lambda: len(self.scheduler._waiting) > waiting or self.errors)
+
+    def join(self):
+        for thread in self.threads:
+            thread.join(10)
+        return self.admitted
+
+def _until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.005)
+    assert condition()
+
+def test_interactive_renders_go_ahead_of_background_work():
+    scheduler = _scheduler()
+    release = _hold(scheduler)
+    queue = Queue(scheduler)
+    queue.add('batch-1', 'batch', 'shelf', cost=8)
+    queue.add('batch-2', 'batch', 'shelf', cost=8)
+    queue.add('prefetch', 'prefetch', cost=8)
+    queue.add('interactive', cost=8)
+    release()
+    assert queue.join() == ['interactive', 'prefetch', 'batch-1', 'batch-2']
+
+def test_flows_take_turns():
+    # One client's burst does not keep another client waiting behind it
+    scheduler = _scheduler()
+    release = _hold(scheduler)
+    queue = Queue(scheduler)
+    for n in range(3):
+        queue.add(f'a{n}', flow='reader-a')
+    queue.add('b0', flow='reader-b')
+    release()
+    assert queue.join() == ['a0', 'b0', 'a1', 'a2']
+
+def test_a_large_render_is_not_overtaken_by_smaller_ones():
+    scheduler = _scheduler(memory_limit=100, slots=4)
+    release = _hold(scheduler, cost=60)
+    queue = Queue(scheduler)
+    queue.add('large', cost=60)
+    queue.add('small', 'batch', cost=10)
+    # small would fit next to the holder, but large is next in line
+    time.sleep(0.3)
+    assert queue.admitted == []
+    release()
+    assert queue.join() == ['large', 'small']
+    assert scheduler.reserved == 0
+
+def test_renders_give_up_after_the_queue_timeout():
+    scheduler = _scheduler()
+    release = _hold(scheduler)
+    queue = Queue(scheduler)
+    queue.add('late', timeout=0.2)
+    queue.join()
+    release()
+    assert [(name, type(e)) for name, e in queue.errors] == [('late', RenderBusy)]
+    assert scheduler._waiting == []
+
+def test_a_cancelled_render_leaves_the_queue():
+    scheduler = _scheduler()
+    release = _hold(scheduler)
+    queue = Queue(scheduler)
+    job = RenderJob()
+    queue.add('superseded', job=job)
+    queue.add('next')
+    job.cancel('superseded')
+    _until(lambda: queue.errors)
+    assert scheduler.depth('interactive') == 1
+    release()
+    assert queue.join() == ['next']
+    assert [(name, e.reason) for name, e in queue.errors] == [('superseded', 'superseded')]
+
+def test_renders_that_never_ran_are_not_charged_to_their_flow():
+    scheduler = _scheduler()
+    release = _hold(scheduler)
+    queue = Queue(scheduler)
+    job = RenderJob()
+    queue.add('abandoned', flow='reader-a', cost=80, job=job)
+    job.cancel('disconnected')
+    _until(lambda: queue.errors)
+    queue.add('late', flow='reader-a', cost=80, timeout=0.2)
+    _until(lambda: len(queue.errors) == 2)
+    assert ('interactive', 'reader-a') not in scheduler._finish
+    # Otherwise a1 would queue behind 160 units of renders that never ran
+    queue = Queue(scheduler)
+    queue.add('a1', flow='reader-a', cost=8)
+    queue.add('b1', flow='reader-b', cost=8)
+    release()
+    assert queue.join() == ['a1', 'b1']
+
+def test_a_flow_keeps_its_earlier_tag_when_a_render_leaves():
+    scheduler = _scheduler()
+    release = _hold(scheduler)
+    queue = Queue(scheduler)
+    queue.add('a1', flow='reader-a', cost=8)
+    charged = scheduler._finish[('interactive', 'reader-a')]
+    queue.add('late', flow='reader-a', cost=80, timeout=0.2)
+    _until(lambda: queue.errors)
+    assert scheduler._finish[('interactive', 'reader-a')] == charged
+    release()
+    assert queue.join() == ['a1']
+
+def _locked(scheduler, collection):
+    # The collection, failing any iteration made without the scheduler's lock
+    class Locked(type(collection)):
+        def __iter__(self):
+            assert scheduler._cond._is_owned(), 'iterated without the scheduler lock'
+            return super().__iter__()
+
+    if isinstance(collection, deque):
+        return Locked(collection, maxlen=collection.maxlen)
+    return Locked(collection)
+
+def test_readings_can_be_scraped_while_renders_finish():
+    scheduler = _scheduler(memory_limit=100, slots=4)
+    for name in ('_waiting', '_running', '_latencies'):
+        setattr(scheduler, name, _locked(scheduler, getattr(scheduler, name)))
+    errors, done = [], threading.Event()
+
+    def render(n):
+        try:
+            for _ in range(100):
+                with scheduler.reserve(10, ('interactive', 'batch')[n % 2], f'reader-{n}', timeout=30):
+                    pass
+        except Exception as e:
+            errors.append(e)
+
+    def scrape():
+        while not done.is_set():
+            try:
+                scheduler._p95 = (0.0, 0.0)
+                scheduler.interactive_p95()
+                for priority in RENDER_PRIORITY_WEIGHTS:
+                    scheduler.depth(priority), scheduler.active(priority)
+            except Exception as e:
+                errors.append(e)
+                return
+
+    renders = [threading.Thread(target=render, args=(n,)) for n in range(8)]
+    scraper = threading.Thread(target=scrape)
+    scraper.start()
+    for thread in renders:
+        thread.start()
+    for thread in renders:
+        thread.join(30)
+    done.set()
+    scraper.join(5)
+    assert errors == []
+    assert len(scheduler._latencies) == 400
+    assert scheduler.depth('interactive') == scheduler.active('interactive') == 0
+
+def test_background_work_waits_while_interactive_latency_is_high():
+    scheduler = _scheduler()
+    release = _hold(scheduler)
+    queue = Queue(scheduler)
+    # Cheap enough that fair queuing alone would run it first
+    queue.add('prefetch', 'prefetch', cost=1)
+    queue.add('interactive', cost=80)
+    _overload(scheduler)
+    assert scheduler.overloaded()
+    release()
+    assert queue.join() == ['interactive', 'prefetch']
+
+def test_fair_order_holds_when_latency_is_on_target():
+    scheduler = _scheduler()
+    release = _hold(scheduler)
+    queue = Queue(scheduler)
+    queue.add('prefetch', 'prefetch', cost=1)
+    queue.add('interactive', cost=80)
+    release()
+    assert queue.join() == ['prefetch', 'interactive']
+
+def test_overload_preempts_running_background_renders():
+    scheduler = _scheduler()
+    background = RenderJob()
+    release = _hold(scheduler, priority='prefetch', job=background)
+    _overload(scheduler)
+    queue = Queue(scheduler)
+    queue.add('interactive')
+    _until(lambda: background.cancelled)
+    assert background.reason == 'preempted'
+    # The preempted render releases its share when pdftoppm is killed
+    release()
+    assert queue.join() == ['interactive']
+
+def test_interactive_renders_are_never_preempted():
+    scheduler = _scheduler()
+    running = RenderJob()
+    release = _hold(scheduler, priority='interactive', job=running)
+    _overload(scheduler)
+    queue = Queue(scheduler)
+    queue.add('interactive')
+    time.sleep(0.3)
+    assert not running.cancelled and queue.admitted == []
+    release()
+    assert queue.join() == ['interactive']
+
+def test_nothing_is_preempted_on_target():
+    scheduler = _scheduler()
+    background = RenderJob()
+    release = _hold(scheduler, priority='batch', job=background)
+    queue = Queue(scheduler)
+    queue.add('interactive')
+    time.sleep(0.3)
+    assert not background.cancelled
+    release()
+    assert queue.join() == ['interactive']
@@ -0,0 +1,111 @@
+# tests/test_render_jobs.py
+import time
+import types
+import socket
+import subprocess
+import threading
+import pytest
+from werkzeug.exceptions import BadRequest
+
+import main
+import preview
+import render_jobs
+from preview import PDFPreview
+from render_jobs import RenderJob, RenderCancelled, RenderTimeout, render_job
+
+def _cancelled(job):
+    with pytest.raises(RenderCancelled) as raised:
+        job.check()
+    return raised.value.reason
+
+def _sleeper():
+    return subprocess.Popen(['sleep', '30'], start_new_session=True)
+
+def test_a_new_target_supersedes_the_session():
+    with render_job('viewer:1', (0, 1.0), {}) as first, render_job('viewer:1', (0, 1.0), {}) as tile:
+        # Tiles of the same page share a target and coexist
+        first.check(), tile.check()
+        with render_job('viewer:1', (1, 1.0), {}) as second:
+            assert _cancelled(first) == _cancelled(tile) == 'superseded'
+            second.check()
+            with render_job('viewer:2', (5, 1.0), {}) as other:
+                second.check(), other.check()
+    assert render_jobs._sessions == {}
+
+def test_jobs_without_a_session_are_left_alone():
+    with render_job(None, (0, 1.0), {}) as first, render_job(None, (1, 1.0), {}) as second:
+        first.check(), second.check()
+    assert render_jobs._sessions == {}
+
+def test_cancelling_kills_the_running_process():
+    job = RenderJob()
+    process = _sleeper()
+    job.attach(process)
+    started = time.monotonic()
+    job.cancel('superseded')
+    assert process.wait(5) == -9
+    assert time.monotonic() - started < 5
+    # A second cancel keeps the first reason
+    job.cancel('disconnected')
+    assert _cancelled(job) == 'superseded'
+
+def test_a_process_attached_after_cancelling_is_killed():
+    job = RenderJob()
+    job.cancel('preempted')
+    process = _sleeper()
+    job.attach(process)
+    assert process.wait(5) == -9
+
+def test_a_closed_connection_cancels_the_job():
+    server, peer = socket.socketpair()
+    try:
+        job = RenderJob(sock=server)
+        job.check()
+        peer.close()
+        assert _cancelled(job) == 'disconnected'
+    finally:
+        server.close()
+
+@pytest.fixture
+def slow_renderer(monkeypatch):
+    # pdftoppm stand-in that never finishes
+    real = subprocess.Popen
+    monkeypatch.setattr(preview, 'subprocess', types.SimpleNamespace(
+        Popen=lambda args, **kwargs: real(['sleep', '30'], **kwargs),
+        PIPE=subprocess.PIPE, TimeoutExpired=subprocess.TimeoutExpired))
+
+def test_renders_past_their_deadline_are_killed(slow_renderer):
+    started = time.monotonic()
+    with pytest.raises(RenderTimeout):
+        PDFPreview.rasterize('book.pdf', 0, 72, timeout=0.3)
+    assert time.monotonic() - started < 5
+
+def test_a_running_render_stops_when_cancelled(slow_renderer):
+    job = RenderJob()
+    timer = threading.Timer(0.2, job.cancel, ('superseded',))
+    timer.start()
+    started = time.monotonic()
+    try:
+        with pytest.raises(RenderCancelled):
+            PDFPreview.rasterize('book.pdf', 0, 72, job=job, timeout=30)
+    finally:
+        timer.cancel()
+    assert time.monotonic() - started < 5
+
+def _session(service, headers=None, query=''):
+    with service.app.test_request_context(f'/api/v1/books/7/preview{query}', headers=headers or {},
+                                          environ_base={'REMOTE_ADDR': '10.0.0.9'}):
+        return main.render_session(7)
+
+def test_sessions_follow_the_viewer_not_the_address(service, admin_headers):
+    # Anonymous clients behind one address supersede nothing...
+    assert _session(service) is None
+    # ...unless they say which viewer they are
+    assert _session(service, {'X-View-Id': 'tab-1'}) == 'ip:10.0.0.9:tab-1:7'
+    assert _session(service, query='?view=tab-2') == 'ip:10.0.0.9:tab-2:7'
+    assert _session(service, admin_headers) == 'user:admin@example.com:7'
+    assert _session(service, {**admin_headers, 'X-View-Id': 'tab-1'}) == 'user:admin@example.com:tab-1:7'
+
+def test_overlong_view_ids_are_rejected(service):
+    with pytest.raises(BadRequest):
+        _session(service, {'X-View-Id': 'x' * 65})
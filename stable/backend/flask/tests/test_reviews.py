@@ -0,0 +1,104 @@
+# tests/test_reviews.py
+import pytest
+import main_2
+from main_2 import DatabaseManager, write_queue
+
+def _aggregates(book_id):
+    book = DatabaseManager.get_book_by_id(book_id)
+    return book.review_count, book.latest_review_id
+
+def _review_ids(book_id):
+    return [review.id for review in DatabaseManager.get_book_reviews(book_id)]
+
+def _delete_review(cursor, review_id):
+    cursor.execute("DELETE FROM reviews WHERE id = ?", (review_id,))
+
+def _move_review(cursor, review_id, book_id):
+    cursor.execute("UPDATE reviews SET book_id = ? WHERE id = ?", (book_id, review_id))
+
+def _write(book_ids, operation, *args):
+    write_queue.execute(operation, *args)
+    DatabaseManager.invalidate_caches(book_ids)
+
+def test_pages_walk_every_review_newest_first(client, catalog):
+    book_id, = catalog.add_books(1)
+    catalog.add_reviews(book_id, 7)
+    seen, before = [], None
+    while True:
+        url = f'/api/v1/books/{book_id}/reviews?limit=3' + (f'&before={before}' if before else '')
+        page = client.get(url).json
+        assert page['review_count'] == 7
+        seen.extend(review['id'] for review in page['reviews'])
+        before = page['next_before']
+        if before is None:
+            break
+    assert seen == sorted(seen, reverse=True) == _review_ids(book_id)
+    assert len(seen) == 7
+
+def test_review_pages_are_stable_while_reviews_arrive(client, catalog):
+    book_id, = catalog.add_books(1)
+    catalog.add_reviews(book_id, 4)
+    first = client.get(f'/api/v1/books/{book_id}/reviews?limit=2').json
+    catalog.add_reviews(book_id, 3)
+    second = client.get(f"/api/v1/books/{book_id}/reviews?limit=2&before={first['next_before']}").json
+    ids = [review['id'] for review in first['reviews'] + second['reviews']]
+    assert ids == sorted(ids, reverse=True) and len(set(ids)) == 4
+
+@pytest.mark.parametrize('query, status', [('limit=0', 400), ('limit=101', 400)])
+def test_bad_review_requests(client, catalog, query, status):
+    book_id, = catalog.add_books(1)
+    assert client.get(f'/api/v1/books/{book_id}/reviews?{query}').status_code == status
+
+def test_unknown_books_have_no_reviews(client, catalog):
+    assert client.get('/api/v1/books/999999/reviews').status_code == 404
+
+def test_aggregates_follow_inserts_deletes_and_moves(catalog):
+    first, second = catalog.add_books(2)
+    assert _aggregates(first) == (0, None)
+
+    catalog.add_reviews(first, 3)
+    ids = _review_ids(first)
+    assert _aggregates(first) == (3, ids[0])
+
+    _write([first], _delete_review, ids[0])
+    assert _aggregates(first) == (2, ids[1])
+
+    _write([first, second], _move_review, ids[1], second)
+    assert _aggregates(first) == (1, ids[2])
+    assert _aggregates(second) == (1, ids[1])
+
+    _write([first], _delete_review, ids[2])
+    assert _aggregates(first) == (0, None)
+
+def test_listings_carry_review_counts_not_reviews(client, catalog):
+    busy, quiet = catalog.add_books(2)
+    catalog.add_reviews(busy, 5)
+    books = {book['id']: book for book in client.get('/api/v1/books/').json}
+    assert books[busy]['reviews'] == []
+    assert books[busy]['review_count'] == 5
+    assert books[busy]['latest_review_id'] == _review_ids(busy)[0]
+    assert books[busy]['reviews_url'] == f'/api/v1/books/{busy}/reviews'
+    assert books[quiet]['review_count'] == 0 and books[quiet]['latest_review_id'] is None
+
+def test_listings_can_embed_the_newest_reviews(client, catalog, monkeypatch):
+    monkeypatch.setattr(main_2, 'REVIEW_PREVIEW_COUNT', 3)
+    busy, quiet = catalog.add_books(2)
+    catalog.add_reviews(busy, 5)
+    books = {book['id']: book for book in client.get('/api/v1/books/').json}
+    newest = _review_ids(busy)[:3]
+    assert [review['id'] for review in books[busy]['reviews']] == newest
+    assert books[busy]['review_count'] == 5
+    assert books[busy]['latest_review_id'] == newest[0]
+    assert books[quiet]['reviews'] == [] and books[quiet]['review_count'] == 0
+
+def test_review_pages_are_served_from_the_index(service, catalog):
+    conn = DatabaseManager.get_db_connection()
+    try:
+        plan = ' '.join(row['detail'] for row in conn.execute(
+            "EXPLAIN QUERY PLAN SELECT id, book_id, text, author FROM reviews "
+            "WHERE book_id = ? AND id < ? ORDER BY id DESC LIMIT ?", (1, 100, 20)
+        ))
+    finally:
+        conn.close()
+    assert 'idx_reviews_book_id' in plan
+    assert 'TEMP B-TREE' not in plan
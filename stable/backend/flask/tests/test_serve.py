@@ -0,0 +1,27 @@
+# tests/test_serve.py
+import serve
+from config import SERVER_WORKERS, SERVER_THREADS
+
+def test_app_is_preloaded_into_threaded_workers(service):
+    options = serve.server_options()
+    assert options['preload_app'] is True
+    assert options['worker_class'] == 'gthread'
+    assert options['workers'] == SERVER_WORKERS
+    assert options['threads'] == SERVER_THREADS
+    assert options['post_fork'] is serve.post_fork
+
+def test_gunicorn_accepts_every_option(service):
+    server = serve.BooksServer(service.app, serve.server_options())
+    assert server.cfg.preload_app is True
+    assert server.cfg.worker_class_str == 'gthread'
+    assert server.load() is service.app
+
+def test_workers_initialize_after_fork(service, monkeypatch):
+    calls = []
+    monkeypatch.setattr(serve, 'initialize_worker', lambda: calls.append('worker'))
+
+    class Worker:
+        pid = 1234
+
+    serve.post_fork(None, Worker())
+    assert calls == ['worker']
@@ -0,0 +1,37 @@
+# tests/test_soak.py
+import os
+import subprocess
+from bench.soak import check_growth, sample_process_tree
+
+LIMITS = {'rss_kb': (20.0, True), 'open_fds': (10, False)}
+
+def _samples(rss, fds):
+    return [{'rss_kb': r, 'open_fds': f} for r, f in zip(rss, fds)]
+
+def test_steady_process_passes():
+    growth, failures = check_growth(_samples([100] * 6, [20] * 6), window=3, limits=LIMITS)
+    assert failures == []
+    assert growth['rss_kb']['growth'] == 0
+
+def test_growth_past_a_limit_fails():
+    samples = _samples([100, 100, 100, 150, 150, 150], [20, 20, 20, 40, 40, 40])
+    growth, failures = check_growth(samples, window=3, limits=LIMITS)
+    assert failures == ['rss_kb', 'open_fds']
+    assert growth['rss_kb']['growth'] == 50.0 and growth['open_fds']['growth'] == 20
+
+def test_too_few_samples_are_not_judged():
+    assert check_growth(_samples([1, 2], [1, 2]), window=3, limits=LIMITS) == ({}, [])
+
+def test_process_tree_sampling_counts_db_handles_and_workers(tmp_path):
+    db_path = str(tmp_path / 'soak.db')
+    handle = open(db_path, 'w')
+    child = subprocess.Popen(['sleep', '5'])
+    try:
+        sample = sample_process_tree(os.getpid(), db_path)
+    finally:
+        child.kill()
+        child.wait()
+        handle.close()
+    assert sample['rss_kb'] > 0
+    assert sample['sqlite_handles'] == 1
+    assert sample['workers'] >= 1
@@ -0,0 +1,323 @@
+# tests/test_storage.py
+import os
+import io
+import re
+import sys
+import time
+import shutil
+import threading
+import types
+import pytest
+
+import pdf_store
+import storage
+from storage import LocalStorage, CachedStorage, S3Storage, StorageUnavailable
+from metrics import CACHE_LOOKUPS
+
+SIZE = 1000
+
+class RemoteStorage(LocalStorage):
+    # Stands in for S3: objects are downloaded into the cache, and every
+    # download is counted
+    def __init__(self, root):
+        super().__init__(root)
+        self.downloads = []
+        self.gate = None
+
+    def download(self, key, target_path):
+        self.downloads.append(key)
+        if self.gate is not None:
+            self.gate.wait(5)
+        shutil.copyfile(self._path(key), target_path)
+
+    def put_file(self, key, source_path):
+        target = self._path(key)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.copyfile(source_path, target)
+
+@pytest.fixture
+def remote(tmp_path):
+    remote = RemoteStorage(str(tmp_path / 'remote'))
+    for name in 'abcd':
+        source = tmp_path / f'{name}.pdf'
+        source.write_bytes(name.encode() * SIZE)
+        remote.put_file(f'{name}.pdf', str(source))
+    return remote
+
+@pytest.fixture
+def cache(remote, tmp_path):
+    # Room for two objects; nothing counts as in use by another worker
+    os.makedirs(tmp_path / 'cache')
+    return CachedStorage(remote, str(tmp_path / 'cache'), max_bytes=2500, lease_seconds=0)
+
+def _age(cache, key, seconds):
+    then = time.time() - seconds
+    os.utime(cache._path(key), (then, then))
+
+def _cached(cache):
+    return sorted(os.listdir(cache.cache_dir))
+
+def _lookups(result):
+    return CACHE_LOOKUPS.value(cache='pdf_storage', result=result)
+
+def test_a_miss_downloads_once_then_hits(cache, remote):
+    hits, misses = _lookups('hit'), _lookups('miss')
+    path = cache.local_path('a.pdf')
+    assert cache.local_path('a.pdf') == path
+    assert open(path, 'rb').read() == b'a' * SIZE
+    assert remote.downloads == ['a.pdf']
+    assert (_lookups('hit') - hits, _lookups('miss') - misses) == (1, 1)
+    assert cache.cached_bytes() == SIZE
+
+def test_eviction_trims_least_recently_used_files(cache, remote):
+    cache.local_path('a.pdf')
+    cache.local_path('b.pdf')
+    _age(cache, 'a.pdf', 30)
+    _age(cache, 'b.pdf', 20)
+    # A hit refreshes a, so b is now the oldest
+    cache.local_path('a.pdf')
+    cache.local_path('c.pdf')
+    assert _cached(cache) == ['a.pdf', 'c.pdf']
+    assert cache.cached_bytes() == 2 * SIZE
+
+    cache.local_path('b.pdf')
+    assert remote.downloads == ['a.pdf', 'b.pdf', 'c.pdf', 'b.pdf']
+    assert cache.cached_bytes() == 2 * SIZE
+
+def test_a_file_larger_than_the_budget_is_kept_for_its_reader(remote, tmp_path):
+    cache = CachedStorage(remote, str(tmp_path / 'cache'), max_bytes=SIZE // 2, lease_seconds=0)
+    path = cache.local_path('a.pdf')
+    assert os.path.exists(path)
+    assert cache.cached_bytes() == SIZE
+
+def test_leased_files_are_not_evicted(cache, remote):
+    with cache.lease('a.pdf') as path:
+        _age(cache, 'a.pdf', 30)
+        cache.local_path('b.pdf')
+        _age(cache, 'b.pdf', 20)
+        cache.local_path('c.pdf')
+        assert os.path.exists(path)
+        assert _cached(cache) == ['a.pdf', 'c.pdf']
+    assert cache._leases == {}
+
+    # Once released it is an ordinary candidate again
+    _age(cache, 'a.pdf', 30)
+    cache.local_path('d.pdf')
+    assert _cached(cache) == ['c.pdf', 'd.pdf']
+
+def test_nested_leases_pin_until_the_last_is_released(cache):
+    with cache.lease('a.pdf'):
+        with cache.lease('a.pdf'):
+            assert cache._leases == {cache._path('a.pdf'): 2}
+        assert cache._leases == {cache._path('a.pdf'): 1}
+    assert cache._leases == {}
+
+def test_recently_used_files_wait_out_the_lease_period(remote, tmp_path):
+    # Another worker sharing the directory may be reading them
+    os.makedirs(tmp_path / 'cache')
+    cache = CachedStorage(remote, str(tmp_path / 'cache'), max_bytes=2500, lease_seconds=60)
+    for name in 'abc':
+        cache.local_path(f'{name}.pdf')
+    assert _cached(cache) == ['a.pdf', 'b.pdf', 'c.pdf']
+    assert cache.cached_bytes() == 3 * SIZE
+
+    _age(cache, 'a.pdf', 120)
+    cache.local_path('d.pdf')
+    assert _cached(cache) == ['b.pdf', 'c.pdf', 'd.pdf']
+    assert cache.cached_bytes() == 3 * SIZE
+
+def test_concurrent_misses_share_one_download(cache, remote):
+    remote.gate = threading.Event()
+    paths = []
+    threads = [threading.Thread(target=lambda: paths.append(cache.local_path('a.pdf'))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    deadline = time.monotonic() + 5
+    while not remote.downloads and time.monotonic() < deadline:
+        time.sleep(0.01)
+    remote.gate.set()
+    for thread in threads:
+        thread.join()
+    assert remote.downloads == ['a.pdf']
+    assert paths == [cache._path('a.pdf')] * 4
+    assert cache.cached_bytes() == SIZE
+
+def test_ranges_of_uncached_objects_stream_without_caching(cache, remote):
+    assert b''.join(cache.open_range('a.pdf', 10, 19)) == b'a' * 10
+    assert remote.downloads == []
+    assert _cached(cache) == []
+
+    cache.local_path('b.pdf')
+    assert b''.join(cache.open_range('b.pdf', 0, 3)) == b'bbbb'
+    assert remote.downloads == ['b.pdf']
+
+def test_uploads_stay_cached(cache, remote, tmp_path):
+    source = tmp_path / 'upload.pdf'
+    source.write_bytes(b'u' * SIZE)
+    cache.put_file('u.pdf', str(source))
+    assert cache.exists('u.pdf') and remote.exists('u.pdf')
+    assert cache.local_path('u.pdf') == cache._path('u.pdf')
+    assert remote.downloads == []
+    assert cache.cached_bytes() == SIZE
+
+def test_pdf_file_leases_stored_content(cache, monkeypatch):
+    monkeypatch.setattr(pdf_store, 'storage', cache)
+    digest, _ = pdf_store.put_stream(io.BytesIO(b'%PDF-1.4\n' + b'x' * SIZE))
+    key = pdf_store.key_for(digest)
+    book = types.SimpleNamespace(pdf_sha256=digest, pdf_path='pdfs/old.pdf')
+    with pdf_store.pdf_file(book) as path:
+        assert path == cache._path(key)
+        assert cache._leases == {path: 1}
+    assert cache._leases == {}
+
+    # Books not imported yet read their original file
+    with pdf_store.pdf_file(types.SimpleNamespace(pdf_sha256=None, pdf_path='pdfs/old.pdf')) as path:
+        assert path == 'pdfs/old.pdf'
+
+class ClientError(Exception):
+    # Shaped like botocore's: the error code is in response['Error']['Code']
+    def __init__(self, code):
+        super().__init__(f'An error occurred ({code})')
+        self.response = {'Error': {'Code': code}}
+
+class Body:
+    def __init__(self, data):
+        self.data, self.closed = data, False
+
+    def iter_chunks(self, chunk_size):
+        for offset in range(0, len(self.data), chunk_size):
+            yield self.data[offset:offset + chunk_size]
+
+    def close(self):
+        self.closed = True
+
+class S3Client:
+    # Stands in for a boto3 S3 client: objects live in a dict, every call is
+    # recorded, and failing makes the next calls raise that error code
+    exceptions = types.SimpleNamespace(ClientError=ClientError)
+
+    def __init__(self):
+        self.objects, self.calls, self.bodies = {}, [], []
+        self.failing = None
+
+    def _object(self, operation, bucket, key):
+        self.calls.append((operation, bucket, key))
+        if self.failing is not None:
+            raise ClientError(self.failing)
+        if key not in self.objects:
+            raise ClientError('NoSuchKey' if operation == 'get_object' else '404')
+        return self.objects[key]
+
+    def head_object(self, Bucket, Key):
+        return {'ContentLength': len(self._object('head_object', Bucket, Key)[0])}
+
+    def get_object(self, Bucket, Key, Range):
+        data, _ = self._object('get_object', Bucket, Key)
+        start, end = map(int, re.fullmatch(r'bytes=(\d+)-(\d+)', Range).groups())
+        self.bodies.append(Body(data[start:end + 1]))
+        return {'Body': self.bodies[-1]}
+
+    def download_file(self, bucket, key, target_path):
+        with open(target_path, 'wb') as f:
+            f.write(self._object('download_file', bucket, key)[0])
+
+    def upload_file(self, source_path, bucket, key, ExtraArgs):
+        self.calls.append(('upload_file', bucket, key))
+        with open(source_path, 'rb') as f:
+            self.objects[key] = (f.read(), ExtraArgs['ContentType'])
+
+@pytest.fixture
+def s3():
+    backend = S3Storage('books', prefix='/pdfs/')
+    backend._client, backend._pid = S3Client(), os.getpid()
+    backend._client.objects['pdfs/a.pdf'] = (b'a' * SIZE, 'application/pdf')
+    return backend
+
+@pytest.mark.parametrize('code', ['404', 'NoSuchKey', 'NotFound'])
+def test_s3_missing_objects_do_not_exist(s3, code):
+    s3._client.failing = code
+    assert not s3.exists('a.pdf')
+    with pytest.raises(FileNotFoundError):
+        s3.size('a.pdf')
+
+def test_s3_other_errors_are_not_mistaken_for_missing_objects(s3):
+    s3._client.failing = 'AccessDenied'
+    with pytest.raises(StorageUnavailable):
+        s3.exists('a.pdf')
+    with pytest.raises(StorageUnavailable):
+        s3.open_range('a.pdf', 0, 9)
+
+def test_s3_objects_are_found_under_the_prefix(s3):
+    assert s3.exists('a.pdf') and s3.size('a.pdf') == SIZE
+    assert s3._client.calls == [('head_object', 'books', 'pdfs/a.pdf')] * 2
+    with pytest.raises(FileNotFoundError):
+        s3.size('b.pdf')
+
+def test_s3_ranges_are_requested_eagerly_and_streamed(s3, monkeypatch):
+    monkeypatch.setattr(storage, 'CHUNK_SIZE', 300)
+    chunks = s3.open_range('a.pdf', 100, 899)
+    # Asked for before the first chunk is read, so errors come before headers
+    assert s3._client.calls == [('get_object', 'books', 'pdfs/a.pdf')]
+    assert [len(chunk) for chunk in chunks] == [300, 300, 200]
+    assert s3._client.bodies[0].closed
+    with pytest.raises(FileNotFoundError):
+        s3.open_range('b.pdf', 0, 9)
+
+def test_s3_downloads_and_uploads(s3, tmp_path):
+    s3.download('a.pdf', str(tmp_path / 'a.pdf'))
+    assert (tmp_path / 'a.pdf').read_bytes() == b'a' * SIZE
+    (tmp_path / 'b.pdf').write_bytes(b'b' * SIZE)
+    s3.put_file('b.pdf', str(tmp_path / 'b.pdf'))
+    assert s3._client.objects['pdfs/b.pdf'] == (b'b' * SIZE, 'application/pdf')
+    # A copy is uploaded; the source stays for the cache to keep
+    assert (tmp_path / 'b.pdf').exists()
+
+def test_s3_clients_are_not_shared_across_a_fork(s3, monkeypatch):
+    created = []
+
+    def client(service, endpoint_url=None, region_name=None):
+        created.append((service, endpoint_url, region_name))
+        return S3Client()
+
+    monkeypatch.setitem(sys.modules, 'boto3', types.SimpleNamespace(client=client))
+    inherited = s3.client
+    assert s3.client is inherited and created == []
+    # As seen from a forked worker
+    s3._pid = os.getpid() + 1
+    assert s3.client is not inherited
+    assert s3.client is s3.client
+    assert created == [('s3', None, None)] and s3._pid == os.getpid()
+
+@pytest.fixture
+def served(s3, tmp_path, monkeypatch):
+    # Nothing cached yet, so pdf_response streams from S3
+    monkeypatch.setattr(pdf_store, 'storage', CachedStorage(s3, str(tmp_path / 'cache'), max_bytes=SIZE))
+    digest = '0' * 64
+    s3._client.objects['pdfs/' + pdf_store.key_for(digest)] = (b'%PDF' + b'x' * SIZE, 'application/pdf')
+    return digest
+
+def test_pdfs_stream_from_s3(client, served):
+    response = client.get(f'/api/v1/pdfs/{served}', headers={'Range': 'bytes=0-3'})
+    assert response.status_code == 206
+    assert response.data == b'%PDF'
+
+@pytest.mark.parametrize('code, status, error', [
+    ('NoSuchKey', 404, 'Not Found'), ('InternalError', 503, 'Service Unavailable')
+])
+def test_pdfs_failing_to_open_get_an_error_status(client, served, code, status, error, monkeypatch):
+    # Found by the existence check, then gone or failing when opened
+    get_object = S3Client.get_object
+
+    def failing(client, **kwargs):
+        client.failing = code
+        return get_object(client, **kwargs)
+
+    monkeypatch.setattr(S3Client, 'get_object', failing)
+    response = client.get(f'/api/v1/pdfs/{served}')
+    assert (response.status_code, response.json['error']) == (status, error)
+
+def test_pdfs_are_unavailable_while_s3_is(client, served):
+    pdf_store.storage.backend._client.failing = 'SlowDown'
+    response = client.get(f'/api/v1/pdfs/{served}')
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '5'
@@ -0,0 +1,207 @@
+# tests/test_suggest.py
+import os
+import time
+import threading
+import pytest
+import suggest
+from main_2 import DatabaseManager, write_queue
+from config import SUGGEST_REFRESH_SECONDS
+
+@pytest.fixture
+def build(catalog):
+    # A private index built synchronously from the test catalog
+    def build():
+        index = suggest.SuggestIndex()
+        index._pid = os.getpid()
+        index._rebuild()
+        return index
+    return build
+
+def _titles(index, prefix, limit=8):
+    return [item['title'] for item in index.suggest(prefix, limit)['titles']]
+
+def _rename(cursor, book_id, title):
+    cursor.execute("UPDATE books SET title = ? WHERE id = ?", (title, book_id))
+
+def test_word_starts():
+    assert suggest.word_starts('the sealed nectar') == ['the sealed nectar', 'sealed nectar', 'nectar']
+    assert suggest.word_starts('dune') == ['dune']
+
+def test_any_word_of_a_title_matches(catalog, build):
+    titles = ['The Sealed Nectar', 'Clean Code', 'Nectar of Devotion', 'Coding Élan']
+    catalog.add_books(len(titles), title=lambda n: titles[n])
+    index = build()
+    assert sorted(_titles(index, 'nec')) == ['Nectar of Devotion', 'The Sealed Nectar']
+    assert _titles(index, 'sealed') == ['The Sealed Nectar']
+    assert _titles(index, 'Sealed Nec') == ['The Sealed Nectar']
+    assert _titles(index, 'elan') == ['Coding Élan']
+    assert sorted(_titles(index, 'cod')) == ['Clean Code', 'Coding Élan']
+    assert _titles(index, 'ectar') == []
+
+def test_a_book_is_suggested_once_however_many_words_match(catalog, build):
+    titles = ['Nectar Nectar Nectar', 'Nectar Road', 'Nectar Sky']
+    ids = catalog.add_books(len(titles), title=lambda n: titles[n])
+    catalog.add_reviews(ids[0], 5)
+    result = build().suggest('nectar', limit=2)['titles']
+    assert [item['id'] for item in result] == [ids[0], ids[1]]
+    assert result[0]['score'] == 6
+
+def test_titles_rank_by_review_count(catalog, build):
+    ids = catalog.add_books(3, title=lambda n: f'Atlas {n}')
+    catalog.add_reviews(ids[2], 3)
+    catalog.add_reviews(ids[1], 1)
+    assert _titles(build(), 'atlas') == ['Atlas 2', 'Atlas 1', 'Atlas 0']
+
+def test_authors_and_categories_match_by_word(catalog, build):
+    authors = ['Safiur Rahman', 'Ann Rahman', 'Safiur Rahman']
+    catalog.add_books(3, author=lambda n: authors[n], category='Islamic History')
+    result = build().suggest('rahman')
+    assert result['authors'] == [{'value': 'Safiur Rahman', 'count': 2}, {'value': 'Ann Rahman', 'count': 1}]
+    assert build().suggest('hist')['categories'] == [{'value': 'Islamic History', 'count': 3}]
+
+def test_changed_books_are_overlaid_by_word(catalog, build):
+    book_id, other = catalog.add_books(2, title=lambda n: ('The Sealed Nectar', 'Clean Code')[n])
+    index = build()
+    write_queue.execute(_rename, book_id, 'Bright Honey')
+    index.on_catalog_change([book_id])
+    assert _titles(index, 'nec') == []
+    assert _titles(index, 'hon') == ['Bright Honey']
+    assert _titles(index, 'clean') == ['Clean Code']
+
+@pytest.fixture
+def rebuilds(monkeypatch):
+    calls = []
+    monkeypatch.setattr(suggest.SuggestIndex, '_schedule_rebuild', lambda self: calls.append(1))
+    return calls
+
+def test_an_unchanged_catalog_keeps_its_snapshot(catalog, build, rebuilds):
+    catalog.add_books(2)
+    index = build()
+    index._built_at -= SUGGEST_REFRESH_SECONDS + 1
+    index._sync()
+    assert rebuilds == []
+
+def test_a_stale_snapshot_is_rebuilt_once_the_catalog_changes(catalog, build, rebuilds):
+    catalog.add_books(2)
+    index = build()
+    catalog.add_books(1, title='Fresh Arrival')
+    # Recent snapshot: the change is overlaid only
+    index._sync()
+    assert rebuilds == []
+    assert _titles(index, 'arrival') == ['Fresh Arrival']
+
+    index._built_at -= SUGGEST_REFRESH_SECONDS + 1
+    index._sync()
+    assert rebuilds == [1]
+
+def test_snapshot_tracks_the_catalog_version(catalog, build):
+    catalog.add_books(2)
+    index = build()
+    assert index._snapshot.version == index._snapshot.loaded_version == DatabaseManager.get_catalog_version()
+    catalog.add_books(1)
+    index._sync()
+    assert index._snapshot.version == DatabaseManager.get_catalog_version() > index._snapshot.loaded_version
+
+@pytest.mark.parametrize('query', ['prefix=', 'prefix=%20-', 'prefix=a&limit=0', 'prefix=a&limit=51'])
+def test_suggest_route_rejects_bad_parameters(client, query):
+    assert client.get(f'/api/v1/books/suggest?{query}').status_code == 400
+
+def test_suggest_route_serves_word_prefixes(client, catalog):
+    catalog.add_books(1, title='The Sealed Nectar')
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        titles = [item['title'] for item in client.get('/api/v1/books/suggest?prefix=nec').json['titles']]
+        if titles:
+            break
+        time.sleep(0.02)
+    assert titles == ['The Sealed Nectar']
+
+@pytest.fixture
+def stalled_load(monkeypatch):
+    # The first load of the named thread waits, after reading its rows, until
+    # released: its merge lands after a later writer's
+    release, loaded = threading.Event(), threading.Event()
+    load_books = suggest._load_books
+
+    def load(book_ids):
+        rows = load_books(book_ids)
+        if threading.current_thread().name == 'stalled':
+            loaded.set()
+            release.wait(5)
+        return rows
+
+    monkeypatch.setattr(suggest, '_load_books', load)
+    return loaded, release
+
+def _stalled(index, book_ids):
+    thread = threading.Thread(target=index.on_catalog_change, args=(book_ids,), name='stalled')
+    thread.start()
+    return thread
+
+def test_concurrent_changes_keep_each_others_books(catalog, build, stalled_load):
+    loaded, release = stalled_load
+    first, second, other = catalog.add_books(3, title=lambda n: ('Sealed Nectar', 'Clean Code', 'Dune')[n])
+    index = build()
+    write_queue.execute(_rename, first, 'Bright Honey')
+    write_queue.execute(_rename, second, 'Quiet Water')
+    thread = _stalled(index, [first])
+    assert loaded.wait(5)
+    index.on_catalog_change([second])
+    release.set()
+    thread.join(5)
+    assert {first, second} <= index._snapshot.hidden
+    assert _titles(index, 'nec') == [] and _titles(index, 'clean') == []
+    assert _titles(index, 'hon') == ['Bright Honey'] and _titles(index, 'qui') == ['Quiet Water']
+
+def test_an_older_load_does_not_undo_a_newer_one(catalog, build, stalled_load):
+    loaded, release = stalled_load
+    book_id, = catalog.add_books(1, title='Sealed Nectar')
+    index = build()
+    write_queue.execute(_rename, book_id, 'Bright Honey')
+    thread = _stalled(index, [book_id])
+    assert loaded.wait(5)
+    write_queue.execute(_rename, book_id, 'Quiet Water')
+    index.on_catalog_change([book_id])
+    release.set()
+    thread.join(5)
+    assert _titles(index, 'hon') == []
+    assert _titles(index, 'qui') == ['Quiet Water']
+
+def test_changes_to_a_replaced_snapshot_are_dropped(catalog, build):
+    book_id, = catalog.add_books(1, title='Sealed Nectar')
+    index = build()
+    old = index._snapshot
+    index._snapshot = suggest._load_snapshot()
+    index._apply_changes(old, [book_id])
+    assert old.hidden == set() and old.overlay == {}
+
+class StallingSet(set):
+    # The stalled writer pauses between copying the hidden set and putting
+    # its copy back, the window in which another writer's change can be lost
+    def __init__(self, items, copied, release):
+        super().__init__(items)
+        self.copied, self.release = copied, release
+
+    def __or__(self, other):
+        merged = set(self) | other
+        if threading.current_thread().name == 'stalled':
+            self.copied.set()
+            self.release.wait(1)
+        return merged
+
+def test_a_writer_merging_at_the_same_time_keeps_the_other_s_books(catalog, build, monkeypatch):
+    first, second = catalog.add_books(2)
+    index = build()
+    monkeypatch.setattr(suggest, '_load_books', lambda book_ids: {})
+    copied, release = threading.Event(), threading.Event()
+    index._snapshot.hidden = StallingSet((), copied, release)
+    thread = _stalled(index, [first])
+    assert copied.wait(5)
+    other = threading.Thread(target=index.on_catalog_change, args=([second],))
+    other.start()
+    # Merges wait for each other, so the second writer cannot finish yet
+    other.join(0.2)
+    release.set()
+    thread.join(5)
+    other.join(5)
+    assert index._snapshot.hidden == {first, second}
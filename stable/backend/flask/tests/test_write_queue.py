@@ -0,0 +1,100 @@
+# tests/test_write_queue.py
+import os
+import sqlite3
+import threading
+import pytest
+from write_queue import WriteQueue
+
+@pytest.fixture
+def queue(tmp_path):
+    path = str(tmp_path / 'queue.db')
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE items (value INTEGER NOT NULL)")
+    statements = []
+
+    def connect():
+        conn = sqlite3.connect(path, check_same_thread=False)
+        conn.set_trace_callback(statements.append)
+        return conn
+
+    write_queue = WriteQueue(connect, window_ms=50, max_batch=100)
+    write_queue.path = path
+    write_queue.statements = statements
+    yield write_queue
+    write_queue.close()
+
+def _insert(cursor, value):
+    cursor.execute("INSERT INTO items (value) VALUES (?)", (value,))
+    return cursor.lastrowid
+
+def _values(path):
+    with sqlite3.connect(path) as conn:
+        return sorted(row[0] for row in conn.execute("SELECT value FROM items"))
+
+def test_concurrent_writes_share_one_transaction(queue):
+    futures = [queue.submit(_insert, n) for n in range(20)]
+    assert sorted(future.result(timeout=5) for future in futures) == list(range(1, 21))
+    assert _values(queue.path) == list(range(20))
+    assert queue.statements.count('BEGIN IMMEDIATE') == 1
+    assert queue.statements.count('COMMIT') == 1
+
+def test_failing_operation_is_rolled_back_alone(queue):
+    good = queue.submit(_insert, 1)
+    bad = queue.submit(_insert, None)
+    other = queue.submit(_insert, 2)
+    assert good.result(timeout=5) and other.result(timeout=5)
+    with pytest.raises(sqlite3.IntegrityError):
+        bad.result(timeout=5)
+    assert _values(queue.path) == [1, 2]
+
+def test_batches_are_capped(tmp_path):
+    path = str(tmp_path / 'capped.db')
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE items (value INTEGER NOT NULL)")
+    statements = []
+
+    def connect():
+        conn = sqlite3.connect(path, check_same_thread=False)
+        conn.set_trace_callback(statements.append)
+        return conn
+
+    write_queue = WriteQueue(connect, window_ms=50, max_batch=5)
+    try:
+        for future in [write_queue.submit(_insert, n) for n in range(12)]:
+            future.result(timeout=5)
+    finally:
+        write_queue.close()
+    assert statements.count('COMMIT') >= 3
+
+def test_writer_restarts_in_a_forked_child(queue):
+    queue.execute(_insert, 1)
+    parent_thread = queue._thread
+    pid = os.fork()
+    if pid == 0:
+        # The writer thread did not survive the fork; the first write starts one
+        try:
+            queue.execute(_insert, 2)
+            os._exit(0 if queue._thread is not parent_thread and queue._thread.is_alive() else 1)
+        except BaseException:
+            os._exit(2)
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
+    assert _values(queue.path) == [1, 2]
+    assert queue._thread is parent_thread
+
+def test_depth_reports_waiting_operations(queue):
+    started, release = threading.Event(), threading.Event()
+
+    def block(cursor):
+        started.set()
+        release.wait(5)
+
+    blocker = queue.submit(block)
+    assert started.wait(5)
+    waiting = [queue.submit(_insert, n) for n in range(3)]
+    assert queue.depth() == 3
+    release.set()
+    blocker.result(timeout=5)
+    for future in waiting:
+        future.result(timeout=5)
+    assert queue.depth() == 0
@@ -0,0 +1,143 @@
+# write_queue.py
+import os
+import time
+import queue
+import atexit
+import logging
+import threading
+import traceback
+from concurrent.futures import Future
+import query_trace
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+# Funnels SQLite writes through one thread that group-commits them.
+# Operations are callables taking a cursor; each runs inside its own savepoint
+# so a failing operation is rolled back without affecting the rest of its
+# batch. Every caller gets a Future for its own result, and the statements
+# an operation runs are charged to the caller in query_trace.
+class WriteQueue:
+    def __init__(self, connect, window_ms, max_batch):
+        self._connect = connect
+        self._window = window_ms / 1000.0
+        self._max_batch = max_batch
+        self._lock = threading.Lock()
+        self._queue = None
+        self._thread = None
+        self._pid = None
+
+    def start(self):
+        self._ensure_started()
+
+    def submit(self, operation, *args) -> Future:
+        future = Future()
+        self._ensure_started().put((operation, args, future, query_trace.capture()))
+        return future
+
+    def execute(self, operation, *args):
+        return self.submit(operation, *args).result()
+
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def close(self, timeout=5.0):
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                return
+            self._queue.put(_STOP)
+            thread = self._thread
+            self._thread = None
+        thread.join(timeout)
+
+    def _ensure_started(self):
+        # A forked worker inherits the parent's queue object but not its
+        # thread, so the writer is (re)started per process
+        if self._thread is not None and self._pid == os.getpid():
+            return self._queue
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._queue = queue.Queue()
+                self._pid = os.getpid()
+                self._thread = threading.Thread(
+                    target=self._run, args=(self._queue,),
+                    name='sqlite-writer', daemon=True
+                )
+                self._thread.start()
+            return self._queue
+
+    def _run(self, pending):
+        conn = self._connect()
+        conn.isolation_level = None
+        logger.info("SQLite writer thread started")
+        stopping = False
+        while not stopping:
+            item = pending.get()
+            if item is _STOP:
+                break
+
+            batch = [item]
+            deadline = time.monotonic() + self._window
+            while len(batch) < self._max_batch:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = pending.get(timeout=remaining) if remaining > 0 else pending.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            self._commit_batch(conn, batch)
+        conn.close()
+        logger.info("SQLite writer thread stopped")
+
+    def _commit_batch(self, conn, batch):
+        outcomes = []
+        try:
+            cursor = conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            for operation, args, future, caller in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                cursor.execute("SAVEPOINT write_op")
+                try:
+                    with query_trace.attributed(caller):
+                        result = operation(cursor, *args)
+                    cursor.execute("RELEASE write_op")
+                    outcomes.append((future, result, None))
+                except Exception as e:
+                    cursor.execute("ROLLBACK TO write_op")
+                    cursor.execute("RELEASE write_op")
+                    outcomes.append((future, None, e))
+            cursor.execute("COMMIT")
+        except Exception as e:
+            logger.error("Group commit of %s writes failed: %s", len(batch), e)
+            logger.error(traceback.format_exc())
+            if conn.in_transaction:
+                conn.rollback()
+            for _, _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for future, result, error in outcomes:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+        logger.debug("Group committed %s writes", len(batch))
+
+_write_queues = []
+
+def create_write_queue(connect, window_ms, max_batch) -> WriteQueue:
+    write_queue = WriteQueue(connect, window_ms, max_batch)
+    _write_queues.append(write_queue)
+    return write_queue
+
+@atexit.register
+def _flush_write_queues():
+    for write_queue in _write_queues:
+        write_queue.close()
@@ -20,13 +20,15 @@ const PDFViewer = ({
   const [scale, setScale] = useState(1.0);
   const [isLoading, setIsLoading] = useState(true);
   const [error, setError] = useState(null);
+  // Identifies this viewer, so the server can drop renders of pages it has paged past
+  const [viewId] = useState(() => Math.random().toString(36).slice(2));
 
   // Fetch Preview Image
   const fetchPreviewImage = useCallback(async (page = 1, scaleValue = scale) => {
     try {
       setIsLoading(true);
       const response = await fetch(
-        `${previewData.previewUrl}?page=${page - 1}&scale=${scaleValue}`
+        `${previewData.previewUrl}?page=${page - 1}&scale=${scaleValue}&view=${viewId}`
       );
 
       if (!response.ok) {
@@ -41,7 +43,7 @@ const PDFViewer = ({
       setError(err.message);
       setIsLoading(false);
     }
-  }, [previewData]);
+  }, [previewData, viewId]);
 
   // Page Navigation
   const handlePageChange = useCallback((direction) => {
@@ -133,7 +135,7 @@ const PDFViewer = ({
         {/* Preview Image */}
         {!isLoading && !error && (
           <img 
-            src={`${previewData.previewUrl}?page=${currentPage - 1}&scale=${scale}`}
+            src={`${previewData.previewUrl}?page=${currentPage - 1}&scale=${scale}&view=${viewId}`}
             alt={`PDF Preview - Page ${currentPage}`}
             className="w-full h-full object-contain rounded-lg shadow-2xl"
             style={{ maxHeight: '80vh' }}